@@ -1,10 +1,12 @@
-import collisiondetection
-import pathfinder
+import errors
+import planning
+import roadmap
+import snapshot
+import spatialindex
 
 import numpy as np
-import scipy.optimize
 
-from PyQt5 import QtGui, QtWidgets
+from PyQt5 import QtCore, QtGui, QtWidgets
 import logging
 
 
@@ -17,170 +19,169 @@ class BeamstopMover:
 
         self.lg = logging.getLogger("main.absorberfunctions.beamstopmover")
 
+        # calculates the plans. It doesn't know about the gui or the hardware, which are only used to show and execute the plans
+        self.planner = planning.Planner(self.config)
+
+        # the planner runs in a thread of its own when planning is started with start_planning, so the gui and the stop button stay responsive
+        self.planning_worker = PlanningWorker(self.planner)
+        self.planning_thread = QtCore.QThread()
+        self.planning_worker.moveToThread(self.planning_thread)
+        self.planning_worker.progressChanged.connect(self._show_planning_progress)
+        self.planning_worker.partialPlanChanged.connect(self._show_partial_plan)
+        self.planning_thread.start()
+        # beamstop positions the running background planning started from or None if there is none
+        self._planned_beamstops = None
+        self._planning_progress = None
+        self._preview_lines = []
+
     def rearrange_all_beamstops(self):
-        self.lg.info("calulating beamstop assignment")
         handle_positions = self.im_view.handles.get_handle_positions()
+        plan = self.calc_plan(handle_positions)
+        if plan is not None:
+            self.execute_plan(plan)
+
+    def calc_plan(self, handle_positions):
+        """
+        plans the moves to the handle positions while showing a progress dialog with a cancel button
+        :param handle_positions: positions the beamstops should be moved to
+        :returns: planning.Plan or None if the handles can't be reached
+        """
+        progressbar = QtWidgets.QProgressDialog("Calculating Movements...", "Cancel", 0, 0)
+        progressbar.setModal(True)
+        progressbar.setMinimumDuration(50)
 
-        combos, spacing = self.check_spacing(handle_positions)
-        if len(spacing):
-            self.lg.warning("your handles are too close to each other. handle(s)1: %s, handle(s)2: %s, distance(s): %s movement was aborted", combos[0], combos[1], spacing)
+        def show_progress(move, solved_count, move_count):
+            progressbar.setMaximum(move_count)
+            progressbar.setValue(solved_count)
+
+        try:
+            return self.planner.plan(handle_positions,
+                                     self.beamstop_manager.beamstops,
+                                     self.beamstop_manager.beamstop_parked,
+                                     self.beamstop_manager.roadmap,
+                                     progressbar.wasCanceled,
+                                     show_progress)
+        except errors.PlanningError as error:
+            self.lg.warning("%s, movement was aborted", error.message)
+            return None
+        finally:
+            progressbar.setMaximum(1)
+            progressbar.setValue(1)
+
+    def start_planning(self, handle_positions):
+        """
+        starts planning the moves to the handle positions in the planning thread and returns immediately.
+        The paths are shown while they are found. When the planning is done planning_worker emits planFinished with the planning.Plan
+        or planFailed with an error message, which have to be passed on to finish_planning or planning_failed
+        :param handle_positions: positions the beamstops should be moved to
+        """
+        if self._planned_beamstops is not None:
+            self.lg.warning("already planning, ignoring request")
+            return
+        # everything the planner needs is copied, including the roadmap, so nothing it uses changes while it runs
+        state = self.beamstop_manager.snapshot()
+        self._planned_beamstops = state.committed
+        self._planning_progress = QtWidgets.QProgressDialog("Calculating Movements...", "Cancel", 0, 0)
+        # not modal, so the handles can still be moved and the stop button pressed while planning
+        self._planning_progress.setModal(False)
+        self._planning_progress.setMinimumDuration(50)
+        self._planning_progress.canceled.connect(self.cancel_planning)
+        # reset here and not when the worker starts, so a cancel before the worker got to the request isn't lost
+        self.planning_worker.reset_cancel()
+        self.planning_worker.planRequested.emit(np.array(handle_positions, dtype=float).reshape(-1, 2),
+                                                state.committed,
+                                                state.beamstop_parked,
+                                                state.roadmap)
+
+    def cancel_planning(self):
+        """stops the background planning as soon as possible. The plan it returns is marked as cancelled and isn't executed"""
+        if self._planned_beamstops is not None:
+            self.lg.info("cancelling path calculation")
+            self.planning_worker.cancel()
+
+    def shutdown(self):
+        """stops the planning thread and the planning processes. Has to be called before the application exits"""
+        self.planning_worker.cancel()
+        self.planning_thread.quit()
+        self.planning_thread.wait()
+        self.planner.shutdown()
+
+    def _show_planning_progress(self, solved_count, move_count):
+        if self._planning_progress is not None:
+            self._planning_progress.setMaximum(move_count)
+            self._planning_progress.setValue(solved_count)
+
+    def _show_partial_plan(self, solved_moves):
+        for move in solved_moves[len(self._preview_lines):]:
+            self._preview_lines.append(self.im_view.trajectory_lines.add_polyline(move.path))
+
+    def _end_planning(self):
+        """removes the progress dialog and the previewed paths and returns the beamstop positions the planning started from"""
+        for line in self._preview_lines:
+            self.im_view.trajectory_lines.remove_item(line)
+        self._preview_lines = []
+        if self._planning_progress is not None:
+            # disconnect before closing, otherwise closing the dialog counts as a cancel
+            self._planning_progress.canceled.disconnect(self.cancel_planning)
+            self._planning_progress.close()
+            self._planning_progress = None
+        planned_beamstops = self._planned_beamstops
+        self._planned_beamstops = None
+        return planned_beamstops
+
+    def finish_planning(self, plan):
+        """
+        executes the plan of the background planning if the beamstops didn't move in the meantime
+        :param plan: planning.Plan emitted by planning_worker
+        """
+        planned_beamstops = self._end_planning()
+        if planned_beamstops is None or not np.array_equal(planned_beamstops, self.beamstop_manager.beamstops):
+            self.lg.warning("beamstops were moved while the paths were calculated, discarding the plan")
             return
+        self.execute_plan(plan)
 
-        required_moves = self.get_required_moves(handle_positions,
-                                                 self.beamstop_manager.beamstops,
-                                                 self.beamstop_manager.beamstop_parked,
-                                                 self.beamstop_manager.parking_position_occupied)
-        if not required_moves:
+    def planning_failed(self, message):
+        """
+        cleans up after the background planning failed
+        :param message: error message emitted by planning_worker
+        """
+        self._end_planning()
+        self.lg.warning("%s, movement was aborted", message)
+
+    def execute_plan(self, plan):
+        """
+        shows the paths of a plan, asks whether to go on if some moves have no path and moves the beamstops
+        :param plan: planning.Plan for the current beamstop positions
+        """
+        if plan.cancelled:
+            return
+        if not plan.moves and not plan.unsolved_moves:
             self.lg.info("nothing to move")
             return
+        if not plan.moves:
+            self.lg.warning("no solved moves, %d unsolved move(s), aborting movement", len(plan.unsolved_moves))
+            return
 
-        self.lg.info("sorting moves")
-        # sort moves to have consecutive moves close to each other. This sorting might be changed in the next step if required to find a path
-        sorted_moves = self.sort_moves_distance(required_moves)
-
-        self.lg.info("calulating paths")
-        solved_moves, unsolved_moves = self.calc_expected_collisions(sorted_moves)
-        if unsolved_moves:
-            if not solved_moves:
-                self.lg.warning("no solved moves, %d unsolved move(s), aborting movement", len(unsolved_moves))
-                return
-            self.lg.info("%d solved move(s), %d unsolved move(s)", len(solved_moves), len(unsolved_moves))
+        solved_moves = [BeamstopMove(self.beamstop_manager, self.im_view, move.beamstop_nr, move.target_pos, move.path, move.beamstop_pos)
+                         for move in plan.moves]
+        for move in solved_moves:
+            move.add_line()
+        if plan.unsolved_moves:
+            self.lg.info("%d solved move(s), %d unsolved move(s)", len(plan.moves), len(plan.unsolved_moves))
             msg = QtGui.QMessageBox
             answer = msg.question(None,
                                   '',
                                   "Would you like to rearrange the beamstops that have a path?\nNo path could be found \n"
-                                  + " and\n".join("from {} to {}".format(move.beamstop_pos, move.target_pos) for move in unsolved_moves),
+                                  + " and\n".join("from {} to {}".format(move.beamstop_pos, move.target_pos) for move in plan.unsolved_moves),
                                   msg.Yes | msg.No)
             if answer == msg.No:
                 self.lg.debug("user aborted movement because of unsolved moves. removing lines")
                 for move in solved_moves:
                     move.remove_lines()
                 return
+        self.lg.info("moving %d beamstop(s) will take about %.0f s", len(solved_moves), plan.expected_duration)
         self.move_beamstops(solved_moves)
 
-    def check_spacing(self, handle_positions):
-        """checks whether all positions passed in here are more than gripper radius apart. Returns indices of handles too close to each other and the distances within the pairs"""
-        if not len(handle_positions):
-            return [], []
-        distances = calc_vec_len(handle_positions - handle_positions[:, np.newaxis])
-        # get all indices where the handles are at most gripper radius apart
-        close_handles = np.array(np.where(distances <= self.config.PeakAbsorber.beamstop_spacing))
-        # this list contains every distance twice (from a to b and from b to a) and one 0-distance where the element is compared to itself. Remove those.
-        close_handles = close_handles[:,close_handles[0] > close_handles[1]]
-        return close_handles, distances[tuple(close_handles)]
-
-    def get_required_moves(self, handles, beamstops, beamstop_parked, parking_position_occupied):
-        if len(handles) > len(beamstops):
-            self.lg.warning("not enough beamstops available")
-            return []
-
-        if handles.size:
-            self.lg.debug("handles available, calculating assignment to beamstops")
-
-            target_combinations, target_distances = self.calc_beamstop_assignment(beamstops, handles, self.config.PeakAbsorber.beamstop_inactive_cost * beamstop_parked.astype(np.bool_))
-
-            required_moves = [BeamstopMove(self.beamstop_manager, self.im_view, combination[0], handles[combination[1]]) for combination in np.swapaxes(target_combinations, 0, 1)[target_distances > self.config.PeakAbsorber.epsilon]]
-
-            reststops = np.delete(np.arange(beamstops.shape[0]), target_combinations[0])[np.delete(np.logical_not(beamstop_parked), target_combinations[0])]
-        else:
-            self.lg.debug("no handles available")
-            reststops = np.arange(len(beamstops))[np.logical_not(beamstop_parked)]
-            required_moves = []
-
-        if reststops.size:
-            self.lg.debug("unused beamstops available calculating cleanup")
-            free_parking_position_nrs = np.logical_not(parking_position_occupied).nonzero()[0]
-
-            if reststops.size > free_parking_position_nrs.size:
-                self.lg.warning("not enough parking space available: %d reststops but only %d parking spots", reststops.size, free_parking_position_nrs.size)
-                return []
-
-            rest_combinations, _ = self.calc_beamstop_assignment(beamstops[reststops], self.config.ParkingPositions.parking_positions[free_parking_position_nrs])
-            required_moves.extend(BeamstopMove(self.beamstop_manager, self.im_view, reststops[combination[0]], self.config.ParkingPositions.parking_positions[free_parking_position_nrs[combination[1]]]) for combination in np.swapaxes(rest_combinations, 0, 1))
-        return required_moves
-
-    @staticmethod
-    def calc_beamstop_assignment(beamstops, target_positions, penalties=None):
-        """returns combinations of [beamstops, target_positions] and the distances between the two where every pair is chosen so the total distance is as short as possible"""
-        if not beamstops.size or not target_positions.size:
-            return np.array([]), np.array([])
-
-        # calculate distances from all beamstop targets to all beamstops and add penalties for suboptimal beamstops. Penalty list must have length of beamstop list
-        distances = calc_vec_len(target_positions - beamstops[:, np.newaxis])
-        if penalties is not None:
-            penalised_distances = distances + penalties[:, np.newaxis]
-        else:
-            penalised_distances = distances
-        combinations = np.array(scipy.optimize.linear_sum_assignment(penalised_distances))
-        return combinations, distances[tuple(combinations)]
-
-    @staticmethod
-    def sort_moves_distance(moves):
-        """iteratively sorts the moves passed to it in a way so the first move is the one with the startpoint closest to 0,0
-        the second move is the one with the start point closest to the end point of the first move and so on
-        this is a simple way to reduce travel distance without a proper solver for transportation problems"""
-        # to be able to quickly calculate distances between lists of points we unpack to moves into numpy arrays
-        beamstop_positions = [move.beamstop_pos for move in moves]
-        target_positions = [move.target_pos for move in moves]
-        # to keep track which line originally was in which position the last column is just numbered from 0 to n
-        positions = np.swapaxes([beamstop_positions, target_positions, np.swapaxes([np.arange(len(moves)), np.arange(len(moves))], 0, 1)], 0, 1)
-        sorted_positions = np.array([[[0, 0], [0, 0], [0, 0]]])
-        while len(positions):
-            next_closest = np.argmin(calc_vec_len(positions[:, 0]-sorted_positions[-1, 1]))
-            sorted_positions = np.append(sorted_positions, [positions[next_closest]], 0)
-            positions = np.delete(positions, next_closest, 0)
-        # we return the moves in the new order given by the indices in the last column except the first row which was the start point
-        return [moves[x] for x in sorted_positions[1:, 2, 0].astype(int)]
-
-    def calc_expected_collisions(self, moves):
-        """
-        Sorts the moves passed in into one list of unsolvable moves and one list of moves with paths in the order they should be done in. Also adds lines for every solved move
-
-        Simulates the expected constellation of beamstops after every move, then runs collision detection which adds the path if there is one
-        Reruns moves for which path finding failed until they either all have a path or none of the moves in the last iteration could find a path
-        :moves: the moves to find a path for
-        :returns (solved moves: moves with paths in order of execution, unsolved moves: moves for which no path could be found
-        """
-        progressbar = QtWidgets.QProgressDialog("Calculating Movements...", "Cancel", 0, len(moves))
-        progressbar.setModal(True)
-        progressbar.setMinimumDuration(50)
-
-        unsolved_moves = moves.copy()
-        solved_moves = []
-        simulation_beamstops = self.beamstop_manager.beamstops.copy()
-        progress = True
-        while unsolved_moves and progress:
-            progress = False
-            for move in unsolved_moves.copy():
-                if not self.calc_path(move, simulation_beamstops):
-                    continue
-                progress = True
-                unsolved_moves.remove(move)
-                solved_moves.append(move)
-                move.add_line()
-                simulation_beamstops[move.beamstop_nr] = move.target_pos
-                progressbar.setValue(len(solved_moves))
-        progressbar.setValue(len(moves))
-        return solved_moves, unsolved_moves
-
-    def calc_path(self, move, beamstops):
-        """
-        adds a path to use to a move if there is one
-        :param move: move to add path to
-        :param beamstops: beamstops to not collide with
-        :returns: bool whether path was found or not
-        """
-        # calculate beamstop list which excludes the currently driven beamstop and has [x, y, distance_to_current] instead of just [x, y]
-        collision_bs_list = np.append(np.delete(beamstops, move.beamstop_nr, 0), calc_vec_len(np.delete(beamstops, move.beamstop_nr, 0) - move.beamstop_pos)[:, np.newaxis], 1)
-        try:
-            move.path = np.array(collisiondetection.find_path(move.target_pos, move.beamstop_pos, collision_bs_list, self.config.PeakAbsorber.beamstop_spacing, max_multi=30))
-            if np.any([move.path[:, 0] < 0, move.path[:, 1] > 0, move.path[:, 0] > self.config.PeakAbsorber.limits[0], move.path[:, 1] > self.config.PeakAbsorber.limits[1]]):
-                raise collisiondetection.NoSolutionError("point was outside limits")
-        except (collisiondetection.NoSolutionError, ArithmeticError) as error:
-            self.lg.debug("using fallback algorithm because: %s", str(error))
-            move.path = pathfinder.find_path(move.beamstop_pos, move.target_pos, np.delete(beamstops, move.beamstop_nr, 0), self.config.PeakAbsorber.beamstop_spacing, self.config.PeakAbsorber.limits)
-        return move.path is not None
-
     def move_beamstops(self, required_moves):
         # TODO: find best path
         self.lg.debug("working through list of moves")
@@ -200,51 +201,173 @@ class BeamstopMover:
             self.rearrange_all_beamstops()
 
 
+class PlanningWorker(QtCore.QObject):
+    """
+    Runs planning.Planner in a QThread. Live it in the thread with moveToThread, call reset_cancel and emit planRequested to start planning
+
+    The planner checks whether it was cancelled after every node expansion, so cancel() stops the planning within a few ms.
+    """
+    # emit to start planning with the handle positions, beamstops, beamstop_parked and the roadmap like planning.Planner.plan
+    planRequested = QtCore.pyqtSignal(object, object, object, object)
+    # emitted after every solved move with the number of solved moves and the number of moves
+    progressChanged = QtCore.pyqtSignal(int, int)
+    # emitted after every solved move with a tuple of all planning.PlannedMoves solved so far, in the order they will be done in
+    partialPlanChanged = QtCore.pyqtSignal(object)
+    # emitted with the planning.Plan when the planning is done or was cancelled
+    planFinished = QtCore.pyqtSignal(object)
+    # emitted with an error message if the handles can't be reached or the planning failed
+    planFailed = QtCore.pyqtSignal(str)
+
+    def __init__(self, planner):
+        super().__init__()
+        self.planner = planner
+        self.lg = logging.getLogger("main.absorberfunctions.planningworker")
+        self._cancel_requested = False
+        self.planRequested.connect(self.plan)
+
+    def cancel(self):
+        """can be called from any thread"""
+        self._cancel_requested = True
+
+    def reset_cancel(self):
+        """has to be called before emitting planRequested, while the worker doesn't plan"""
+        self._cancel_requested = False
+
+    def is_cancelled(self):
+        return self._cancel_requested
+
+    @QtCore.pyqtSlot(object, object, object, object)
+    def plan(self, handle_positions, beamstops, beamstop_parked, beamstop_roadmap):
+        solved_moves = []
+
+        def report_progress(move, solved_count, move_count):
+            solved_moves.append(move)
+            self.partialPlanChanged.emit(tuple(solved_moves))
+            self.progressChanged.emit(solved_count, move_count)
+
+        try:
+            plan = self.planner.plan(handle_positions, beamstops, beamstop_parked, beamstop_roadmap,
+                                     self.is_cancelled, report_progress)
+        except errors.PlanningError as error:
+            self.planFailed.emit(error.message)
+            return
+        except Exception:
+            # an exception escaping a slot would abort the whole application
+            self.lg.exception("path calculation failed")
+            self.planFailed.emit("path calculation failed")
+            return
+        self.planFinished.emit(plan)
+
+
 class BeamstopManager:
+    # number of beamstops there is room for in the arrays at first. When they are full their capacity is doubled
+    initial_capacity = 64
+
     def __init__(self, config, im_view):
         self.config = config
         self.im_view = im_view
         self.lg = logging.getLogger("main.absorberfunctions.beamstopmanager")
 
-        # these three lists must only ever be modified together.
+        # these three arrays must only ever be modified together.
         # When a beamstop moves the position has to be changed in "beamstops";
         #   if it leaves a parking position the parking position has to be freed in "parking_position_occupied" and the "beamstop_parked" value at the index of the beamstop has to be set to zero;
         #   if it occupies a parking position the "parking_position_occupied" value has to be set to the index of the beamstop+1 and the "beamstop_parked" value has to be set to the index of the parking position+1
+        # The beamstop arrays have room for more beamstops than there are, only the first _beamstop_count entries are used. See the properties
+        self._beamstop_count = 0
         # list of all beamstops where each element is a position as [x, y]
-        self._beamstops = np.empty((0, 2))
+        self._beamstops = np.empty((self.initial_capacity, 2))
         # list of all beamstops where each element is the index+1 of the parking spot that the beamstop uses or 0 if it doesn't use a parking spot
-        self._beamstop_parked = np.empty(0, dtype=np.int)
+        self._beamstop_parked = np.zeros(self.initial_capacity, dtype=int)
         # list of all parking position where each element is the index+1 of the beamspot that currently uses it or 0 if no beamstop uses it
-        self._parking_position_occupied = np.zeros(len(self.config.ParkingPositions.parking_positions), dtype=np.int)
+        self._parking_position_occupied = np.zeros(len(self.config.ParkingPositions.parking_positions), dtype=int)
+        # finds the parking position at a point by only looking at the parking positions around it
+        self._parking_index = spatialindex.ObstacleGrid(self.config.ParkingPositions.parking_positions, self.config.PeakAbsorber.epsilon)
+
+        # every beamstop gets an id that stays the same while it exists. The ids are handed out in increasing order and removing a beamstop
+        # keeps the order of the others, so this list is always sorted and the index of an id can be found with a binary search
+        self._beamstop_ids = np.zeros(self.initial_capacity, dtype=int)
+        self._next_beamstop_id = 0
+        # maps id(circle) of the circle drawn for a beamstop to the id of the beamstop
+        self._circle_beamstop_ids = {}
 
         self.im_view.beamstop_circles.remover = self.remove_beamstop
         self._beamstop_circles = []
 
+        # lane graph over the parking layout and the limits. The beamstops are kept up to date as obstacles on it
+        self.roadmap = roadmap.Roadmap(self.config.PeakAbsorber.limits,
+                                       self.config.ParkingPositions.parking_positions,
+                                       self.config.PeakAbsorber.beamstop_spacing,
+                                       self.config.PeakAbsorber.roadmap_pitch)
+
+    def _reserve(self, count):
+        """makes sure the arrays have room for count beamstops"""
+        capacity = len(self._beamstops)
+        if count <= capacity:
+            return
+        capacity = max(count, 2 * capacity)
+        self.lg.debug("growing beamstop arrays to %d beamstops", capacity)
+        used = self._beamstop_count
+        beamstops = np.empty((capacity, 2))
+        beamstops[:used] = self._beamstops[:used]
+        beamstop_parked = np.zeros(capacity, dtype=int)
+        beamstop_parked[:used] = self._beamstop_parked[:used]
+        beamstop_ids = np.zeros(capacity, dtype=int)
+        beamstop_ids[:used] = self._beamstop_ids[:used]
+        self._beamstops, self._beamstop_parked, self._beamstop_ids = beamstops, beamstop_parked, beamstop_ids
+
+    def find_parking_position(self, pos):
+        """returns the index of the parking position at pos or None if pos isn't on a parking position"""
+        for parking_nr in self._parking_index.query_point(pos, self.config.PeakAbsorber.epsilon):
+            if calc_vec_len(self.config.ParkingPositions.parking_positions[parking_nr] - pos) < self.config.PeakAbsorber.epsilon:
+                return parking_nr
+        return None
+
     def add_beamstops(self, new_positions):
-        parked_beamstops = np.argwhere(calc_vec_len(self.config.ParkingPositions.parking_positions - new_positions[:, np.newaxis]) < self.config.PeakAbsorber.epsilon)
+        new_positions = np.asarray(new_positions, dtype=float).reshape(-1, 2)
+        parking_nrs = [self.find_parking_position(position) for position in new_positions]
+        parked_beamstops = np.array([[beamstop_nr, parking_nr] for beamstop_nr, parking_nr in enumerate(parking_nrs) if parking_nr is not None], dtype=int).reshape(-1, 2)
         if self._parking_position_occupied[parked_beamstops[:, 1]].any():
             self.lg.warning("cannot put beamstop on occupied parking position")
             return None
-        self._parking_position_occupied[parked_beamstops[:, 1]] = self._beamstops.size + parked_beamstops[:, 0] + 1
-        self._beamstop_parked = np.concatenate([self._beamstop_parked, np.zeros(len(new_positions), dtype=np.int)])
-        self._beamstop_parked[parked_beamstops[:, 0] + len(self._beamstops)] = parked_beamstops[:, 1] + 1
-        self._beamstops = np.concatenate([self._beamstops, new_positions])
+        first = self._beamstop_count
+        self._reserve(first + len(new_positions))
+        self._beamstop_count += len(new_positions)
+        self._parking_position_occupied[parked_beamstops[:, 1]] = first + parked_beamstops[:, 0] + 1
+        self._beamstop_parked[first:self._beamstop_count] = 0
+        self._beamstop_parked[first + parked_beamstops[:, 0]] = parked_beamstops[:, 1] + 1
+        self._beamstops[first:self._beamstop_count] = new_positions
+        self._beamstop_ids[first:self._beamstop_count] = np.arange(self._next_beamstop_id, self._next_beamstop_id + len(new_positions))
+        self.roadmap.add_obstacles(new_positions)
 
         for position in new_positions:
-            self._beamstop_circles.append(self.im_view.beamstop_circles.add_circle(position))
+            circle = self.im_view.beamstop_circles.add_circle(position)
+            self._circle_beamstop_ids[id(circle)] = self._next_beamstop_id
+            self._next_beamstop_id += 1
+            self._beamstop_circles.append(circle)
         return len(new_positions)
 
+    def find_beamstop(self, beamstop_circle):
+        """returns the index of the beamstop drawn as beamstop_circle"""
+        beamstop_id = self._circle_beamstop_ids[id(beamstop_circle)]
+        return int(np.searchsorted(self._beamstop_ids[:self._beamstop_count], beamstop_id))
+
     def remove_beamstop(self, beamstop_circle):
         """removes a beamstop from the record.
         This also decrements all indices pointing to elements that were at a higher position in the list that now "fall down" into the space that's freed."""
-        beamstop_nr = self._beamstop_circles.index(beamstop_circle)
+        beamstop_nr = self.find_beamstop(beamstop_circle)
+        del self._circle_beamstop_ids[id(beamstop_circle)]
         parking_nr = self._beamstop_parked[beamstop_nr] - 1
         self._beamstop_circles.pop(beamstop_nr)
-        self._parking_position_occupied[parking_nr] = 0
+        if parking_nr >= 0:
+            self._parking_position_occupied[parking_nr] = 0
         # decrement all indices higher than the indices we had by one
         self._parking_position_occupied[self._parking_position_occupied > beamstop_nr] -= 1
-        self._beamstop_parked = np.delete(self._beamstop_parked, beamstop_nr, axis=0)
-        self._beamstops = np.delete(self._beamstops, beamstop_nr, axis=0)
+        # shift the beamstops behind the removed one down within the arrays instead of reallocating them
+        count = self._beamstop_count
+        for array in (self._beamstops, self._beamstop_parked, self._beamstop_ids):
+            array[beamstop_nr:count - 1] = array[beamstop_nr + 1:count]
+        self._beamstop_count -= 1
+        self.roadmap.remove_obstacle(beamstop_nr)
 
     def _occupy_parking_position(self, parking_nr, beamstop_nr):
         self.lg.debug("occupying parking pos %d with beamstop %d", parking_nr, beamstop_nr)
@@ -266,10 +389,18 @@ class BeamstopManager:
         # first free the parking position if we were on one (don't run occupy first or you'll free the one sou just occupied)
         self._free_parking_position(beamstop_nr)
         # then check if our new position is on a parking position and if so occupy that one
-        new_parking_spot = np.argwhere(calc_vec_len(self.config.ParkingPositions.parking_positions - pos) < self.config.PeakAbsorber.epsilon)
-        if new_parking_spot.size:
+        new_parking_spot = self.find_parking_position(pos)
+        if new_parking_spot is not None:
             self._occupy_parking_position(new_parking_spot, beamstop_nr)
         self.beamstops[beamstop_nr] = pos
+        self.roadmap.move_obstacle(beamstop_nr, pos)
+
+    def snapshot(self):
+        """
+        returns a snapshot.BeamstopSnapshot of the current beamstops, their parking positions and the roadmap, on which moves can be tried out.
+        It has its own copy of the roadmap, so it can be used in another thread while the beamstops are changed here
+        """
+        return snapshot.BeamstopSnapshot(self.config, self.beamstops, self.roadmap.copy(), self.beamstop_parked)
 
     @property
     def parking_position_occupied(self):
@@ -277,11 +408,16 @@ class BeamstopManager:
 
     @property
     def beamstop_parked(self):
-        return self._beamstop_parked
+        return self._beamstop_parked[:self._beamstop_count]
 
     @property
     def beamstops(self):
-        return self._beamstops
+        return self._beamstops[:self._beamstop_count]
+
+    @property
+    def beamstop_ids(self):
+        """ids of the beamstops in the order of beamstops. The id of a beamstop doesn't change when others are added or removed"""
+        return self._beamstop_ids[:self._beamstop_count]
 
     @property
     def beamstop_circles(self):
@@ -289,18 +425,20 @@ class BeamstopManager:
 
 
 class BeamstopMove:
-    def __init__(self, beamstop_manager, im_view, beamstop_nr, target_pos):
+    def __init__(self, beamstop_manager, im_view, beamstop_nr, target_pos, path=None, beamstop_pos=None):
         self.beamstop_nr = beamstop_nr
         self.target_pos = target_pos
         self.beamstop_manager = beamstop_manager
         self.im_view = im_view
 
-        self.beamstop_pos = self.beamstop_manager.beamstops[self.beamstop_nr]
-        self.path = None
+        # a plan can move the same beamstop more than once, e.g. out of the way and back, so the start can be given
+        self.beamstop_pos = self.beamstop_manager.beamstops[self.beamstop_nr] if beamstop_pos is None else beamstop_pos
+        # points to move along, starting at beamstop_pos and ending at target_pos like the path of planning.PlannedMove
+        self.path = path
         self.trajectory_line = None
 
     def add_line(self):
-        self.trajectory_line = self.im_view.trajectory_lines.add_polyline(np.concatenate([[self.beamstop_pos], self.path], axis=0))
+        self.trajectory_line = self.im_view.trajectory_lines.add_polyline(self.path)
 
     def remove_lines(self):
         self.im_view.trajectory_lines.remove_item(self.trajectory_line)
@@ -314,18 +452,6 @@ class BeamstopMove:
             self.remove_lines()
 
 
-class ConfigError(Exception):
-    """Exception raised if a config value isn't within the expected range"""
-    def __init__(self, value, message):
-        """
-        init
-        :param value: name of the value that didn't meet expectations
-        :param message: error message
-        """
-        self.value = value
-        self.message = message
-
-
 # get the length of a vector or list of vectors
 def calc_vec_len(vec):
     vec = np.array(vec)
@@ -30,14 +30,21 @@ class MainWindow(QtWidgets.QMainWindow):
         self.image_view = self.logsplitter.image_view
         self.hardware_buttons = [self.logsplitter.button_bar.re_arrange,
                                  self.logsplitter.button_bar.home,
+                                 self.logsplitter.button_bar.move_randomly,
                                  self.logsplitter.button_bar.save_state,
                                  self.logsplitter.button_bar.pos_viewer.gripper_viewer,
                                  self.logsplitter.button_bar.pos_viewer.go_button]
+        # keeps the hardware buttons disabled from the start of a background planning until its plan was executed or discarded.
+        # This includes move_randomly, which plans synchronously with the same planner and must not run while the planning thread uses it
+        self.planning_disabled_buttons = DisableButtons(self.hardware_buttons)
 
         self.lg.info("initializing absorber control")
         self.absorber_hardware = hardware.PeakAbsorberHardware(config)
         self.beamstop_manager = absorberfunctions.BeamstopManager(config, self.image_view)
-        self.hardware_updater = hardware.MovementUpdater(config, self.absorber_hardware, self.beamstop_manager)
+        if config.PeakAbsorber.use_change_events:
+            self.hardware_updater = hardware.EventMovementUpdater(config, self.absorber_hardware, self.beamstop_manager)
+        else:
+            self.hardware_updater = hardware.MovementUpdater(config, self.absorber_hardware, self.beamstop_manager)
         self.beamstop_mover = absorberfunctions.BeamstopMover(config, self.image_view, self.absorber_hardware, self.beamstop_manager)
         self.file_handler = fileio.FileHandler(config, self.image_view, self, self.beamstop_manager, self.beamstop_mover)
 
@@ -54,6 +61,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.logsplitter.button_bar.save_state.clicked.connect(self.file_handler.save_state_gui)
         self.logsplitter.button_bar.load_state.clicked.connect(self.file_handler.load_state_gui)
         self.logsplitter.button_bar.stop.clicked.connect(self.absorber_hardware.stop)
+        self.logsplitter.button_bar.stop.clicked.connect(self.beamstop_mover.cancel_planning)
         self.logsplitter.button_bar.move_randomly.clicked.connect(self.move_randomly)
 
         self.hardware_updater.posChanged.connect(self.image_view.crosshair.set_crosshair_pos)
@@ -64,14 +72,33 @@ class MainWindow(QtWidgets.QMainWindow):
         self.logsplitter.button_bar.pos_viewer.go_button.clicked.connect(self.move_to_manual)
         self.logsplitter.button_bar.pos_viewer.gripper_viewer.clicked.connect(self.move_gripper_manual)
 
+        self.beamstop_mover.planning_worker.planFinished.connect(self.execute_plan)
+        self.beamstop_mover.planning_worker.planFailed.connect(self.planning_failed)
+
+    def closeEvent(self, event):
+        self.beamstop_mover.shutdown()
+        self.hardware_updater.shutdown()
+        super().closeEvent(event)
+
     def rearrange(self):
-        with DisableButtons(self.hardware_buttons):
+        # the paths are calculated in the background so the gui and the stop button stay responsive, see execute_plan
+        self.planning_disabled_buttons.disable()
+        self.beamstop_mover.start_planning(self.image_view.handles.get_handle_positions())
+
+    def execute_plan(self, plan):
+        try:
             # hardware moves can cause an emergency stop exception which is designed to
             # cascade down to the last function that might automatically start more hardware moves so we catch it here
             try:
-                self.beamstop_mover.rearrange_all_beamstops()
+                self.beamstop_mover.finish_planning(plan)
             except hardware.EmergencyStop:
                 pass
+        finally:
+            self.planning_disabled_buttons.enable()
+
+    def planning_failed(self, message):
+        self.beamstop_mover.planning_failed(message)
+        self.planning_disabled_buttons.enable()
 
     def home(self):
         with DisableButtons(self.hardware_buttons):
@@ -234,10 +261,16 @@ class DisableButtons:
         self.buttons = buttons
 
     def __enter__(self):
+        self.disable()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.enable()
+
+    def disable(self):
         for button in self.buttons:
             button.setEnabled(False)
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
+    def enable(self):
         for button in self.buttons:
             button.setEnabled(True)
 
@@ -0,0 +1,343 @@
+"""
+Assigns the beamstops to the handles and the parking positions in one solve.
+
+Every beamstop is given exactly one target: a handle or a parking position. A beamstop whose target is where it already is doesn't move.
+All handles have to get a beamstop, parking positions are optional, so the beamstops that aren't needed end up parked while parked beamstops
+that aren't needed simply stay. The total cost of all moves is minimized, parked beamstops get a penalty for going to a handle so the active ones
+are used first.
+Only the assignment_neighbours closest handles and parking positions of every beamstop (and closest beamstops of every handle) are considered,
+which makes the cost matrix sparse. If that isn't enough for a valid assignment more neighbours are tried, up to the full dense matrix.
+The result is checked against all other pairs with the reduced costs of the matching, and pairs that could make it cheaper are added until none are left,
+so the assignment is always the cheapest one.
+When only a few handles or beamstops changed since the last assignment the unchanged pairs are kept and only the rest is solved again,
+unless the check finds a cheaper assignment.
+Optionally every pair also gets a cost for the beamstops estimated to be in the way of the straight move, see ObstructionMap.
+"""
+import logging
+
+import numpy as np
+import scipy.optimize
+import scipy.sparse
+import scipy.sparse.csgraph
+import scipy.spatial
+
+
+class AssignmentEngine:
+    def __init__(self, config, cost_model=None):
+        """
+        :param config: config with PeakAbsorber and ParkingPositions
+        :param cost_model: kinematics.MotionModel to minimize the duration of the moves instead of their distance
+        """
+        self.config = config
+        self.cost_model = cost_model
+        self.lg = logging.getLogger("main.assignment.assignmentengine")
+        self.parking_positions = np.asarray(self.config.ParkingPositions.parking_positions, dtype=float).reshape(-1, 2)
+        # (beamstops, targets, handles) of the last assignment, which the next one is warm started from
+        self._previous = None
+        # ObstructionMap over the beamstops of the running assignment if obstructions are part of the costs
+        self._obstruction_map = None
+
+    def assign(self, handles, beamstops, beamstop_parked):
+        """
+        finds the target of every beamstop
+        :param handles: positions that need a beamstop. Format [[x, y], [x, y], ...]
+        :param beamstops: positions of all beamstops
+        :param beamstop_parked: index+1 of the parking position of every beamstop or 0, see BeamstopManager
+        :return: array with the target position of every beamstop, which is its own position if it doesn't have to move
+        :raises ValueError: if there are more handles than beamstops or not enough parking positions for the beamstops that aren't needed
+        """
+        handles = np.asarray(handles, dtype=float).reshape(-1, 2)
+        beamstops = np.asarray(beamstops, dtype=float).reshape(-1, 2)
+        if len(handles) > len(beamstops):
+            raise ValueError("not enough beamstops available: {} handles but only {} beamstops".format(len(handles), len(beamstops)))
+        if len(beamstops) - len(handles) > len(self.parking_positions):
+            raise ValueError("not enough parking space available: {} beamstops are left over but there are only {} parking spots"
+                             .format(len(beamstops) - len(handles), len(self.parking_positions)))
+        if not len(beamstops):
+            return beamstops.copy()
+        penalties = self.config.PeakAbsorber.beamstop_inactive_cost * np.asarray(beamstop_parked).astype(np.bool_)
+        if self.cost_model is not None:
+            penalties = self.cost_model.distance_times(penalties, "beamstop")
+        self._obstruction_map = None
+        if self.config.PeakAbsorber.assignment_obstruction_cost:
+            self._obstruction_map = ObstructionMap(beamstops, self.config.PeakAbsorber.beamstop_spacing, self.config.PeakAbsorber.limits)
+        column_positions = np.concatenate([handles, self.parking_positions])
+
+        columns = self._warm_start_columns(handles, beamstops)
+        free_rows = np.nonzero(columns < 0)[0]
+        self.lg.debug("warm start keeps the targets of %d of %d beamstops", len(beamstops) - len(free_rows), len(beamstops))
+        if len(free_rows):
+            free_columns = np.setdiff1d(np.arange(len(column_positions)), columns[columns >= 0])
+            free_handle_columns = free_columns[free_columns < len(handles)]
+            free_parking_columns = free_columns[free_columns >= len(handles)]
+            sub_columns = self.solve(beamstops[free_rows], penalties[free_rows], column_positions[free_handle_columns], column_positions[free_parking_columns])
+            columns[free_rows] = np.concatenate([free_handle_columns, free_parking_columns])[sub_columns]
+        if len(free_rows) < len(beamstops) and not self.is_optimal(beamstops, penalties, handles, self.parking_positions, columns):
+            # a change can make it cheaper to give beamstops further away other targets, too
+            self.lg.debug("the warm start can be improved, assigning all beamstops again")
+            columns = self.solve(beamstops, penalties, handles, self.parking_positions)
+
+        targets = column_positions[columns]
+        self._previous = (beamstops.copy(), targets.copy(), handles.copy())
+        return targets
+
+    def pair_costs(self, beamstops, targets, penalties=None):
+        """
+        costs of moving beamstops to targets, element by element with broadcasting.
+        During assign this includes the cost of the beamstops in the way if assignment_obstruction_cost is set
+        :param beamstops: positions of the beamstops, shape (..., 2)
+        :param targets: positions of the targets, shape (..., 2)
+        :param penalties: cost added for every beamstop or None
+        """
+        if self.cost_model is None:
+            costs = np.linalg.norm(targets - beamstops, axis=-1)
+        else:
+            costs = self.cost_model.segment_times(beamstops, targets, "beamstop")
+        if penalties is not None:
+            costs = costs + penalties
+        if self._obstruction_map is not None:
+            obstruction_costs = self.config.PeakAbsorber.assignment_obstruction_cost * self._obstruction_map.count(beamstops, targets)
+            if self.cost_model is not None:
+                obstruction_costs = self.cost_model.distance_times(obstruction_costs, "beamstop")
+            costs = costs + obstruction_costs
+        return costs
+
+    def solve(self, beamstops, penalties, handles, parking_positions):
+        """
+        assigns every beamstop to a handle or a parking position so that every handle gets a beamstop and the total cost is minimal
+        :param beamstops: positions of the beamstops to assign
+        :param penalties: cost for every beamstop that is added when it goes to a handle
+        :param handles: positions of the handles
+        :param parking_positions: positions of the parking positions that can be used
+        :return: array with the column of every beamstop, where the handles are the columns 0 to len(handles)-1 and the parking positions the rest
+        """
+        column_count = len(handles) + len(parking_positions)
+        costs = self._all_matching_costs(beamstops, penalties, handles, parking_positions)
+        neighbours = self.config.PeakAbsorber.assignment_neighbours
+        pairs = np.empty(0, dtype=int)
+        while neighbours < max(len(handles), len(parking_positions), len(beamstops)):
+            rows, columns = self._candidate_pairs(beamstops, handles, parking_positions, penalties, neighbours)
+            pairs = np.union1d(pairs, rows * column_count + columns)
+            while True:
+                rows, columns = pairs // column_count, pairs % column_count
+                matrix = scipy.sparse.csr_matrix((costs[rows, columns], (rows, columns)), shape=costs.shape)
+                try:
+                    matched_rows, matched_columns = scipy.sparse.csgraph.min_weight_full_bipartite_matching(matrix)
+                except ValueError:
+                    break
+                if len(matched_rows) < len(beamstops) or np.count_nonzero(matched_columns < len(handles)) < len(handles):
+                    break
+                assigned_columns = np.empty(len(beamstops), dtype=int)
+                assigned_columns[matched_rows] = matched_columns
+                # the matching is only the best one of the candidate pairs, pairs outside of them can still make it cheaper
+                reduced_costs = _reduced_costs(costs, rows, columns, assigned_columns)
+                if reduced_costs is None:
+                    break
+                if not reduced_costs.any():
+                    return assigned_columns
+                self.lg.debug("%d pair(s) outside of the %d neighbours can improve the assignment", np.count_nonzero(reduced_costs), neighbours)
+                # only the most promising pair of every beamstop and target is added, so the matrix stays sparse
+                improving_rows = np.nonzero(reduced_costs.min(axis=1))[0]
+                improving_columns = np.nonzero(reduced_costs.min(axis=0))[0]
+                pairs = np.union1d(pairs, np.concatenate([improving_rows * column_count + reduced_costs[improving_rows].argmin(axis=1),
+                                                          reduced_costs[:, improving_columns].argmin(axis=0) * column_count + improving_columns]))
+            self.lg.debug("no valid assignment with %d neighbours, trying more", neighbours)
+            neighbours *= 2
+
+        matched_rows, matched_columns = scipy.optimize.linear_sum_assignment(costs)
+        assigned_columns = np.empty(len(beamstops), dtype=int)
+        assigned_columns[matched_rows] = matched_columns
+        return assigned_columns
+
+    def is_optimal(self, beamstops, penalties, handles, parking_positions, assigned_columns):
+        """
+        checks whether an assignment, e.g. one that kept the targets of the last assignment, is as cheap as the one solve would find.
+        Parameters as for solve, assigned_columns is an assignment in the format solve returns
+        """
+        costs = self._all_matching_costs(beamstops, penalties, handles, parking_positions)
+        rows, columns = self._candidate_pairs(beamstops, handles, parking_positions, penalties, self.config.PeakAbsorber.assignment_neighbours)
+        reduced_costs = _reduced_costs(costs, np.concatenate([rows, np.arange(len(beamstops))]), np.concatenate([columns, assigned_columns]), assigned_columns)
+        return reduced_costs is not None and not reduced_costs.any()
+
+    def _all_matching_costs(self, beamstops, penalties, handles, parking_positions):
+        """matching costs of all pairs of beamstops and columns as a matrix with a row for every beamstop, see solve"""
+        column_positions = np.concatenate([handles, parking_positions])
+        is_handle = np.arange(len(column_positions)) < len(handles)
+        return self._matching_costs(beamstops[:, np.newaxis], column_positions, np.where(is_handle, penalties[:, np.newaxis], 0), is_handle, len(beamstops))
+
+    def _matching_costs(self, beamstops, targets, penalties, is_handle, beamstop_count):
+        """
+        edge weights of the matching. Parking positions get a surcharge that is larger than any possible saving from leaving a handle empty,
+        so the cheapest full matching always fills all handles. All weights are at least 1, because the sparse matching ignores zero weights
+        """
+        costs = self.pair_costs(beamstops, targets, penalties) + 1
+        parking_surcharge = 2 * (beamstop_count + 1) * (np.max(costs, initial=0) + 1)
+        return np.where(is_handle, costs, costs + parking_surcharge)
+
+    def _candidate_pairs(self, beamstops, handles, parking_positions, penalties, neighbours):
+        """the pairs of (beamstop, column) in the sparse cost matrix: the closest handles and parking positions of every beamstop and the closest beamstops of every handle"""
+        rows = []
+        columns = []
+        if len(handles):
+            closest_handles = _query(scipy.spatial.cKDTree(handles), beamstops, neighbours)
+            rows.append(np.repeat(np.arange(len(beamstops)), closest_handles.shape[1]))
+            columns.append(closest_handles.ravel())
+            # parked beamstops have a penalty, so the closest beamstops of both kinds are considered for every handle
+            for group in np.unique(penalties):
+                group_rows = np.nonzero(penalties == group)[0]
+                closest_beamstops = _query(scipy.spatial.cKDTree(beamstops[group_rows]), handles, neighbours)
+                rows.append(group_rows[closest_beamstops].ravel())
+                columns.append(np.repeat(np.arange(len(handles)), closest_beamstops.shape[1]))
+        if len(parking_positions):
+            closest_parking = _query(scipy.spatial.cKDTree(parking_positions), beamstops, neighbours)
+            rows.append(np.repeat(np.arange(len(beamstops)), closest_parking.shape[1]))
+            columns.append(len(handles) + closest_parking.ravel())
+        pairs = np.unique(np.concatenate(rows) * (len(handles) + len(parking_positions)) + np.concatenate(columns))
+        return pairs // (len(handles) + len(parking_positions)), pairs % (len(handles) + len(parking_positions))
+
+    def _warm_start_columns(self, handles, beamstops):
+        """
+        columns of the previous assignment that can be kept, or -1 for the beamstops that have to be assigned again. A beamstop keeps its
+        previous target if it didn't move other than to that target, the target is still a handle or parking position and nothing changed close by
+        :return: array with a column for every beamstop, see solve
+        """
+        unassigned = np.full(len(beamstops), -1)
+        if self._previous is None or len(self._previous[0]) != len(beamstops):
+            return unassigned
+        previous_beamstops, previous_targets, previous_handles = self._previous
+        epsilon = self.config.PeakAbsorber.epsilon
+        column_positions = np.concatenate([handles, self.parking_positions])
+        unchanged = ((np.linalg.norm(beamstops - previous_beamstops, axis=1) < epsilon)
+                     | (np.linalg.norm(beamstops - previous_targets, axis=1) < epsilon))
+        distances, columns = scipy.spatial.cKDTree(column_positions).query(previous_targets)
+        columns[~unchanged | (distances >= epsilon)] = -1
+        # two handles closer than epsilon could map two beamstops to the same column
+        kept_columns, counts = np.unique(columns[columns >= 0], return_counts=True)
+        columns[np.isin(columns, kept_columns[counts > 1])] = -1
+
+        changed_positions = np.concatenate([beamstops[~unchanged],
+                                            _unmatched(handles, previous_handles, epsilon),
+                                            _unmatched(previous_handles, handles, epsilon)])
+        if len(changed_positions):
+            # everything close to a change is assigned again, so the new assignment can swap targets around it
+            neighbours = self.config.PeakAbsorber.assignment_neighbours
+            columns[_query(scipy.spatial.cKDTree(beamstops), changed_positions, neighbours).ravel()] = -1
+            close_columns = _query(scipy.spatial.cKDTree(column_positions), changed_positions, neighbours).ravel()
+            columns[np.isin(columns, close_columns)] = -1
+
+        # a warm start only pays off if most of the assignment is kept
+        if np.count_nonzero(columns >= 0) < len(beamstops) / 2:
+            return unassigned
+        return columns
+
+
+class ObstructionMap:
+    """
+    Estimates how many beamstops are within the spacing of straight lines, for many lines at once
+
+    A grid with cells of half the spacing counts for every cell how many beamstops are within the spacing of its center. Integrating these counts
+    along a line gives the total length of the line inside the circles around the beamstops. Divided by the average length of a line through
+    such a circle this estimates the number of beamstops in the way. The moved beamstop itself is counted too, which adds about the same to all
+    targets of a beamstop and so doesn't change the assignment.
+    """
+    # lines are checked in chunks of this many, so the sample points of all lines don't need to fit into memory at once
+    chunk_size = 4096
+
+    def __init__(self, obstacles, spacing, limits):
+        """
+        :param obstacles: positions of the beamstops in the format [[x, y], [x, y], ...]
+        :param spacing: distance from a line within which a beamstop is in the way
+        :param limits: size of the area [x, y]. Obstacles and lines outside of it are clipped to it
+        """
+        self.spacing = spacing
+        self.cell_size = spacing / 2
+        self.counts = np.zeros(np.ceil(np.asarray(limits, dtype=float) / self.cell_size).astype(int) + 1)
+        reach = int(np.ceil(spacing / self.cell_size))
+        offsets = np.stack(np.meshgrid(np.arange(-reach, reach + 1), np.arange(-reach, reach + 1), indexing="ij"), axis=-1).reshape(-1, 2)
+        cells = (np.round(np.asarray(obstacles, dtype=float).reshape(-1, 2) / self.cell_size).astype(int)[:, np.newaxis] + offsets).reshape(-1, 2)
+        centers = np.repeat(np.asarray(obstacles, dtype=float).reshape(-1, 2), len(offsets), axis=0)
+        inside = np.linalg.norm(cells * self.cell_size - centers, axis=1) <= spacing
+        inside &= np.all((cells >= 0) & (cells < self.counts.shape), axis=1)
+        np.add.at(self.counts, tuple(cells[inside].T), 1)
+
+    def count(self, starts, ends):
+        """
+        estimated number of beamstops within the spacing of the lines from starts to ends, element by element with broadcasting
+        :param starts: start points, shape (..., 2)
+        :param ends: end points, shape (..., 2)
+        :return: array of the broadcast shape without the last axis
+        """
+        starts, ends = np.broadcast_arrays(np.asarray(starts, dtype=float), np.asarray(ends, dtype=float))
+        shape = starts.shape[:-1]
+        starts = starts.reshape(-1, 2)
+        ends = ends.reshape(-1, 2)
+        lengths = np.linalg.norm(ends - starts, axis=1)
+        sample_count = int(np.ceil(np.max(lengths, initial=0) / self.cell_size)) + 1
+        fractions = np.linspace(0, 1, sample_count)[:, np.newaxis]
+        sums = np.empty(len(starts))
+        for chunk in range(0, len(starts), self.chunk_size):
+            chunk_starts = starts[chunk:chunk + self.chunk_size, np.newaxis]
+            samples = chunk_starts + fractions * (ends[chunk:chunk + self.chunk_size, np.newaxis] - chunk_starts)
+            cells = np.clip(np.round(samples / self.cell_size).astype(int), 0, np.array(self.counts.shape) - 1)
+            sums[chunk:chunk + self.chunk_size] = self.counts[cells[..., 0], cells[..., 1]].sum(axis=1)
+        # the samples are spaced evenly, the average length of a line through a circle of radius spacing is pi / 2 * spacing
+        obstruction_lengths = sums * lengths / sample_count
+        return (obstruction_lengths / (np.pi / 2 * self.spacing)).reshape(shape)
+
+
+def _reduced_costs(costs, rows, columns, assigned_columns):
+    """
+    finds the pairs of beamstop and target that could make an assignment cheaper
+
+    The potentials of the rows and columns are the shortest distances in the residual graph of the assignment, which contains the given pairs
+    (rows, columns) and the assigned pairs backwards with negative cost. Unused columns lead to a sink, from which all used columns can be reached.
+    If the residual graph has no negative cycle the assignment is the cheapest one of the given pairs, and it is the cheapest one of all pairs
+    if no pair has a negative cost after subtracting the potentials (reduced cost).
+    :param costs: matrix with the costs of all pairs, a row for every beamstop and a column for every target
+    :param rows: rows of the pairs the potentials are calculated from
+    :param columns: columns of the pairs the potentials are calculated from
+    :param assigned_columns: column of every row in the assignment
+    :return: matrix with the negative reduced costs and zero for all other pairs or None if the assignment isn't the cheapest one of the given pairs
+    """
+    row_count, column_count = costs.shape
+    sink = row_count + column_count
+    assigned = assigned_columns[rows] == columns
+    used = np.zeros(column_count, dtype=bool)
+    used[assigned_columns] = True
+    tails = np.concatenate([rows[~assigned], row_count + columns[assigned], row_count + np.nonzero(~used)[0], np.full(np.count_nonzero(used), sink)])
+    heads = np.concatenate([row_count + columns[~assigned], rows[assigned], np.full(np.count_nonzero(~used), sink), row_count + np.nonzero(used)[0]])
+    weights = np.concatenate([costs[rows[~assigned], columns[~assigned]], -costs[rows[assigned], columns[assigned]], np.zeros(column_count)])
+    # differences this small are rounding errors of the sums of costs
+    tolerance = 1e-9 * np.max(np.abs(costs), initial=1)
+    # Bellman-Ford from a virtual node with an edge to every node. The edges are sorted by their heads to relax all edges of a node at once
+    order = np.argsort(heads, kind="stable")
+    heads, tails, weights = heads[order], tails[order], weights[order]
+    first_edges = np.flatnonzero(np.concatenate([[True], heads[1:] != heads[:-1]]))
+    potentials = np.zeros(sink + 1)
+    for _ in range(sink + 1):
+        relaxed = potentials.copy()
+        relaxed[heads[first_edges]] = np.minimum(potentials[heads[first_edges]], np.minimum.reduceat(potentials[tails] + weights, first_edges))
+        shorter = relaxed < potentials - tolerance
+        if not shorter.any():
+            break
+        potentials[shorter] = relaxed[shorter]
+    else:
+        return None
+    reduced_costs = costs + potentials[:row_count, np.newaxis] - potentials[row_count:sink]
+    reduced_costs[(reduced_costs >= -2 * tolerance) | (np.arange(column_count) == assigned_columns[:, np.newaxis])] = 0
+    return reduced_costs
+
+
+def _query(tree, points, neighbours):
+    """indices of the closest points in the tree for every point as an array of shape (len(points), min(neighbours, tree size))"""
+    neighbours = min(neighbours, tree.n)
+    _, indices = tree.query(points, k=neighbours)
+    return np.asarray(indices).reshape(len(points), neighbours)
+
+
+def _unmatched(points, others, epsilon):
+    """the points that don't have any of the other points closer than epsilon"""
+    if not len(points) or not len(others):
+        return points
+    distances, _ = scipy.spatial.cKDTree(others).query(points)
+    return points[distances >= epsilon]
@@ -0,0 +1,332 @@
+"""
+Benchmarks for the path planning that run without the gui or any hardware.
+
+Run "python benchmark.py" to print the time one path query takes for increasing numbers of obstacles,
+the path lengths and waypoint counts of the different pathfinder modes and the time every stage of a rearrangement takes
+for the shipped .pabs layouts and for generated layouts with up to 1000 beamstops.
+With "--output results.json" all results are also written to a json file, which can be compared between versions.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+import types
+
+import numpy as np
+
+import absorberfunctions
+import budget
+import collisiondetection
+import config
+import kinematics
+import pathfinder
+import planning
+import scheduling
+import sequencing
+import spatialindex
+import testconfig
+
+
+class HeadlessImageView:
+    """Stands in for the ImageView of the gui, so BeamstopManager can be used without a display"""
+    def __init__(self):
+        self.beamstop_circles = HeadlessItemGroup()
+        self.trajectory_lines = HeadlessItemGroup()
+        self.handles = HeadlessHandles()
+
+
+class HeadlessItemGroup:
+    """keeps track of the number of items that would be shown"""
+    def __init__(self):
+        self.items = []
+        self.remover = None
+
+    def add_circle(self, position):
+        self.items.append(position)
+        return self.items[-1]
+
+    def add_polyline(self, points):
+        self.items.append(points)
+        return self.items[-1]
+
+    def remove_item(self, item):
+        self.items = [other for other in self.items if other is not item]
+
+
+class HeadlessHandles:
+    def __init__(self, positions=()):
+        self.positions = np.array(positions, dtype=float).reshape(-1, 2)
+
+    def get_handle_positions(self):
+        return self.positions
+
+
+def random_layout(count, limits, spacing, rng, max_tries=100000, origin=(0, 0)):
+    """
+    Generates random positions inside the limits which are all more than spacing apart from each other
+
+    :param count: number of positions to generate
+    :param limits: upper limits of the positions as [max_x, max_y]
+    :param spacing: minimum distance between any two positions
+    :param rng: numpy random generator to draw the positions from
+    :param max_tries: number of random positions after which we give up on getting "count" positions
+    :param origin: lower limits of the positions as [min_x, min_y]
+    :return: positions in the format [[x, y], [x, y], ...]. This can contain less than "count" positions if the limits are too crowded
+    """
+    positions = np.empty((0, 2))
+    origin = np.asarray(origin, dtype=float)
+    for _ in range(max_tries):
+        if len(positions) >= count:
+            break
+        candidate = origin + rng.random(2) * (np.asarray(limits) - origin)
+        if not len(positions) or np.min(np.sum((positions - candidate) ** 2, axis=1)) > spacing ** 2:
+            positions = np.append(positions, [candidate], axis=0)
+    return positions
+
+
+def bench_pathfinder_scaling(obstacle_counts=(10, 20, 40, 80, 120), repetitions=5, seed=0):
+    """
+    Times pathfinder.find_path between two random points for random layouts with increasing numbers of obstacles
+
+    :return: list with one dictionary for each obstacle count
+    """
+    rng = np.random.default_rng(seed)
+    limits = config.PeakAbsorber.limits
+    spacing = config.PeakAbsorber.beamstop_spacing
+    results = []
+    for obstacle_count in obstacle_counts:
+        durations = []
+        found = 0
+        for _ in range(repetitions):
+            # the first two positions are used as start and end so they are guaranteed to be free
+            positions = random_layout(obstacle_count + 2, limits, spacing, rng)
+            start_time = time.perf_counter()
+            path = pathfinder.find_path(positions[0], positions[1], positions[2:], spacing, limits)
+            durations.append(time.perf_counter() - start_time)
+            found += path is not None
+        results.append({"benchmark": "pathfinder.find_path",
+                        "obstacles": obstacle_count,
+                        "repetitions": repetitions,
+                        "paths_found": found,
+                        "mean_s": float(np.mean(durations)),
+                        "max_s": float(np.max(durations))})
+    return results
+
+
+def bench_pathfinder_modes(polygon_orders=(0, 8, 12), obstacle_counts=(20, 60, 100), repetitions=5, seed=0):
+    """
+    Compares the square corners of pathfinder.find_path with polygons of different orders on the same random layouts.
+    The paths are shortcut like planning.find_move_path does it. Every waypoint is a full stop of the motors, so the paths are compared
+    by their estimated move time and not only by their length
+
+    :return: list with one dictionary for each combination of obstacle count and polygon order with the summed path length, waypoint count
+     and move time over all layouts
+    """
+    rng = np.random.default_rng(seed)
+    limits = config.PeakAbsorber.limits
+    spacing = config.PeakAbsorber.beamstop_spacing
+    motion_model = kinematics.MotionModel(config)
+    results = []
+    for obstacle_count in obstacle_counts:
+        layouts = [random_layout(obstacle_count + 2, limits, spacing, rng) for _ in range(repetitions)]
+        for polygon_order in polygon_orders:
+            duration = path_length = move_time = 0
+            waypoints = found = 0
+            for positions in layouts:
+                start_time = time.perf_counter()
+                path = pathfinder.find_path(positions[0], positions[1], positions[2:], spacing, limits, polygon_order=polygon_order)
+                if path is not None:
+                    path = np.array(pathfinder.shortcut_path(path, positions[2:], spacing, limits))
+                duration += time.perf_counter() - start_time
+                if path is None:
+                    continue
+                found += 1
+                # start and end are not counted as waypoints
+                waypoints += len(path) - 2
+                path_length += float(np.sum(np.linalg.norm(np.diff(path, axis=0), axis=1)))
+                move_time += motion_model.path_time(path)
+            results.append({"benchmark": "pathfinder.find_path polygon_order={}".format(polygon_order),
+                            "obstacles": obstacle_count,
+                            "repetitions": repetitions,
+                            "paths_found": found,
+                            "total_length_mm": path_length,
+                            "waypoints": waypoints,
+                            "move_time_s": move_time,
+                            "total_s": duration})
+    return results
+
+
+def load_layout(filename):
+    """returns the beamstop positions from a .pabs file as saved by fileio.FileHandler"""
+    with open(filename) as input_file:
+        return np.array([beamstop["position"] for beamstop in json.load(input_file)["beamstops"]], dtype=float)
+
+
+def generated_config(base_config, beamstop_count, area_per_beamstop=1500):
+    """
+    returns a copy of base_config where the limits are increased so beamstop_count beamstops have about area_per_beamstop mm^2 each.
+    The limits are never made smaller than the ones of base_config
+    """
+    side = np.sqrt(beamstop_count * area_per_beamstop)
+    peak_absorber = type("PeakAbsorber", (base_config.PeakAbsorber, ), {"limits": np.maximum(base_config.PeakAbsorber.limits, [side, side])})
+    return types.SimpleNamespace(PeakAbsorber=peak_absorber, ParkingPositions=base_config.ParkingPositions, Detector=base_config.Detector, Gui=base_config.Gui)
+
+
+def planning_scenarios(sizes=(10, 30, 100, 300, 1000), handle_count=25, seed=0):
+    """
+    yields (name, config, beamstop positions, handle positions) for the shipped layouts and for generated layouts
+
+    The shipped layouts have all beamstops parked and get handle_count random handles on the detector.
+    The generated layouts have the given numbers of beamstops at random positions and just as many random handles, so every beamstop has to move
+    """
+    rng = np.random.default_rng(seed)
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for filename, layout_config in (("RealParkingPopulated.pabs", config), ("every_2nd_parking_spot.pabs", testconfig)):
+        beamstops = load_layout(os.path.join(directory, filename))
+        detector_end = np.minimum(layout_config.Detector.detector_origin + layout_config.Detector.active_area, layout_config.PeakAbsorber.limits)
+        handles = random_layout(min(handle_count, len(beamstops)), detector_end, layout_config.PeakAbsorber.beamstop_spacing, rng,
+                                origin=np.maximum(layout_config.Detector.detector_origin, 0))
+        yield filename, layout_config, beamstops, handles
+    for size in sizes:
+        layout_config = generated_config(config, size)
+        beamstops = random_layout(size, layout_config.PeakAbsorber.limits, layout_config.PeakAbsorber.beamstop_spacing, rng)
+        handles = random_layout(size, layout_config.PeakAbsorber.limits, layout_config.PeakAbsorber.beamstop_spacing, rng)
+        yield "generated {}".format(size), layout_config, beamstops, handles
+
+
+def _timed(function, *args):
+    start_time = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start_time
+
+
+def bench_planning_stack(sizes=(10, 30, 100, 300, 1000), handle_count=25, planner_samples=50, seed=0):
+    """
+    Times every stage of planning.Planner.plan and every planner on its own for the scenarios of planning_scenarios
+
+    The planners are timed for up to planner_samples of the sorted moves against the beamstop positions before any move.
+    :return: list with one dictionary for each scenario with the durations of the stages in seconds and the results of the planners
+    """
+    results = []
+    for name, layout_config, beamstops, handles in planning_scenarios(sizes, handle_count, seed):
+        result = {"benchmark": "planning stack", "scenario": name, "beamstops": len(beamstops), "handles": len(handles)}
+        image_view = HeadlessImageView()
+        image_view.handles.positions = handles
+        beamstop_manager, result["setup_s"] = _timed(absorberfunctions.BeamstopManager, layout_config, image_view)
+        _, duration = _timed(beamstop_manager.add_beamstops, beamstops)
+        result["setup_s"] += duration
+        planner = planning.Planner(layout_config)
+
+        _, result["check_spacing_s"] = _timed(planner.check_spacing, handles)
+        moves, result["get_required_moves_s"] = _timed(planner.get_required_moves, handles, beamstop_manager.beamstops, beamstop_manager.beamstop_parked)
+        spacing = layout_config.PeakAbsorber.beamstop_spacing
+        sorted_moves, result["sequence_moves_s"] = _timed(sequencing.sequence_moves, moves, spacing, planner.cost_model,
+                                                          budget.SearchBudget(timeout_ms=layout_config.PeakAbsorber.sequencing_timeout_ms))
+        result["moves"] = len(sorted_moves)
+        # empty travel between the moves of the nearest neighbour order the sequencing starts with and of the improved order
+        result["nearest_neighbour_travel"] = 0.
+        result["sequenced_travel"] = 0.
+        if moves:
+            costs = sequencing.travel_costs(moves, planner.cost_model)
+            result["nearest_neighbour_travel"] = sequencing.tour_cost(sequencing.nearest_neighbour_order(costs, *sequencing.find_precedences(moves, spacing)), costs)
+            result["sequenced_travel"] = sequencing.tour_cost(np.arange(len(sorted_moves)), sequencing.travel_costs(sorted_moves, planner.cost_model))
+        schedule, result["schedule_moves_s"] = _timed(scheduling.schedule_moves, sorted_moves, spacing)
+        sorted_moves = schedule.moves
+        result["cycles"] = len(schedule.cycles)
+
+        result["planners"] = bench_planners(layout_config, beamstop_manager, sorted_moves[:planner_samples])
+
+        (solved_moves, unsolved_moves, _), result["calc_expected_collisions_s"] = _timed(planner.calc_expected_collisions, sorted_moves,
+                                                                                         beamstop_manager.beamstops, beamstop_manager.roadmap)
+        result["solved_moves"] = len(solved_moves)
+        result["unsolved_moves"] = len(unsolved_moves)
+        # start and end are not counted as waypoints
+        result["waypoints"] = sum(len(move.path) - 2 for move in solved_moves)
+        results.append(result)
+    return results
+
+
+def bench_planners(layout_config, beamstop_manager, moves):
+    """
+    times the greedy bypass algorithm, the roadmap and the pathfinder separately for every move against the current beamstop positions.
+    The roadmap and the pathfinder get the same budget per move as in planning.Planner.calc_expected_collisions, otherwise a single move without a path
+    can keep the pathfinder busy for a very long time
+    """
+    spacing = layout_config.PeakAbsorber.beamstop_spacing
+    limits = layout_config.PeakAbsorber.limits
+    durations = {"collisiondetection": [], "roadmap": [], "pathfinder": []}
+    found = {planner: 0 for planner in durations}
+    for move in moves:
+        obstacles = np.delete(beamstop_manager.beamstops, move.beamstop_nr, 0)
+        collision_bs_list = np.append(obstacles, np.linalg.norm(obstacles - move.beamstop_pos, axis=1)[:, np.newaxis], 1)
+        start_time = time.perf_counter()
+        try:
+            collisiondetection.find_path(move.target_pos, move.beamstop_pos, collision_bs_list, spacing, max_multi=30)
+            found["collisiondetection"] += 1
+        except (collisiondetection.NoSolutionError, ArithmeticError):
+            pass
+        durations["collisiondetection"].append(time.perf_counter() - start_time)
+
+        path, duration = _timed(beamstop_manager.roadmap.find_path, move.beamstop_pos, move.target_pos, move.beamstop_nr, _move_budget(layout_config))
+        durations["roadmap"].append(duration)
+        found["roadmap"] += path is not None
+
+        obstacle_index = spatialindex.ObstacleGrid(obstacles, spacing)
+        path, duration = _timed(pathfinder.find_path, move.beamstop_pos, move.target_pos, obstacles, spacing, limits, obstacle_index,
+                                layout_config.PeakAbsorber.pathfinder_polygon_order, None, _move_budget(layout_config))
+        durations["pathfinder"].append(duration)
+        found["pathfinder"] += path is not None
+    return {planner: {"queries": len(moves),
+                      "paths_found": found[planner],
+                      "mean_s": float(np.mean(durations[planner])) if moves else 0.,
+                      "max_s": float(np.max(durations[planner])) if moves else 0.}
+            for planner in durations}
+
+
+def _move_budget(layout_config):
+    return budget.SearchBudget(layout_config.PeakAbsorber.planning_max_expansions_per_move, layout_config.PeakAbsorber.planning_timeout_per_move_ms)
+
+
+def _version():
+    """returns the current git commit of the repository or None if it can't be found"""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repetitions", type=int, default=5, help="number of random layouts per obstacle count")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the random layouts")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[10, 30, 100, 300, 1000], help="numbers of beamstops of the generated layouts")
+    parser.add_argument("--output", help="json file to write all results to")
+    args = parser.parse_args()
+
+    results = []
+    for result in bench_pathfinder_scaling(repetitions=args.repetitions, seed=args.seed):
+        print("{benchmark}: {obstacles:5d} obstacles, {paths_found}/{repetitions} paths found, mean {mean_s:.4f}s, max {max_s:.4f}s".format(**result))
+        results.append(result)
+    for result in bench_pathfinder_modes(repetitions=args.repetitions, seed=args.seed):
+        print("{benchmark}: {obstacles:5d} obstacles, {paths_found}/{repetitions} paths found, total length {total_length_mm:.1f}mm, {waypoints} waypoints, move time {move_time_s:.1f}s, {total_s:.3f}s".format(**result))
+        results.append(result)
+    for result in bench_planning_stack(args.sizes, seed=args.seed):
+        print("{benchmark} {scenario}: {moves} moves, {solved_moves} solved, check_spacing {check_spacing_s:.4f}s, get_required_moves {get_required_moves_s:.4f}s, "
+              "sequence_moves {sequence_moves_s:.4f}s (travel {nearest_neighbour_travel:.0f} -> {sequenced_travel:.0f}), "
+              "schedule_moves {schedule_moves_s:.4f}s ({cycles} cycles), calc_expected_collisions {calc_expected_collisions_s:.3f}s".format(**result))
+        for planner, planner_result in result["planners"].items():
+            print("    {}: {paths_found}/{queries} paths found, mean {mean_s:.4f}s, max {max_s:.4f}s".format(planner, **planner_result))
+        results.append(result)
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump({"version": _version(), "python": platform.python_version(), "numpy": np.__version__, "seed": args.seed, "results": results},
+                      output_file, indent=4)
+        print("results written to", args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+import time
+
+
+class SearchBudget:
+    """
+    Limits how much work the path searches may do and lets them be cancelled
+
+    A search calls spend() once for every node it expands and stops as soon as spend() returns False. It then returns the best path it found so far.
+    A budget can be limited by a number of node expansions, by a time after which it runs out and by a function that returns True when the user cancelled,
+    e.g. QProgressDialog.wasCanceled. Budgets for single moves are made with child(), they run out when either they or the budget of the whole
+    rearrangement run out.
+    """
+    def __init__(self, max_expansions=None, timeout_ms=None, cancelled=None, parent=None):
+        """
+        :param max_expansions: maximum number of node expansions or None for no limit
+        :param timeout_ms: time in ms after which the budget runs out or None for no limit
+        :param cancelled: function without arguments that returns True if the search should be cancelled
+        :param parent: budget that this budget is a part of. Expansions are counted in both
+        """
+        self.max_expansions = max_expansions
+        self.start_time = time.monotonic()
+        self.deadline = self.start_time + timeout_ms / 1000 if timeout_ms is not None else None
+        self.parent = parent
+        self._cancelled = cancelled
+        self._cancel_requested = False
+        self.expansions = 0
+        # why the budget ran out or None if it didn't
+        self.exhausted_reason = None
+
+    def child(self, max_expansions=None, timeout_ms=None):
+        """returns a budget for a part of the work, e.g. a single move, which also runs out when this budget runs out"""
+        return SearchBudget(max_expansions, timeout_ms, parent=self)
+
+    def cancel(self):
+        """makes the budget run out at the next spend()"""
+        self._cancel_requested = True
+
+    def spend(self, expansions=1):
+        """counts node expansions and returns whether the search may continue"""
+        self.expansions += expansions
+        if self.parent is not None and not self.parent.spend(expansions):
+            self.exhausted_reason = self.parent.exhausted_reason
+        elif self._cancel_requested or (self._cancelled is not None and self._cancelled()):
+            self.exhausted_reason = "cancelled"
+        elif self.max_expansions is not None and self.expansions > self.max_expansions:
+            self.exhausted_reason = "{} node expansions".format(self.max_expansions)
+        elif self.deadline is not None and time.monotonic() > self.deadline:
+            self.exhausted_reason = "timeout after {:.0f} ms".format(self.elapsed_ms)
+        return self.exhausted_reason is None
+
+    @property
+    def exhausted(self):
+        return self.exhausted_reason is not None
+
+    @property
+    def cancelled(self):
+        return self.exhausted_reason == "cancelled"
+
+    @property
+    def elapsed_ms(self):
+        return (time.monotonic() - self.start_time) * 1000
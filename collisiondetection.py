@@ -28,10 +28,12 @@ def col_check(next_bs,used_bs,target): #next_bs is the startposition of the next
     #    bypass=calc_bypass(next_bs,col_issues,20)
     return col_issues
 
-def col_check_new(next_bs,used_bs,target,dist):
-    """this returns all used bs that given a radius of dist intersect with a line from next_bs to target"""
-    in_the_way = pathfinder.find_collisions(np.array([next_bs, target]), np.array(used_bs)[:,0:2], dist)
-    obstacles_in_the_way = np.array(used_bs)[in_the_way]
+def col_check_new(next_bs,used_bs,target,dist,obstacle_index=None):
+    """this returns all used bs that given a radius of dist intersect with a line from next_bs to target. obstacle_index is an optional spatialindex.ObstacleGrid over used_bs.
+    used_bs should already be a numpy array, otherwise it is converted on every call"""
+    used_bs = np.asarray(used_bs, dtype=float)
+    in_the_way = pathfinder.find_collisions(np.array([next_bs, target]), used_bs[:,0:2], dist, obstacle_index)
+    obstacles_in_the_way = used_bs[in_the_way]
     return list(obstacles_in_the_way[obstacles_in_the_way[:,2].argsort()])
 
 def calc_bypass(next_bs,col_issues,used_bs,dist):
@@ -74,32 +76,39 @@ def calc_bypass_new(next_bs,col_issues,used_bs,target,dist):
     return [new_x,new_y]
 
 
-def calc_bypass_new_new(next_bs,col_issues,used_bs,target,dist,max_multi):
+def calc_bypass_new_new(next_bs,col_issues,used_bs,target,dist,max_multi,obstacle_index=None):
     alpha_target=calc_alpha(target[0],next_bs[0],target[1],next_bs[1])  # this calculates the angle towards the x-axis of the vector from next_bs to target
-    for dist_multi in range(1, max_multi):  # increasing distance to thing to circumvent in steps of dist
-        for angle in [-90, 90]:
-            new_x=(dist_multi*dist*math.cos(math.pi/180*(alpha_target+angle)))+col_issues[0][0]  # calculating vector angled off 90° from next_bs to obstacle vector and basing it on obstacle
-            new_y=(dist_multi*dist*math.sin(math.pi/180*(alpha_target+angle)))+col_issues[0][1]
-            if not col_check_new(next_bs,used_bs,[new_x,new_y], dist):
-                return [new_x, new_y]
+    # all candidates at once: vectors angled off -90° and 90° from the next_bs to target vector, dist_multi*dist long and based on the obstacle.
+    # they are ordered by increasing distance to the thing to circumvent (dist_multi from 1 to max_multi-1) and -90° before 90° for the same distance
+    angles=np.radians(alpha_target+np.array([-90, 90]))
+    directions=np.stack([np.cos(angles), np.sin(angles)], axis=1)
+    dist_multis=np.arange(1, max_multi)[:, np.newaxis, np.newaxis]
+    candidates=(np.asarray(col_issues[0][0:2], dtype=float)+dist_multis*dist*directions).reshape(-1, 2)
+    # check the lines to all candidates at once and take the first one in the order above that is free
+    lines=np.stack([np.broadcast_to(np.asarray(next_bs, dtype=float), candidates.shape), candidates], axis=1)
+    free=np.logical_not(np.any(pathfinder.find_collisions_batch(lines, np.asarray(used_bs, dtype=float)[:,0:2], dist, obstacle_index), axis=1))
+    if np.any(free):
+        return candidates[np.argmax(free)]
     raise NoSolutionError("max multi didn't find a bypass")
 
 
-def find_path(target,next_bs,used_bs,dist, max_multi):#first try
+def find_path(target,next_bs,used_bs,dist, max_multi, obstacle_index=None):#first try
     #QtCore.pyqtRemoveInputHook() #for debugging
     #pdb.set_trace() #for debugging
     kascade=[]
     col_issues=[]
-    col_issues=col_check_new(next_bs,used_bs,target, dist)
+    # convert once instead of in every collision check
+    used_bs=np.asarray(used_bs, dtype=float)
+    col_issues=col_check_new(next_bs,used_bs,target, dist, obstacle_index)
     if len(col_issues) > 0:
         while len(col_issues) > 0:
             if len(kascade) > 50:
                 raise NoSolutionError("kascade is over 50 points")
-            bypass=calc_bypass_new_new(next_bs,col_issues,used_bs,target,dist, max_multi)
+            bypass=calc_bypass_new_new(next_bs,col_issues,used_bs,target,dist, max_multi, obstacle_index)
 
             kascade.append(bypass)
             next_bs=bypass
-            col_issues=col_check_new(next_bs,used_bs,target, dist)
+            col_issues=col_check_new(next_bs,used_bs,target, dist, obstacle_index)
     #print kascade,"kascade done"
     kascade.append(target)
     return kascade
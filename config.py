@@ -14,6 +14,9 @@ class PeakAbsorber:
     # rates at which the values of the tango servers are polled, when idle and when moving a beamstop respectively in Hz
     idle_polling_rate = 5
     moving_polling_rate = 60
+    # whether the state of the hardware is updated from the change events of the tango server as soon as they arrive. It is then only polled at idle_polling_rate
+    # if the server doesn't send change events for the motor states and positions and the gripper register it is polled as without events
+    use_change_events = True
 
     # speeds at which the beamstops are moved in steps per second. This is first a limit on the total gripper speed and second a limit on the speed of each individual axis.
     # when moving a beamstops the diagonal gripper speed is important so it doesn't loose its magnet but when traveling only the individual axises have speed limits
@@ -31,6 +34,8 @@ class PeakAbsorber:
     # distance a beamstop moves back on its trajectory after being released.
     # This is mostly relevant because of the lower magnet being dragged behind and attracting the top magnet back
     backlash = 1.5
+    # steps of the motors per mm of movement, as configured on the tango server. Only used to predict how long moves take
+    steps_per_mm = 200
 
     # positive limits of the drive mechanism (negative limits are always zero)
     limits = np.array([500, 495])
@@ -60,6 +65,42 @@ class PeakAbsorber:
     # this is used during the beamstop assignment to make sure all active beamstops are used up before parked ones get moved in
     # set this to the maximum possible movement distance of the peak absorber
     beamstop_inactive_cost = 1000
+    # number of closest handles and parking positions of every beamstop that are considered for the assignment
+    # fewer neighbours make the matching faster, but in unusual layouts more pairs have to be added afterwards to find the cheapest assignment. More are tried automatically if there is no valid assignment
+    assignment_neighbours = 16
+    # cost added to a pair of beamstop and target in the assignment for every beamstop estimated to be in the way of the straight move between them
+    # given as a distance like beamstop_inactive_cost. Higher values prefer targets that can be reached directly over closer ones behind other beamstops.
+    # 0 only uses the distances
+    assignment_obstruction_cost = 0
+    # distance between the nodes of the lane graph (roadmap) which is used to quickly find paths around the beamstops
+    # smaller values find paths through narrower gaps but make building and searching the graph slower
+    roadmap_pitch = 7.5
+    # maximum number of paths kept in the path cache. The least recently used paths are dropped first
+    path_cache_size = 1000
+    # beamstops closer than this to the straight line between start and target of a move decide whether a cached path can be reused
+    path_cache_corridor = 30
+    # number of processes used to calculate the paths of independent moves in parallel. 0 or 1 calculates all paths in the gui process.
+    # Only worth it with several free cores and slow path searches, e.g. crowded layouts where many moves need the fallback pathfinder.
+    # Every pass sends the beamstops to the processes and recalculates the paths an earlier move changed the surroundings of,
+    # so for the usual layouts, where most paths are found by the fast greedy search, it is slower than calculating them here
+    planning_processes = 0
+    # number of corners of the polygons the fallback pathfinder uses to go around beamstops. 0 uses squares.
+    # polygons (e.g. 8 or 12) give shorter paths closer to the beamstops but take longer to calculate. Their extra corners are mostly removed
+    # by the shortcutting, and each remaining one is a stop of the motors, so the moves are only about 1-2% faster (see benchmark.py)
+    pathfinder_polygon_order = 0
+    # what the beamstop assignment, the order of the moves and the pathfinder minimize:
+    # "distance" for the distance the beamstops are moved or "time" for the time the moves take according to the slewrates, accelerations and gripper time
+    planning_cost = "distance"
+    # limits for the path calculation, so a difficult constellation can't block the gui. When a limit is reached the best path found so far is used.
+    # maximum number of nodes the path searches may expand for a single move
+    planning_max_expansions_per_move = 20000
+    # maximum time for the path search of a single move and for all paths of one rearrangement in ms
+    planning_timeout_per_move_ms = 2000
+    planning_timeout_ms = 60000
+    # time in ms spent improving the order of the moves after the nearest neighbour order was found. 0 only uses the nearest neighbour order
+    sequencing_timeout_ms = 500
+    # maximum number of beamstops moved out of the way to unblock a single move that has no path otherwise
+    deadlock_max_relocations = 3
 
 
 class Detector:
@@ -0,0 +1,21 @@
+class ConfigError(Exception):
+    """Exception raised if a config value isn't within the expected range"""
+    def __init__(self, value, message):
+        """
+        init
+        :param value: name of the value that didn't meet expectations
+        :param message: error message
+        """
+        self.value = value
+        self.message = message
+
+
+class PlanningError(Exception):
+    """Exception raised if the handles can't be reached at all, e.g. because there are more handles than beamstops"""
+    def __init__(self, message):
+        """
+        init
+        :param message: error message
+        """
+        super().__init__(message)
+        self.message = message
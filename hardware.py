@@ -1,17 +1,47 @@
-import tango
+try:
+    import tango
+except ImportError:
+    # without PyTango the hardware can only run on the simulated devices of a mocktango.MockTango, e.g. in tests
+    import mocktango as tango
 import absorberfunctions
+import errors
 import numpy as np
+import collections
 import logging
+import time
 from PyQt5.QtCore import QEventLoop, QTimer, pyqtSignal, QObject
 
 
+# everything the MovementUpdater needs to know about the hardware, read at once by PeakAbsorberHardware.get_hardware_status
+# pos is a tuple (x, y), gripper_pos the value of the gripper register and the states are tango.DevState values
+HardwareStatus = collections.namedtuple("HardwareStatus", ["pos", "gripper_pos", "motor_x_state", "motor_y_state", "gripper_state"])
+
+
 class PeakAbsorberHardware:
-    def __init__(self, config):
-        self.config = config
+    # number of requests to the tango server get_hardware_status sends
+    status_request_count = 2
 
-        self._gripper = tango.DeviceProxy(self.config.PeakAbsorber.tango_server + self.config.PeakAbsorber.gripper_path)
-        self._motor_x = tango.DeviceProxy(self.config.PeakAbsorber.tango_server + self.config.PeakAbsorber.motor_x_path)
-        self._motor_y = tango.DeviceProxy(self.config.PeakAbsorber.tango_server + self.config.PeakAbsorber.motor_y_path)
+    def __init__(self, config, device_factory=None, group_factory=None):
+        """
+        :param device_factory: function that returns a device proxy for a device name. tango.DeviceProxy if this is None
+        :param group_factory: function that returns an empty device group for a group name. tango.Group if this is None
+         mocktango.MockTango has both, to run without a control system. Without PyTango they have to be given
+        """
+        self.config = config
+        device_factory = tango.DeviceProxy if device_factory is None else device_factory
+        group_factory = tango.Group if group_factory is None else group_factory
+
+        motor_x_name = self.config.PeakAbsorber.tango_server + self.config.PeakAbsorber.motor_x_path
+        motor_y_name = self.config.PeakAbsorber.tango_server + self.config.PeakAbsorber.motor_y_path
+        self._gripper = device_factory(self.config.PeakAbsorber.tango_server + self.config.PeakAbsorber.gripper_path)
+        self._motor_x = device_factory(motor_x_name)
+        self._motor_y = device_factory(motor_y_name)
+        # both motors in one group, so they can be read and written with a single request, which also starts both axes at the same time
+        self._motors = group_factory("motors")
+        self._motors.add(motor_x_name)
+        self._motors.add(motor_y_name)
+        # (device proxy, subscription id) of the change events the updater subscribed to
+        self._event_subscriptions = []
 
         self.updater = None
         self.lg = logging.getLogger("main.hardware.hardware")
@@ -22,7 +52,8 @@ class PeakAbsorberHardware:
         self.lg.info("moving beamstop %d to %s", move.beamstop_nr, str(move.target_pos))
         self.move_to(move.beamstop_pos, "travel")
         self.move_gripper(1)
-        for pos in move.path[:-1]:
+        # the path starts where the beamstop is, which the gripper was just moved to
+        for pos in move.path[1:-1]:
             self.move_to(pos, "beamstop")
         self.move_to_backlash(move.path[-1])
         self.move_gripper(0)
@@ -36,7 +67,7 @@ class PeakAbsorberHardware:
 
     def move_to_backlash(self, pos, slewrate="beamstop"):
         """ moves to and over a point by [backlash]mm, then moves back to the point"""
-        cur_pos = np.array([self._motor_x.position, self._motor_y.position])
+        cur_pos = self.read_motor_positions()
         move_vector = pos-cur_pos
         if np.sum(move_vector) == 0:
             self.lg.debug("we already are at the target. returning.")
@@ -53,7 +84,7 @@ class PeakAbsorberHardware:
         if not self.updater.motors_ready:
             raise HardwareError("move", "move requested but motors not ready")
 
-        distance = np.abs([self._motor_x.position - pos[0], self._motor_y.position - pos[1]])
+        distance = np.abs(self.read_motor_positions() - pos)
         travel_distance = absorberfunctions.calc_vec_len([distance[0], distance[1]])
         if travel_distance < self.config.PeakAbsorber.epsilon:
             return
@@ -69,7 +100,7 @@ class PeakAbsorberHardware:
             slewrates[further_axis] = self.config.PeakAbsorber.slewrates[slewrate][1]
             slewrates[int(not further_axis)] = distance[int(not further_axis)] * self.config.PeakAbsorber.slewrates[slewrate][1] / distance[further_axis]
         if slewrates is None:
-            raise absorberfunctions.ConfigError("slewrates[{}]".format(slewrate), "slewrate limits for any action cannot both be zero")
+            raise errors.ConfigError("slewrates[{}]".format(slewrate), "slewrate limits for any action cannot both be zero")
 
         # set the accelerations to the maximum values at which the ratio is the same as the ratio of the distances so that the axises reach their target speeds simultanously
         # Similar to the version for the slewrates but without an option for a total acceleration of the grabber because the grabber and beamstops are not very heavy but the individual translations are
@@ -77,23 +108,68 @@ class PeakAbsorberHardware:
         accelerations[further_axis] = self.config.PeakAbsorber.max_acceleration
         accelerations[int(not further_axis)] = distance[int(not further_axis)] * self.config.PeakAbsorber.max_acceleration / distance[further_axis]
 
-        self._motor_x.slewrate = slewrates[0]
-        self._motor_y.slewrate = slewrates[1]
-        self._motor_x.acceleration = accelerations[0]
-        self._motor_y.acceleration = accelerations[1]
-        self._motor_x.position = pos[0]
-        self._motor_y.position = pos[1]
-        self.updater.set_motor_moving()
+        self.write_motors("slewrate", slewrates)
+        self.write_motors("acceleration", accelerations)
+        # writing the targets starts the motors
+        self.write_motors("position", pos)
+        self.updater.set_motor_moving(distance >= self.config.PeakAbsorber.epsilon)
         self.wait(self.config.PeakAbsorber.timeout_ms, self.updater.moveFinished)
 
+    def read_motor_positions(self):
+        """reads the positions of both motors in one request and returns them as np.array([x, y])"""
+        return np.array([reply.get_data().value for reply in self._check_replies(self._motors.read_attribute("position"), "read positions")], dtype=float)
+
+    def write_motors(self, attribute, values):
+        """
+        writes an attribute of both motors in one request
+        :param attribute: name of the attribute
+        :param values: [value for x, value for y]
+        """
+        self._check_replies(self._motors.write_attribute(attribute, [float(value) for value in values], multi=True), "write " + attribute)
+
+    def command_motors(self, command, *arguments):
+        """runs a command with the same arguments on both motors in one request"""
+        self._check_replies(self._motors.command_inout(command, *arguments), command)
+
+    @staticmethod
+    def _check_replies(replies, action):
+        """raises a HardwareError if any of the replies of a group request failed, otherwise returns them"""
+        replies = list(replies)
+        failed = [reply.dev_name() for reply in replies if reply.has_failed()]
+        if failed:
+            raise HardwareError(action, "{} failed on {}".format(action, ", ".join(failed)))
+        return replies
+
+    def subscribe_status_events(self, callback):
+        """
+        subscribes to the change events of everything in HardwareStatus
+        :param callback: function called with the name of the HardwareStatus field ("pos_x" and "pos_y" for the two parts of pos) and the tango.EventData.
+         It is called from a thread of tango
+        :returns: True if all subscriptions worked. Otherwise there are no subscriptions left and False is returned
+        """
+        for device, attribute, field in ((self._motor_x, "State", "motor_x_state"), (self._motor_y, "State", "motor_y_state"),
+                                         (self._motor_x, "position", "pos_x"), (self._motor_y, "position", "pos_y"),
+                                         (self._gripper, "value", "gripper_pos"), (self._gripper, "State", "gripper_state")):
+            try:
+                subscription_id = device.subscribe_event(attribute, tango.EventType.CHANGE_EVENT, lambda event, field=field: callback(field, event))
+            except tango.DevFailed as error:
+                self.lg.info("no change events for %s of %s: %s", attribute, device.name(), error)
+                self.unsubscribe_status_events()
+                return False
+            self._event_subscriptions.append((device, subscription_id))
+        return True
+
+    def unsubscribe_status_events(self):
+        for device, subscription_id in self._event_subscriptions:
+            device.unsubscribe_event(subscription_id)
+        self._event_subscriptions = []
+
     def get_hardware_status(self):
-        status = {}
-        status["pos"] = self._motor_x.position, self._motor_y.position
-        status["gripper_pos"] = self._gripper.value
-        status["motor_x_state"] = self._motor_x.state()
-        status["motor_y_state"] = self._motor_y.state()
-        status["gripper_state"] = self._gripper.state()
-        return status
+        """reads the positions and states of the motors in one group request and the gripper in one request and returns them as HardwareStatus"""
+        motor_x_pos, motor_x_state, motor_y_pos, motor_y_state = [reply.get_data().value for reply in
+                                                                  self._check_replies(self._motors.read_attributes(["position", "State"]), "read status")]
+        gripper_pos, gripper_state = [attribute.value for attribute in self._gripper.read_attributes(["value", "State"])]
+        return HardwareStatus((motor_x_pos, motor_y_pos), gripper_pos, motor_x_state, motor_y_state, gripper_state)
 
     def go_home(self):
         self.move_to([0, 0], "travel")
@@ -108,17 +184,17 @@ class PeakAbsorberHardware:
         """
         self.lg.info("homing translations")
         self.move_to_limits("homing")
-        correction = np.array(self.get_hardware_status()["pos"])
+        correction = np.array(self.get_hardware_status().pos)
         self.zero_steps()
         self.move_to(self.config.PeakAbsorber.limit_switch_max_hysterisis, "travel")
         self.check_limits_disengaged()
         if precise:
             self.move_to_limits("homing_precise")
-            correction += np.array(self.get_hardware_status()["pos"])
+            correction += np.array(self.get_hardware_status().pos)
             self.zero_steps()
             self.move_to(self.config.PeakAbsorber.limit_switch_max_hysterisis, "travel")
             self.check_limits_disengaged()
-        correction += np.array(self.get_hardware_status()["pos"])
+        correction += np.array(self.get_hardware_status().pos)
         self.zero_steps()
         if abs(correction[0]) > self.config.PeakAbsorber.max_distance_error or abs(correction[1]) > self.config.PeakAbsorber.max_distance_error:
             self.lg.warning("Homing corrected by %s mm. The correction done by homing was too large to catch beamstops placed before the correction. You should repark all beamstops manually. Failure to do so may result in hardware damage.", str(correction))
@@ -133,14 +209,14 @@ class PeakAbsorberHardware:
         elif self.config.PeakAbsorber.zero_limit[0] == "ccw":
             xlimit = self._motor_x.ccwlimit
         else:
-            raise absorberfunctions.ConfigError("PeakAbsorber.zero_limit[0]", "zero_limit isn't cw or ccw")
+            raise errors.ConfigError("PeakAbsorber.zero_limit[0]", "zero_limit isn't cw or ccw")
 
         if self.config.PeakAbsorber.zero_limit[0] == "cw":
             ylimit = self._motor_y.cwlimit
         elif self.config.PeakAbsorber.zero_limit[0] == "ccw":
             ylimit = self._motor_y.ccwlimit
         else:
-            raise absorberfunctions.ConfigError("PeakAbsorber.zero_limit[1]", "zero_limit isn't cw or ccw")
+            raise errors.ConfigError("PeakAbsorber.zero_limit[1]", "zero_limit isn't cw or ccw")
 
         if xlimit or ylimit:
             raise HardwareError("homing", "homing switches didn't disengage after moving {} out!".format(self.config.PeakAbsorber.limit_switch_max_hysterisis))
@@ -152,32 +228,29 @@ class PeakAbsorberHardware:
         :return: nothing
         """
         self.lg.debug("moving to cw limits")
-        self._motor_x.slewrate = self.config.PeakAbsorber.slewrates[slewrate][1]
-        self._motor_y.slewrate = self.config.PeakAbsorber.slewrates[slewrate][1]
-        self._motor_x.acceleration = self.config.PeakAbsorber.max_acceleration
-        self._motor_y.acceleration = self.config.PeakAbsorber.max_acceleration
+        self.write_motors("slewrate", [self.config.PeakAbsorber.slewrates[slewrate][1]] * 2)
+        self.write_motors("acceleration", [self.config.PeakAbsorber.max_acceleration] * 2)
 
         if self.config.PeakAbsorber.zero_limit[0] == "cw":
             self._motor_x.moveToCwLimit()
         elif self.config.PeakAbsorber.zero_limit[0] == "ccw":
             self._motor_x.moveToCcwLimit()
         else:
-            raise absorberfunctions.ConfigError("PeakAbsorber.zero_limit[0]", "zero_limit isn't cw or ccw")
+            raise errors.ConfigError("PeakAbsorber.zero_limit[0]", "zero_limit isn't cw or ccw")
 
         if self.config.PeakAbsorber.zero_limit[0] == "cw":
             self._motor_y.moveToCwLimit()
         elif self.config.PeakAbsorber.zero_limit[0] == "ccw":
             self._motor_y.moveToCcwLimit()
         else:
-            raise absorberfunctions.ConfigError("PeakAbsorber.zero_limit[0]", "zero_limit isn't cw or ccw")
+            raise errors.ConfigError("PeakAbsorber.zero_limit[0]", "zero_limit isn't cw or ccw")
 
         self.updater.set_motor_moving()
         self.wait(self.config.PeakAbsorber.timeout_ms, self.updater.moveFinished)
 
     def zero_steps(self):
         """helper function for homing, sets the current position to be the coordinate origin"""
-        self._motor_x.SetStepPosition(0)
-        self._motor_y.SetStepPosition(0)
+        self.command_motors("SetStepPosition", 0)
 
     def wait(self, timeout, signal=None):
         """
@@ -231,7 +304,9 @@ class MovementUpdater(QObject):
         self.beamstop_manager = beamstop_manager
         self.lg = logging.getLogger("main.hardware.movementupdater")
 
-        self.status = {"pos": None, "gripper_pos": 0, "motor_x_state": None, "motor_y_state": None, "gripper_state": None}
+        self.status = HardwareStatus(None, 0, None, None, None)
+        # what polling the hardware costs, see PollStatistics
+        self.poll_statistics = PollStatistics()
         self.motors_ready = False
         self.motor_move_started = False
         self.estimated_real_gripper_pos = 0
@@ -239,15 +314,24 @@ class MovementUpdater(QObject):
 
         self._timer = QTimer()
         self._timer.timeout.connect(self.update)
-        self._timer.start(1000 / self.config.PeakAbsorber.idle_polling_rate)
+        self._timer.start(int(1000 / self.config.PeakAbsorber.idle_polling_rate))
 
         self._gripper_timer = QTimer()
         self._gripper_timer.timeout.connect(self.update_gripper_pos)
 
     def update(self):
+        self.apply_status(self.poll())
+
+    def poll(self):
+        """reads the status of the hardware and records what that cost in poll_statistics"""
+        poll_start = time.perf_counter()
         new_status = self.absorber_hardware.get_hardware_status()
+        self.poll_statistics.record(time.perf_counter() - poll_start, self.absorber_hardware.status_request_count)
+        return new_status
 
-        new_motors_ready = new_status["motor_x_state"] == tango.DevState.ON and new_status["motor_y_state"] == tango.DevState.ON
+    def apply_status(self, new_status):
+        """emits the signals for everything that changed from the last status to new_status and keeps new_status"""
+        new_motors_ready = new_status.motor_x_state == tango.DevState.ON and new_status.motor_y_state == tango.DevState.ON
 
         if self.motor_move_started and new_motors_ready:
             self.moveFinished.emit()
@@ -255,20 +339,24 @@ class MovementUpdater(QObject):
 
         if self.motors_ready != new_motors_ready:
             if new_motors_ready:
+                self.lg.debug("motors idle, polling so far: %s", self.poll_statistics.summary())
                 self.set_polling_rate("idle")
             else:
                 self.set_polling_rate("moving")
 
-        if self.status["gripper_pos"] != new_status["gripper_pos"]:
+        if self.status.gripper_pos != new_status.gripper_pos:
             self._change_gripper(new_status)
 
-        if self.status["pos"] != new_status["pos"]:
-            self.posChanged.emit(new_status["pos"], (self.grabbed_beamstop_nr, ))
-
+        if self.status.pos != new_status.pos:
+            self.posChanged.emit(new_status.pos, (self.grabbed_beamstop_nr, ))
 
         self.motors_ready = new_motors_ready
         self.status = new_status
 
+    def shutdown(self):
+        self._timer.stop()
+        self._gripper_timer.stop()
+
     def set_polling_rate(self, rate):
         if rate == "moving":
             polling_rate = self.config.PeakAbsorber.moving_polling_rate
@@ -276,43 +364,174 @@ class MovementUpdater(QObject):
             polling_rate = self.config.PeakAbsorber.idle_polling_rate
         else:
             ValueError("not a polling rate")
-        self._timer.setInterval(1000 / polling_rate)
+        self._timer.setInterval(int(1000 / polling_rate))
 
-    def set_motor_moving(self):
+    def set_motor_moving(self, moving_axes=(True, True)):
+        """
+        call after starting the motors, moveFinished is emitted when they stopped
+        :param moving_axes: whether the x and the y motor actually move. An axis that doesn't move may not change its state at all
+        """
         self.motor_move_started = True
         self.set_polling_rate("moving")
 
     def _change_gripper(self, new_status):
         self.lg.debug("gripper changed state")
-        if new_status["gripper_pos"] == 1:
-            grabbed_beamstop_nr = np.argwhere(absorberfunctions.calc_vec_len(self.beamstop_manager.beamstops - new_status["pos"]) < self.config.PeakAbsorber.max_distance_error)
+        if new_status.gripper_pos == 1:
+            grabbed_beamstop_nr = np.argwhere(absorberfunctions.calc_vec_len(self.beamstop_manager.beamstops - new_status.pos) < self.config.PeakAbsorber.max_distance_error)
             if grabbed_beamstop_nr.size:
                 self.grabbed_beamstop_nr = grabbed_beamstop_nr[0][0]
             else:
                 self.grabbed_beamstop_nr = None
-        if new_status["gripper_pos"] == 0:
+        if new_status.gripper_pos == 0:
             if self.grabbed_beamstop_nr is not None:
-                self.beamstop_manager.move(self.grabbed_beamstop_nr, new_status["pos"])
+                self.beamstop_manager.move(self.grabbed_beamstop_nr, new_status.pos)
             self.grabbed_beamstop_nr = None
 
         # start estimating the real gripper pos
-        self.estimated_real_gripper_pos = float(self.status["gripper_pos"])
-        self._gripper_timer.start(1000 / self.config.PeakAbsorber.moving_polling_rate)
+        self.estimated_real_gripper_pos = float(self.status.gripper_pos)
+        self._gripper_timer.start(int(1000 / self.config.PeakAbsorber.moving_polling_rate))
 
     def update_gripper_pos(self):
-        if self.status["gripper_pos"]:
+        if self.status.gripper_pos:
             self.estimated_real_gripper_pos += 1/self.config.PeakAbsorber.moving_polling_rate/(self.config.PeakAbsorber.gripper_time_ms/1000)
-        elif not self.status["gripper_pos"]:
+        elif not self.status.gripper_pos:
             self.estimated_real_gripper_pos -= 1/self.config.PeakAbsorber.moving_polling_rate/(self.config.PeakAbsorber.gripper_time_ms/1000)
 
         if self.estimated_real_gripper_pos >= 1 or self.estimated_real_gripper_pos <= 0:
             self._gripper_timer.stop()
-            self.estimated_real_gripper_pos = self.status["gripper_pos"]
+            self.estimated_real_gripper_pos = self.status.gripper_pos
             self.gripperFinished.emit()
 
         self.gripperEstimateChanged.emit(self.estimated_real_gripper_pos)
 
 
+class EventMovementUpdater(MovementUpdater):
+    """
+    MovementUpdater that reacts to the change events of the tango server as soon as they arrive instead of on the next poll
+
+    It subscribes to the states and positions of the motors and the gripper register. If the server doesn't send change events for all of them
+    it polls like MovementUpdater. With events it still polls at the idle polling rate for the positions and the gripper. The polled states
+    of the motors are only used when no events arrived for a few polls, in case events got lost.
+    """
+    # the callbacks of tango run in a thread of tango, this signal passes the events on to the thread of the updater
+    _eventReceived = pyqtSignal(str, object)
+    # number of polls without any event after which events are considered lost and the polled motor states are used
+    polls_until_events_lost = 2
+
+    def __init__(self, config, absorber_hardware, beamstop_manager):
+        super().__init__(config, absorber_hardware, beamstop_manager)
+        # the motor state fields for which a move was started but no MOVING event arrived yet. Their events from before the move are ignored
+        self._awaited_motors = set()
+        self._polls_without_events = 0
+        self._eventReceived.connect(self.apply_event)
+        self.events_active = self.absorber_hardware.subscribe_status_events(self._eventReceived.emit)
+        if self.events_active:
+            self.lg.info("using change events of the hardware")
+        else:
+            self.lg.info("hardware doesn't send change events, polling instead")
+
+    def apply_event(self, field, event):
+        """
+        updates the status with a change event
+        :param field: field of HardwareStatus that changed, "pos_x" or "pos_y" for the parts of pos
+        :param event: tango.EventData
+        """
+        if event.err:
+            self.lg.warning("error event for %s: %s", field, event.errors)
+            return
+        self._polls_without_events = 0
+        if self.status.pos is None:
+            # the first events can arrive before anything was polled. Start with a complete status
+            self.update()
+            return
+        value = event.attr_value.value
+        if field in self._awaited_motors:
+            if value != tango.DevState.MOVING:
+                # an event that was sent before the motor started, e.g. the end of the last move if that was noticed by polling
+                return
+            self._awaited_motors.discard(field)
+        if field == "pos_x":
+            self.apply_status(self.status._replace(pos=(value, self.status.pos[1])))
+        elif field == "pos_y":
+            self.apply_status(self.status._replace(pos=(self.status.pos[0], value)))
+        else:
+            self.apply_status(self.status._replace(**{field: value}))
+
+    def set_polling_rate(self, rate):
+        super().set_polling_rate("idle" if self.events_active else rate)
+
+    def update(self):
+        new_status = self.poll()
+        self._polls_without_events += 1
+        if self.status.pos is None or not self.events_active or self._polls_without_events > self.polls_until_events_lost:
+            # the polled states are the real ones, so no events need to be waited for anymore
+            self._awaited_motors.clear()
+        else:
+            # while events arrive the states of the motors only come from them. Otherwise the poll could finish a move before its
+            # last events arrived, which would then be taken for the events of the next move
+            new_status = new_status._replace(motor_x_state=self.status.motor_x_state, motor_y_state=self.status.motor_y_state)
+        self.apply_status(new_status)
+
+    def set_motor_moving(self, moving_axes=(True, True)):
+        super().set_motor_moving(moving_axes)
+        if not self.events_active:
+            return
+        # the events of the motors starting to move may still be on their way. Until they arrive the motors must not count as ready,
+        # or the next position event would finish the move right away
+        self._awaited_motors = {field for field, moving in zip(("motor_x_state", "motor_y_state"), moving_axes) if moving}
+        self.status = self.status._replace(**{field: tango.DevState.MOVING for field in self._awaited_motors})
+        self.motors_ready = not self._awaited_motors
+
+    def shutdown(self):
+        super().shutdown()
+        self.absorber_hardware.unsubscribe_status_events()
+        self.events_active = False
+
+
+class PollStatistics:
+    """counts the status polls of the hardware, the requests to the tango server they need and how long they take"""
+    # upper limits of the buckets of the latency histogram in ms. The last bucket of the histogram counts all polls that took longer
+    latency_buckets_ms = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.polls = 0
+        self.requests = 0
+        self.total_latency_ms = 0.
+        self.max_latency_ms = 0.
+        # number of polls with a latency up to each of latency_buckets_ms and above the last one
+        self.latency_histogram = np.zeros(len(self.latency_buckets_ms) + 1, dtype=int)
+
+    def record(self, latency_s, requests):
+        """
+        adds a poll
+        :param latency_s: time the poll took in s
+        :param requests: number of requests to the tango server the poll sent
+        """
+        latency_ms = latency_s * 1000
+        self.polls += 1
+        self.requests += requests
+        self.total_latency_ms += latency_ms
+        self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+        self.latency_histogram[np.searchsorted(self.latency_buckets_ms, latency_ms)] += 1
+
+    @property
+    def requests_per_poll(self):
+        return self.requests / self.polls if self.polls else 0.
+
+    @property
+    def mean_latency_ms(self):
+        return self.total_latency_ms / self.polls if self.polls else 0.
+
+    def summary(self):
+        buckets = ["<={}ms: {}".format(limit, count) for limit, count in zip(self.latency_buckets_ms, self.latency_histogram)]
+        buckets.append(">{}ms: {}".format(self.latency_buckets_ms[-1], self.latency_histogram[-1]))
+        return "{} polls, {:.1f} requests per poll, latency mean {:.2f} ms, max {:.2f} ms ({})".format(
+            self.polls, self.requests_per_poll, self.mean_latency_ms, self.max_latency_ms, ", ".join(buckets))
+
+
 class HardwareError(Exception):
     """
     Exception if something unexpected happens to the hardware
@@ -0,0 +1,126 @@
+import math
+
+import numpy as np
+
+import errors
+
+
+class MotionModel:
+    """
+    Predicts how long the hardware takes for movements, mirroring what PeakAbsorberHardware does
+
+    Every move_to is a separate movement that starts and ends at a standstill. move_to sets the speed and acceleration of the two axes so they
+    arrive at the same time, so the duration of a movement is the duration of the axis with the longer way under a trapezoidal speed profile:
+    it accelerates with max_acceleration up to its speed, travels at that speed and brakes with max_acceleration again. Short movements
+    that never reach the full speed have a triangular profile instead.
+    On top of that each movement takes on average half a polling period until the end of the movement is noticed.
+
+    The slewrates and the acceleration are given in steps, all positions in mm and all returned durations in seconds.
+    """
+    def __init__(self, config):
+        self.steps_per_mm = config.PeakAbsorber.steps_per_mm
+        self.acceleration = config.PeakAbsorber.max_acceleration / self.steps_per_mm
+        # speed limits as (limit of the total speed, limit of each axis) in mm/s, where None means unlimited
+        self.speed_limits = {}
+        for slewrate, (total_limit, axis_limit) in config.PeakAbsorber.slewrates.items():
+            if not total_limit and not axis_limit:
+                raise errors.ConfigError("slewrates[{}]".format(slewrate), "slewrate limits for any action cannot both be zero")
+            self.speed_limits[slewrate] = (total_limit / self.steps_per_mm if total_limit else None, axis_limit / self.steps_per_mm if axis_limit else None)
+        self.move_overhead = 0.5 / config.PeakAbsorber.moving_polling_rate
+        self.gripper_time = config.PeakAbsorber.gripper_time_ms / 1000
+        self.backlash = config.PeakAbsorber.backlash
+        self.epsilon = config.PeakAbsorber.epsilon
+
+    def segment_times(self, starts, ends, slewrate="beamstop"):
+        """
+        durations of straight movements with move_to
+
+        :param starts: start points of the movements. Format [[x, y], [x, y], ...] or a single point [x, y]
+        :param ends: end points of the movements, broadcast against starts
+        :param slewrate: name of the slewrate in config.PeakAbsorber.slewrates
+        :return: array with the duration of every movement
+        """
+        distances = np.abs(np.asarray(ends, dtype=float) - np.asarray(starts, dtype=float))
+        lengths = np.hypot(distances[..., 0], distances[..., 1])
+        further_distances = np.max(distances, axis=-1)
+        total_limit, axis_limit = self.speed_limits[slewrate]
+        # speed of the axis with the longer way, see move_to
+        speeds = np.full(lengths.shape, np.inf)
+        if total_limit is not None:
+            np.divide(further_distances * total_limit, lengths, out=speeds, where=lengths > 0)
+        if axis_limit is not None:
+            np.minimum(speeds, axis_limit, out=speeds)
+        # trapezoidal profile if the axis reaches its speed before half the way, triangular profile otherwise
+        trapezoid = further_distances >= speeds ** 2 / self.acceleration
+        with np.errstate(invalid="ignore", divide="ignore"):
+            times = np.where(trapezoid,
+                             further_distances / speeds + speeds / self.acceleration,
+                             2 * np.sqrt(further_distances / self.acceleration))
+        # move_to doesn't move at all for tiny distances
+        return np.where(lengths < self.epsilon, 0, times + self.move_overhead)
+
+    def segment_time(self, start, end, slewrate="beamstop"):
+        """duration of a single straight movement from start to end. Same as segment_times, but much faster for single points"""
+        distance_x = abs(end[0] - start[0])
+        distance_y = abs(end[1] - start[1])
+        length = math.hypot(distance_x, distance_y)
+        if length < self.epsilon:
+            return 0.
+        further_distance = max(distance_x, distance_y)
+        total_limit, axis_limit = self.speed_limits[slewrate]
+        speed = math.inf
+        if total_limit is not None:
+            speed = further_distance * total_limit / length
+        if axis_limit is not None:
+            speed = min(speed, axis_limit)
+        if further_distance >= speed ** 2 / self.acceleration:
+            return further_distance / speed + speed / self.acceleration + self.move_overhead
+        return 2 * math.sqrt(further_distance / self.acceleration) + self.move_overhead
+
+    def min_time(self, start, end, slewrate="beamstop"):
+        """
+        lower bound for the duration of any path from start to end, which is the straight distance at the highest possible speed.
+        Used as the heuristic of the path search
+        """
+        total_limit, axis_limit = self.speed_limits[slewrate]
+        max_speed = min(total_limit if total_limit is not None else math.inf, axis_limit * math.sqrt(2) if axis_limit is not None else math.inf)
+        return math.hypot(end[0] - start[0], end[1] - start[1]) / max_speed
+
+    def distance_times(self, distances, slewrate="beamstop"):
+        """durations of movements of the given lengths along a single axis, e.g. to convert distance penalties into durations"""
+        distances = np.asarray(distances, dtype=float)
+        return self.segment_times(np.zeros(distances.shape + (2,)), np.stack([distances, np.zeros(distances.shape)], axis=-1), slewrate)
+
+    def path_time(self, path, slewrate="beamstop"):
+        """
+        duration of moving along a path like PeakAbsorberHardware.move_beamstop does it: a movement to every point and a movement over the last point
+        by the backlash and back
+        :param path: points to move along, including the start. Format [[x, y], [x, y], ...]
+        """
+        path = np.asarray(path, dtype=float).reshape(-1, 2)
+        if len(path) < 2:
+            return 0.
+        duration = float(np.sum(self.segment_times(path[:-2], path[1:-1], slewrate)))
+        move_vector = path[-1] - path[-2]
+        move_length = np.hypot(*move_vector)
+        if move_length == 0:
+            return duration
+        backlash_target = path[-1] + move_vector / move_length * self.backlash
+        return duration + self.segment_time(path[-2], backlash_target, slewrate) + self.segment_time(backlash_target, path[-1], slewrate)
+
+    def move_time(self, move, gripper_position):
+        """
+        duration of PeakAbsorberHardware.move_beamstop for a move with a path
+        :param move: planning.PlannedMove or BeamstopMove with a path
+        :param gripper_position: position of the gripper before the move as [x, y]
+        """
+        return (self.segment_time(gripper_position, move.beamstop_pos, "travel") + 2 * self.gripper_time
+                + self.path_time(move.path, "beamstop"))
+
+    def moves_time(self, moves, gripper_position=(0, 0)):
+        """duration of doing all moves one after the other and going home at the end, like BeamstopMover.move_beamstops does it"""
+        duration = 0.
+        for move in moves:
+            duration += self.move_time(move, gripper_position)
+            gripper_position = move.path[-1]
+        return duration + self.segment_time(gripper_position, (0, 0), "travel")
@@ -0,0 +1,311 @@
+"""
+Stands in for the parts of PyTango the hardware uses, so PeakAbsorberHardware can run without a control system, e.g. in tests or benchmarks.
+
+A MockTango holds simulated devices and counts every call that would be a network round trip to the tango server.
+Its DeviceProxy and Group methods are passed to PeakAbsorberHardware instead of tango.DeviceProxy and tango.Group.
+Motors move instantly: writing their position sets it right away and their state goes through MOVING back to ON.
+Devices added with events=True send change events to subscribers. The events are queued like they would be on the network and only delivered
+by push_events, so tests decide when they arrive.
+"""
+import collections
+import enum
+
+try:
+    from tango import DevState, DevFailed, EventType
+except ImportError:
+    class DevState(enum.IntEnum):
+        """the device states of tango.DevState the hardware uses"""
+        ON = 0
+        OFF = 1
+        MOVING = 6
+        FAULT = 8
+        ALARM = 11
+
+    class EventType(enum.IntEnum):
+        """the event types of tango.EventType the hardware uses"""
+        CHANGE_EVENT = 0
+
+    class DevFailed(Exception):
+        """stands in for tango.DevFailed"""
+
+    # hardware falls back to this module if PyTango isn't installed. Its default factories then fail like a server that can't be reached
+    def DeviceProxy(name):
+        raise DevFailed("PyTango isn't installed, can't connect to {}. Use the factories of a MockTango".format(name))
+
+    def Group(name):
+        raise DevFailed("PyTango isn't installed, can't create the group {}. Use the factories of a MockTango".format(name))
+
+
+class MockTango:
+    """a simulated control system with devices by name, counting the round trips to it"""
+    def __init__(self):
+        # name: MockDevice
+        self.devices = {}
+        # number of requests sent to the server. A group call counts once because the group sends to all its devices at the same time
+        self.round_trips = 0
+        # number of requests by (device or group name, request)
+        self.calls = collections.Counter()
+        # (callback, EventData) of the events that weren't delivered yet
+        self.pending_events = []
+
+    def add_device(self, name, attributes, commands=None, state=DevState.ON, events=False):
+        """
+        adds a simulated device
+        :param name: full name of the device, like the tango_server and path in the config
+        :param attributes: dict with the initial values of the attributes
+        :param commands: dict of command name: function called with the MockDevice and the argument of the command
+        :param state: initial state of the device
+        :param events: whether the device sends change events. If not, subscribing fails like on a server without configured events
+        :return: the MockDevice
+        """
+        device = MockDevice(self, name, attributes, commands, state, events)
+        self.devices[name.lower()] = device
+        return device
+
+    def add_motor(self, name, position=0., events=False):
+        """adds a simulated motor with the attributes and commands PeakAbsorberHardware uses. It goes through MOVING while it moves"""
+        def set_step_position(device, steps):
+            # sets the position without moving
+            device.attributes["position"] = float(steps)
+            device.send_event("position")
+        device = self.add_device(name,
+                                 {"position": float(position), "slewrate": 0., "acceleration": 0., "cwlimit": False, "ccwlimit": False},
+                                 {"stopmove": lambda device, _: None,
+                                  "setstepposition": set_step_position,
+                                  "movetocwlimit": lambda device, _: device.write("position", 0.),
+                                  "movetoccwlimit": lambda device, _: device.write("position", 0.)},
+                                 events=events)
+        device.on_write["position"] = lambda: device.set_state(DevState.MOVING)
+        device.after_write["position"] = lambda: device.set_state(DevState.ON)
+        return device
+
+    def add_gripper(self, name, value=0, events=False):
+        """adds a simulated register for the gripper"""
+        return self.add_device(name, {"value": value}, events=events)
+
+    def push_events(self):
+        """delivers all queued events in the order they happened and returns how many there were"""
+        events, self.pending_events = self.pending_events, []
+        for callback, event in events:
+            callback(event)
+        return len(events)
+
+    def reset_counts(self):
+        self.round_trips = 0
+        self.calls.clear()
+
+    def device(self, name):
+        return self.devices[name.lower()]
+
+    def request(self, target, request):
+        """counts a round trip to a device or group"""
+        self.round_trips += 1
+        self.calls[(target, request)] += 1
+
+    def DeviceProxy(self, name):
+        """factory that replaces tango.DeviceProxy"""
+        return MockDeviceProxy(self, name)
+
+    def Group(self, name):
+        """factory that replaces tango.Group"""
+        return MockGroup(self, name)
+
+
+class MockDevice:
+    """state of a simulated device"""
+    def __init__(self, server, name, attributes, commands=None, state=DevState.ON, events=False):
+        self.server = server
+        self.name = name
+        self.attributes = {attribute.lower(): value for attribute, value in attributes.items()}
+        self.commands = {command.lower(): function for command, function in (commands or {}).items()}
+        self.state = state
+        self.events = events
+        # attribute: functions without arguments called before and after the attribute is written, to simulate side effects
+        self.on_write = {}
+        self.after_write = {}
+        # subscription id: (attribute, callback)
+        self.subscriptions = {}
+
+    def read(self, attribute):
+        # like on a real device the state can also be read as an attribute
+        if attribute.lower() == "state":
+            return self.state
+        return self.attributes[attribute.lower()]
+
+    def write(self, attribute, value):
+        attribute = attribute.lower()
+        if attribute not in self.attributes:
+            raise AttributeError("{} has no attribute {}".format(self.name, attribute))
+        if attribute in self.on_write:
+            self.on_write[attribute]()
+        changed = self.attributes[attribute] != value
+        self.attributes[attribute] = value
+        if changed:
+            self.send_event(attribute)
+        if attribute in self.after_write:
+            self.after_write[attribute]()
+
+    def set_state(self, state):
+        if state != self.state:
+            self.state = state
+            self.send_event("state")
+
+    def send_event(self, attribute):
+        """queues a change event with the current value of the attribute for its subscribers, see MockTango.push_events"""
+        for subscribed_attribute, callback in self.subscriptions.values():
+            if subscribed_attribute == attribute.lower():
+                self.server.pending_events.append((callback, EventData(self.name, attribute, DeviceAttribute(attribute, self.read(attribute)))))
+
+    def command(self, command, argument=None):
+        return self.commands[command.lower()](self, argument)
+
+
+class DeviceAttribute:
+    """the part of tango.DeviceAttribute the hardware uses"""
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+
+class EventData:
+    """the part of tango.EventData the hardware uses"""
+    def __init__(self, device_name, attribute, attr_value, errors=()):
+        self.device = device_name
+        self.attr_name = "{}/{}".format(device_name, attribute)
+        self.attr_value = attr_value
+        self.errors = errors
+        self.err = bool(errors)
+
+
+class MockDeviceProxy:
+    """
+    replaces tango.DeviceProxy for a device of a MockTango. Attributes and commands can be used like on a real proxy,
+    e.g. proxy.position = 3 or proxy.StopMove(), and every access counts as a round trip
+    """
+    def __init__(self, server, name):
+        object.__setattr__(self, "_server", server)
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_device", server.device(name))
+
+    def name(self):
+        return self._name
+
+    def state(self):
+        self._server.request(self._name, "state")
+        return self._device.state
+
+    def read_attribute(self, attribute):
+        self._server.request(self._name, "read_attribute")
+        return DeviceAttribute(attribute, self._device.read(attribute))
+
+    def read_attributes(self, attributes):
+        self._server.request(self._name, "read_attributes")
+        return [DeviceAttribute(attribute, self._device.read(attribute)) for attribute in attributes]
+
+    def write_attribute(self, attribute, value):
+        self._server.request(self._name, "write_attribute")
+        self._device.write(attribute, value)
+
+    def write_attributes(self, attribute_values):
+        """:param attribute_values: list of (attribute name, value)"""
+        self._server.request(self._name, "write_attributes")
+        for attribute, value in attribute_values:
+            self._device.write(attribute, value)
+
+    def command_inout(self, command, argument=None):
+        self._server.request(self._name, "command_inout")
+        return self._device.command(command, argument)
+
+    def subscribe_event(self, attribute, event_type, callback):
+        """
+        subscribes to change events of an attribute. Like a real proxy it sends an event with the current value right away
+        :raises DevFailed: if the device doesn't send events
+        :return: id of the subscription for unsubscribe_event
+        """
+        self._server.request(self._name, "subscribe_event")
+        if not self._device.events or event_type != EventType.CHANGE_EVENT:
+            raise DevFailed("no change event configured for {}/{}".format(self._name, attribute))
+        subscription_id = len(self._device.subscriptions) + 1
+        while subscription_id in self._device.subscriptions:
+            subscription_id += 1
+        self._device.subscriptions[subscription_id] = (attribute.lower(), callback)
+        self._device.send_event(attribute)
+        return subscription_id
+
+    def unsubscribe_event(self, subscription_id):
+        self._server.request(self._name, "unsubscribe_event")
+        del self._device.subscriptions[subscription_id]
+
+    def __getattr__(self, name):
+        if name.lower() in self._device.commands:
+            return lambda argument=None: self.command_inout(name, argument)
+        return self.read_attribute(name).value
+
+    def __setattr__(self, name, value):
+        self.write_attribute(name, value)
+
+
+class GroupReply:
+    """the part of tango.GroupAttrReply and tango.GroupCmdReply the hardware uses"""
+    def __init__(self, device_name, data=None, error=None):
+        self._device_name = device_name
+        self._data = data
+        self._error = error
+
+    def dev_name(self):
+        return self._device_name
+
+    def has_failed(self):
+        return self._error is not None
+
+    def get_err_stack(self):
+        return [self._error] if self._error is not None else []
+
+    def get_data(self):
+        return self._data
+
+
+class MockGroup:
+    """
+    replaces tango.Group for devices of a MockTango. Every call goes to all devices in the order they were added and counts as one round trip.
+    Like on a real group failures don't raise, they are reported in the replies
+    """
+    def __init__(self, server, name):
+        self._server = server
+        self._name = name
+        self._device_names = []
+
+    def add(self, device_name):
+        self._device_names.append(device_name)
+
+    def get_device_list(self):
+        return list(self._device_names)
+
+    def get_size(self):
+        return len(self._device_names)
+
+    def _reply(self, device_name, function):
+        try:
+            return GroupReply(device_name, function(self._server.device(device_name)))
+        except (AttributeError, KeyError) as error:
+            return GroupReply(device_name, error=error)
+
+    def read_attribute(self, attribute):
+        self._server.request(self._name, "read_attribute")
+        return [self._reply(device_name, lambda device: DeviceAttribute(attribute, device.read(attribute))) for device_name in self._device_names]
+
+    def read_attributes(self, attributes):
+        """returns the replies for all attributes of the first device, then for all attributes of the second device and so on"""
+        self._server.request(self._name, "read_attributes")
+        return [self._reply(device_name, lambda device: DeviceAttribute(attribute, device.read(attribute)))
+                for device_name in self._device_names for attribute in attributes]
+
+    def write_attribute(self, attribute, value, multi=False):
+        """writes value to all devices or, if multi is True, the values in value to the devices in order"""
+        self._server.request(self._name, "write_attribute")
+        values = value if multi else [value] * len(self._device_names)
+        return [self._reply(device_name, lambda device: device.write(attribute, device_value)) for device_name, device_value in zip(self._device_names, values)]
+
+    def command_inout(self, command, argument=None):
+        self._server.request(self._name, "command_inout")
+        return [self._reply(device_name, lambda device: device.command(command, argument)) for device_name in self._device_names]
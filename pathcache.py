@@ -0,0 +1,100 @@
+import collections
+
+import numpy as np
+
+import pathfinder
+
+
+class PathCache:
+    """
+    Bounded least recently used cache for the paths of moves
+
+    Paths are stored under the start and target position rounded to "quantization" and a fingerprint of the obstacles close to the straight line
+    between them (the corridor). Obstacles further away don't change the key, so moving a beamstop on the other side of the absorber doesn't throw away
+    the paths of unrelated moves. Because a path can leave the corridor, every path taken from the cache is checked against all obstacles again before it is returned.
+    Moves without a path are stored under a fingerprint of all obstacles instead, because any obstacle could have been the reason there was no path.
+    """
+    def __init__(self, max_size, quantization, corridor_width):
+        """
+        :param max_size: maximum number of entries. When it is exceeded the least recently used entry is dropped
+        :param quantization: positions closer than this are considered the same
+        :param corridor_width: obstacles within this distance of the straight line from start to target are part of the key
+        """
+        self.max_size = max_size
+        self.quantization = quantization
+        self.corridor_width = corridor_width
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+    def get(self, start, target, obstacles, radius, obstacle_index=None):
+        """
+        Looks up the path from start to target around obstacles
+
+        :param start: start position of the move as [x, y]
+        :param target: target position of the move as [x, y]
+        :param obstacles: all obstacles of the move in the format [[x, y], [x, y], ...]
+        :param radius: distance the path has to keep from the obstacles
+        :param obstacle_index: optional spatialindex.ObstacleGrid (or view of one) over the obstacles
+        :return: tuple (found, path). If found is True path is the cached path (which is None for moves without a path), otherwise path is None
+        """
+        obstacles = np.asarray(obstacles, dtype=float).reshape(-1, 2)
+        path_key = self._path_key(start, target, obstacles, obstacle_index)
+        if path_key in self._entries:
+            path = self._fit_path(self._entries[path_key], start, target)
+            # obstacles outside the corridor aren't part of the key, so we need to make sure they aren't in the way
+            lines = np.stack([path[:-1], path[1:]], axis=1)
+            if not np.any(pathfinder.find_collisions_batch(lines, obstacles, radius, obstacle_index)):
+                self._entries.move_to_end(path_key)
+                self.hits += 1
+                return True, path
+        no_path_key = self._no_path_key(start, target, obstacles)
+        if no_path_key in self._entries:
+            self._entries.move_to_end(no_path_key)
+            self.hits += 1
+            return True, None
+        self.misses += 1
+        return False, None
+
+    def put(self, start, target, obstacles, path, obstacle_index=None):
+        """stores a path (or None if there is none) from start to target which includes start and target as first and last point"""
+        obstacles = np.asarray(obstacles, dtype=float).reshape(-1, 2)
+        if path is None:
+            key = self._no_path_key(start, target, obstacles)
+        else:
+            key = self._path_key(start, target, obstacles, obstacle_index)
+            path = np.array(path, dtype=float)
+        self._entries[key] = path
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _quantize(self, points):
+        return np.round(np.asarray(points, dtype=float) / self.quantization).astype(np.int64)
+
+    def _fingerprint(self, obstacles):
+        """hash of the quantized obstacles which doesn't depend on their order"""
+        quantized = self._quantize(obstacles).reshape(-1, 2)
+        quantized = quantized[np.lexsort((quantized[:, 1], quantized[:, 0]))]
+        return hash(quantized.tobytes())
+
+    def _path_key(self, start, target, obstacles, obstacle_index):
+        corridor = pathfinder.find_collisions(np.array([start, target], dtype=float), obstacles, self.corridor_width, obstacle_index)
+        return "path", tuple(self._quantize(start)), tuple(self._quantize(target)), self._fingerprint(obstacles[corridor])
+
+    def _no_path_key(self, start, target, obstacles):
+        return "no path", tuple(self._quantize(start)), tuple(self._quantize(target)), self._fingerprint(obstacles)
+
+    @staticmethod
+    def _fit_path(path, start, target):
+        """replaces the first and last point of a cached path with the exact start and target, which can differ by up to the quantization"""
+        path = path.copy()
+        path[0] = start
+        path[-1] = target
+        return path
@@ -1,90 +1,180 @@
-import absorberfunctions
+import heapq
+import math
+
 import numpy as np
 
 
-def find_path(starting_point, final_destination, obstacles, radius, absorber_limits):
+def find_path(starting_point, final_destination, obstacles, radius, absorber_limits, obstacle_index=None, polygon_order=0, cost_model=None, budget=None):
     """
-    Always finds an optimal path around a set of circular obstacles if there is one. (Except: see to do in docstring)
+    Always finds an optimal path around a set of circular obstacles if there is one. (Except: see the notes on polygon_order and the to do below)
 
     Because no circular paths are supported the obstacles are treated like circles for the collision detection but as squares for the circumventing paths.
+    If polygon_order is set, regular polygons with that many corners and the points where lines from the start and the final destination touch the circles
+    are used instead of the squares (see find_obstacle_tangent_points). This finds paths that are closer to the true shortest path and have less waypoints but needs more collision checks.
+
+    The search is an A* search over a visibility graph that is discovered while searching:
+    The graph starts out with only the start and the final destination as nodes. Whenever a straight line between two nodes is blocked,
+    the corners of the obstacles in the way are added as new nodes. Nodes are expanded in the order of their path length plus the straight distance
+    to the final destination, so the first time the final destination gets expanded the path to it is the shortest one through the known nodes.
+    Every combination of nodes is only checked for collisions once, the results are kept in a dictionary.
 
-    The principle is to start with a path which contains only the start and a destination which is only the final destination,
-    then draw a path between start and end, check for obstacles and add the corners of the obstacles if any are found as possible destinations.
-    If no obstacles are detected save path with the new endpoint "end" as a new path.
-    Repeat with each start and end where start is the last point of any found path and end is any destination.
+    polygon_order trades completeness against speed: with the squares (0) a gap between two circles can be missed when a corner of the square
+    around one circle lies inside the other circle, so the circumvention goes through it. Polygons with more corners hug the circles closer
+    and find paths through such narrow gaps, at the cost of more nodes and collision checks. The config value is PeakAbsorber.pathfinder_polygon_order.
 
-    TODO: 1. performance is very poor due to the principle of the algorithm but it might be possible to make some improvements
-    TODO: 2. in an edge case where there is space between two circles but the corners of a corresponding rectangle intersects
-    TODO:       with the other circle the path may not be found because the circumvention around the rectangle will go through the nearby circle. One could increase to hexa/octagons or higher if needed
-    TODO: 3. to get a valid path it needs to be away from the forbidden areas and not touch it. How far should that be? See Todo below
+    TODO: to get a valid path it needs to be away from the forbidden areas and not touch it. How far should that be? See Todo below
 
     :param starting_point: point from which the path should start. There may not be an obstacle within "radius" of this point. Format [x, y]
     :param final_destination: point to which the path should go. There may not be an obstacle within "radius" of this point. Format [x, y]
     :param obstacles: List of points which may not be approached to less than "radius" by the path. Format [[x, y], [x, y], ...]
     :param radius: radius of the circular obstacles to circumvent. single skalar
     :param absorber_limits: limits over which the path should not go. Lower limits are always 0,0. Format [max_x, max_y]
-    :return: list of points which form a path which does not come within radius of any of the obstacles. Including start and end point. Format [[x, y], [x, y] ...] if a path was found, [None] otherwise
+    :param obstacle_index: optional spatialindex.ObstacleGrid (or view of one) over the obstacles to only check the obstacles close to each line
+    :param polygon_order: number of corners of the regular polygons the paths go around the obstacles on, at least 3.
+        0 uses squares and no tangent points, which is the fastest but can miss paths through narrow gaps
+    :param cost_model: optional kinematics.MotionModel. If given the path with the shortest duration is searched instead of the shortest path.
+        Every corner of the path then costs the time the motors need to stop and start again
+    :param budget: optional budget.SearchBudget. When it runs out the search stops and returns the best path it found so far, which is valid but might not be the shortest
+    :return: list of points which form a path which does not come within radius of any of the obstacles. Including start and end point. Format [[x, y], [x, y] ...] if a path was found, None otherwise
     """
-    # lists with point cascade and length
-    paths = [[[starting_point], 0]]
-    # lists with destination and shortest path to it
-    destinations = [[final_destination, [None]]]
-    # list of start/end combos that were already checked
-    checked = []
-    # always contains the shortest path found to final_destination
-    to_destination = destinations[0][1]
-    progress = True
-
-    while progress:
-        # breaks the while loop if no new destinations or paths could be found in the last round
-        progress = False
-
-        for path_index, path in enumerate(paths):
-            # if the path we're looking at is already longer than the shortest one to destination we don't care
-            if to_destination[0] is not None and path[1] >= to_destination[1]:
-                continue
-
-            start = np.array(path[0][-1])
-            for destination_index, destination in enumerate(destinations):
-                end = np.array(destination[0])
-
-                # fancy way of writing "if end in path[0] or [start, end] in checked" to make numpy happy which doesnt like the "in" operator
-                if np.any(np.equal(end, path[0]).all(1)) or (checked and np.any(np.equal(checked, [start, end]).all((1, 2)))):
-                    continue
-                checked.append([start, end])
+    obstacles = np.asarray(obstacles, dtype=float).reshape(-1, 2)
+    if cost_model is None:
+        cost = estimate = _distance
+    else:
+        cost = cost_model.segment_time
+        estimate = cost_model.min_time
+    # every point that was found so far. The index in this list is used as the node number everywhere else. Node 0 is the start and node 1 the final destination
+    nodes = [np.asarray(starting_point, dtype=float), np.asarray(final_destination, dtype=float)]
+    # maps the coordinates of a point to its node number to quickly find out if a corner is already known
+    node_numbers = {tuple(nodes[0]): 0, tuple(nodes[1]): 1}
+    # shortest known path length to each node and the node we came from on that path
+    path_lengths = {0: 0}
+    parents = {0: None}
+    # nodes that were expanded with their current path length
+    closed = set()
+    # results of the collision checks for every combination of nodes. Contains the new corners if the line was blocked or an empty array if it was free
+    checked = {}
+    # corners found for each combination of obstacles in the way
+    corners = {(): np.empty((0, 2))}
+    # heap of [path length + distance to destination, counter, node]. The counter keeps the order of nodes with equal values stable
+    frontier = [(estimate(nodes[0], nodes[1]), 0, 0)]
+    counter = 1
+
+    while frontier:
+        _, _, node = heapq.heappop(frontier)
+        if node == 1:
+            break
+        if node in closed:
+            continue
+        if budget is not None and not budget.spend():
+            break
+        closed.add(node)
 
-                # if this destination was already reached with a shorter pathlength we don't care
-                new_pathlength = path[1] + absorberfunctions.calc_vec_len(end-start)
-                if destination[1][0] is not None and destination[1][1] < new_pathlength:
+        # every node that is not closed is a possible destination. Nodes found while checking the lines are added to the end of the list and
+        # are checked against every closed node including the one currently expanded
+        edges = [(node, destination) for destination in range(len(nodes)) if destination not in closed]
+        while edges:
+            # a single expansion can add a lot of nodes, so the time is checked here as well
+            if budget is not None and not budget.spend(0):
+                break
+            # check all lines that aren't already known and might still lead to a shorter path at once
+            unchecked = [(start, end) for start, end in edges if (start, end) not in checked and _might_improve(start, end, nodes, path_lengths, cost, estimate)]
+            if unchecked:
+                collisions = find_collisions_batch([[nodes[start], nodes[end]] for start, end in unchecked], obstacles, radius, obstacle_index)
+                for (start, end), obstacles_in_the_way in zip(unchecked, collisions):
+                    # the corners only depend on which obstacles are in the way, and many lines are blocked by the same obstacles
+                    blocking = tuple(np.flatnonzero(obstacles_in_the_way))
+                    if blocking not in corners and polygon_order:
+                        corners[blocking] = find_obstacle_tangent_points([nodes[start], nodes[end]], obstacles, radius, absorber_limits, polygon_order, obstacle_index, obstacles_in_the_way, nodes[:2])
+                    elif blocking not in corners:
+                        corners[blocking] = find_obstacle_corners([nodes[start], nodes[end]], obstacles, radius, absorber_limits, obstacle_index, obstacles_in_the_way)
+                    checked[(start, end)] = checked[(end, start)] = corners[blocking]
+
+            new_edges = []
+            for start, end in edges:
+                if not _might_improve(start, end, nodes, path_lengths, cost, estimate):
+                    continue
+                # if we found an obstacle on the line we add its corners as new nodes (if they're not already in there)
+                for corner in checked[(start, end)]:
+                    if tuple(corner) in node_numbers:
+                        continue
+                    node_numbers[tuple(corner)] = len(nodes)
+                    nodes.append(corner)
+                    new_edges.extend((closed_node, len(nodes) - 1) for closed_node in closed)
+                if checked[(start, end)].size:
                     continue
 
-                progress = True
-
-                obstacle_corners = find_obstacle_corners([start, end], obstacles, radius, absorber_limits)
-
-                # if we found an obstacle on the line we just add the corners of the obstacle to the destinations (if it's not already in there)
-                for corner in obstacle_corners:
-                    for destination_contained in destinations:
-                        if np.all(destination_contained[0] == corner):
-                            break
-                    else:
-                        destinations.append([corner, [None]])
-
-                if not obstacle_corners.size:
-                    # if we found a path to a destination that has been reached before with a longer path we overwrite the values in that path with our better ones
-                    # the reason to overwrite the values rather than the whole list is to keep any references to this list intact
-                    if destination[1][0] is not None:
-                        destination[1][0] = path[0]+[end]
-                        destination[1][1] = new_pathlength
-                    # if this is a not previously reached destination we add our new path and insert a reference to it into the destination
-                    else:
-                        paths.append([path[0]+[end], new_pathlength])
-                        destination[1][0] = paths[-1][0]
-                        destination[1].append(paths[-1][1])
-    return to_destination[0]
-
-
-def find_obstacle_corners(line, obstacles, radius, absorber_limits):
+                # the line is free so we found a new shortest path to "end". If it was expanded before it has to be expanded again with the shorter path
+                path_lengths[end] = path_lengths[start] + cost(nodes[start], nodes[end])
+                parents[end] = start
+                closed.discard(end)
+                heapq.heappush(frontier, (path_lengths[end] + estimate(nodes[end], nodes[1]), counter, end))
+                counter += 1
+            edges = new_edges
+        if budget is not None and budget.exhausted:
+            break
+
+    if 1 not in parents:
+        return None
+    # walk back along the parents to the start
+    path = []
+    node = 1
+    while node is not None:
+        path.append(nodes[node])
+        node = parents[node]
+    return path[::-1]
+
+
+def _distance(point1, point2):
+    return math.hypot(point2[0] - point1[0], point2[1] - point1[1])
+
+
+def _might_improve(start, end, nodes, path_lengths, cost=_distance, estimate=_distance):
+    """
+    checks if going from start to end could give a shorter path to end and a path to the final destination (node 1) which is shorter than the known one.
+    cost is the cost of the line from start to end and estimate a lower bound of the remaining cost to the final destination
+    """
+    new_pathlength = path_lengths[start] + cost(nodes[start], nodes[end])
+    if end in path_lengths and path_lengths[end] <= new_pathlength:
+        return False
+    return 1 not in path_lengths or new_pathlength + estimate(nodes[end], nodes[1]) < path_lengths[1]
+
+
+def shortcut_path(path, obstacles, radius, absorber_limits, obstacle_index=None):
+    """
+    Removes waypoints from a path as long as the straight lines that replace them stay clear of the obstacles and inside the limits
+
+    Starting at the first point, the path jumps to the last point that can be reached in a straight line and continues from there.
+    All lines from one point to the points after it are checked in one go. The first and last point are always kept and if no shortcut is possible
+    the original line to the next point is used, so the result is never worse than the input.
+    :param path: path as list of points [[x, y], [x, y], ...] including start and end
+    :param obstacles: points of the obstacles in the format [[obstacle1x, obstacle1y], [obstacle2x, obstacle2y],... ]
+    :param radius: distance the path has to keep from the obstacles
+    :param absorber_limits: the limits of the peakabsorber as [max_x, max_y]. Points outside of them are never used as ends of shortcuts
+    :param obstacle_index: optional spatialindex.ObstacleGrid (or view of one) over the obstacles
+    :return: list of points of the shortened path
+    """
+    path = np.asarray(path, dtype=float).reshape(-1, 2)
+    if len(path) < 3:
+        return list(path)
+    # a line between two points inside the rectangle of the limits is also completely inside it
+    inside = np.all([path[:, 0] >= 0, path[:, 1] >= 0, path[:, 0] <= absorber_limits[0], path[:, 1] <= absorber_limits[1]], axis=0)
+    shortened = [path[0]]
+    current = 0
+    while current < len(path) - 1:
+        candidates = np.arange(current + 2, len(path))
+        if inside[current]:
+            candidates = candidates[inside[candidates]]
+        else:
+            candidates = candidates[:0]
+        lines = np.stack([np.broadcast_to(path[current], (len(candidates), 2)), path[candidates]], axis=1)
+        free = np.logical_not(np.any(find_collisions_batch(lines, obstacles, radius, obstacle_index), axis=1))
+        current = candidates[free][-1] if np.any(free) else current + 1
+        shortened.append(path[current])
+    return shortened
+
+
+def find_obstacle_corners(line, obstacles, radius, absorber_limits, obstacle_index=None, obstacles_in_the_way=None):
     """
     Checks which obstacles are crossed by the line and returns corners of the squares around them
 
@@ -92,6 +182,8 @@ def find_obstacle_corners(line, obstacles, radius, absorber_limits):
     :param obstacles: points of the obstacles in the format [[obstacle1x, obstacle1y], [obstacle2x, obstacle2y],... ]
     :param radius: the radius of the obstacles, single scalar value
     :param absorber_limits: limits of the absorber in x and y direction as [limitx, limity]
+    :param obstacle_index: optional spatialindex.ObstacleGrid (or view of one) over the obstacles to only check the obstacles close to the line and corners
+    :param obstacles_in_the_way: result of find_collisions for this line if it was already calculated
     :return corners of the squares around the circles that intersect with the line
     """
 
@@ -100,7 +192,8 @@ def find_obstacle_corners(line, obstacles, radius, absorber_limits):
     square_radius = radius+extra_around
 
     # find all obstacles the line directly crosses (outputs boolean mask)
-    obstacles_in_the_way = find_collisions(line, obstacles, radius)
+    if obstacles_in_the_way is None:
+        obstacles_in_the_way = find_collisions(line, obstacles, radius, obstacle_index)
 
     # boolean mask, every checked obstacle gets a True here
     obstacles_checked = np.zeros(len(obstacles), dtype=bool)
@@ -115,15 +208,21 @@ def find_obstacle_corners(line, obstacles, radius, absorber_limits):
         obstacles_in_the_way = np.zeros(len(obstacles), dtype=bool)
 
         for beamstop, corners in zip(new_corner_beamstops, new_corners):
-            for corner in corners:
-                # TODO: fix extra_around/10, this is that things that almost line up are still registered as intersecting,
-                #  this is ok because the distance around which we remove points here is less than the tolerance added around the square so we still get around the circles
-                on_the_corner = np.all(np.hstack([corner <= obstacles+(square_radius+extra_around/10), corner >= obstacles-(square_radius+extra_around/10)]), axis=1)
-                # don't redo the beamstop the corner came from
-                on_the_corner[beamstop] = False
-                if np.any(on_the_corner):
+            # TODO: fix extra_around/10, this is that things that almost line up are still registered as intersecting,
+            #  this is ok because the distance around which we remove points here is less than the tolerance added around the square so we still get around the circles
+            corner_check_radius = square_radius+extra_around/10
+            if obstacle_index is None:
+                candidates = np.arange(len(obstacles))
+            else:
+                candidates = obstacle_index.query_box(corners.min(axis=0)-corner_check_radius, corners.max(axis=0)+corner_check_radius)
+            # don't redo the beamstop the corner came from
+            candidates = candidates[np.isin(candidates, beamstop, invert=True)]
+            # check all corners against all candidates at once. One row per corner with one bool per candidate
+            on_the_corner = np.all(np.abs(corners[:, np.newaxis]-obstacles[candidates]) <= corner_check_radius, axis=2)
+            for corner, corner_on_obstacles in zip(corners, on_the_corner):
+                if np.any(corner_on_obstacles):
                     # if the corner intersects with another beamstops square mark it as new thing to check
-                    obstacles_in_the_way = np.logical_or(on_the_corner, obstacles_in_the_way)
+                    obstacles_in_the_way[candidates[corner_on_obstacles]] = True
                 else:
                     # if the corner is free it is an outside corner we use to go around the obstacle later
                     obstacle_corners.append(corner)
@@ -137,36 +236,138 @@ def find_obstacle_corners(line, obstacles, radius, absorber_limits):
     return obstacle_corners[np.all([obstacle_corners[:, 0] > 0, obstacle_corners[:, 1] > 0, obstacle_corners[:, 0] < absorber_limits[0], obstacle_corners[:, 1] < absorber_limits[1]], axis=0)]
 
 
+def find_obstacle_tangent_points(line, obstacles, radius, absorber_limits, polygon_order, obstacle_index=None, obstacles_in_the_way=None, tangent_origins=None):
+    """
+    Checks which obstacles are crossed by the line and returns points to go around them
+
+    The points are the corners of regular polygons with polygon_order corners around the circles, which are big enough for their sides to pass the circles,
+    and the points where lines starting at the tangent origins touch the circles. Like in find_obstacle_corners, points that are too close to another obstacle
+    are dropped and the points around that obstacle are added instead.
+    The tangent points make the first and last line of a path hug the circles exactly, between circles the polygon corners are used.
+
+    :param line: the line which should be checked in the format [[startx, starty], [endx, endy]]
+    :param obstacles: points of the obstacles in the format [[obstacle1x, obstacle1y], [obstacle2x, obstacle2y],... ]
+    :param radius: the radius of the obstacles, single scalar value
+    :param absorber_limits: limits of the absorber in x and y direction as [limitx, limity]
+    :param polygon_order: number of corners of the polygons, at least 3
+    :param obstacle_index: optional spatialindex.ObstacleGrid (or view of one) over the obstacles to only check the obstacles close to the line and points
+    :param obstacles_in_the_way: result of find_collisions for this line if it was already calculated
+    :param tangent_origins: points from which the tangents to the circles are calculated in the format [[x, y], [x, y], ...]. Defaults to the ends of the line
+    :return points around the circles that intersect with the line in the format [[x, y], [x, y], ...]
+    """
+    # extra space around the circles so the paths pass them without touching, same as in find_obstacle_corners
+    extra_around = 0.001
+    tangent_radius = radius+extra_around
+    point_check_radius = radius+extra_around/10
+    line = np.asarray(line, dtype=float)
+    if tangent_origins is None:
+        tangent_origins = line
+
+    if obstacles_in_the_way is None:
+        obstacles_in_the_way = find_collisions(line, obstacles, radius, obstacle_index)
+    # corners of a polygon around the origin which has the circle with tangent_radius as incircle
+    angles = 2*np.pi*np.arange(polygon_order)/polygon_order + np.pi/polygon_order
+    polygon = tangent_radius/np.cos(np.pi/polygon_order)*np.stack([np.cos(angles), np.sin(angles)], axis=1)
+
+    obstacles_checked = np.zeros(len(obstacles), dtype=bool)
+    points = []
+    while np.any(obstacles_in_the_way):
+        new_obstacles = np.flatnonzero(obstacles_in_the_way)
+        obstacles_checked[new_obstacles] = True
+        centers = obstacles[new_obstacles]
+
+        # polygon corners and tangent points, together with the obstacle they belong to
+        new_points = [(centers[:, np.newaxis]+polygon).reshape(-1, 2)]
+        point_obstacles = [np.repeat(new_obstacles, polygon_order)]
+        for tangent_origin in tangent_origins:
+            to_end = tangent_origin-centers
+            distances = np.hypot(to_end[:, 0], to_end[:, 1])
+            outside = distances > tangent_radius
+            base_angles = np.arctan2(to_end[outside, 1], to_end[outside, 0])
+            opening_angles = np.arccos(tangent_radius/distances[outside])
+            for side in [-1, 1]:
+                tangent_angles = base_angles+side*opening_angles
+                new_points.append(centers[outside]+tangent_radius*np.stack([np.cos(tangent_angles), np.sin(tangent_angles)], axis=1))
+                point_obstacles.append(new_obstacles[outside])
+        new_points = np.concatenate(new_points)
+        point_obstacles = np.concatenate(point_obstacles)
+
+        # check all points against all obstacles close to them, leaving out the obstacle they came from
+        if obstacle_index is None:
+            candidates = np.arange(len(obstacles))
+        else:
+            candidates = obstacle_index.query_box(new_points.min(axis=0)-point_check_radius, new_points.max(axis=0)+point_check_radius)
+        offsets = new_points[:, np.newaxis]-obstacles[candidates]
+        on_obstacles = np.sum(offsets*offsets, axis=2) <= point_check_radius**2
+        on_obstacles[point_obstacles[:, np.newaxis] == candidates] = False
+
+        # points inside another obstacle are dropped and that obstacle is checked next round
+        obstacles_in_the_way = np.zeros(len(obstacles), dtype=bool)
+        obstacles_in_the_way[candidates[np.any(on_obstacles, axis=0)]] = True
+        obstacles_in_the_way[obstacles_checked] = False
+        points.append(new_points[np.logical_not(np.any(on_obstacles, axis=1))])
+
+    if not points:
+        return np.empty((0, 2))
+    points = np.concatenate(points)
+    # return all points that are within the peakabsorber limits
+    return points[np.all([points[:, 0] > 0, points[:, 1] > 0, points[:, 0] < absorber_limits[0], points[:, 1] < absorber_limits[1]], axis=0)]
+
+
 def get_corners(middle, radius):
     # compile a list of corners of a square around the circle with edge length 2radius
     return np.swapaxes([middle+[radius, radius], middle+[radius, -radius], middle+[-radius, radius], middle+[-radius, -radius]], 0, 1)
 
 
-def find_collisions(line, obstacles, radius):
+def find_collisions(line, obstacles, radius, obstacle_index=None):
     """
-    Checks for obstacles crossed by the given lines
-    based on https://codereview.stackexchange.com/questions/86421/line-segment-to-circle-collision-algorithm
+    Checks for obstacles crossed by the given line. This is find_collisions_batch for a single line
 
     Obstacles are circles with the center at their point and a radius of radius.
-    The output contains all square corners inside the specified absorber limits and above zero.
     :param line: the line which should be checked in the format [[startx, starty], [endx, endy]]
     :param obstacles: points of the obstacles in the format [[obstacle1x, obstacle1y], [obstacle2x, obstacle2y],... ]
     :param radius: the radius of the obstacles, single scalar value
+    :param obstacle_index: optional spatialindex.ObstacleGrid (or view of one) over the obstacles. If given only the obstacles close to the line are checked
     :return: list with a bool for each obstacle which is true for obstacles that are crossed by or touching the line and false for the others
     """
-    line_vector = line[1] - line[0]
-    # calculate coefficients for quadratic equation
-    a = np.dot(line_vector, line_vector)
-    b = 2 * np.dot(line[0] - obstacles, line_vector)
-    c = np.dot(line[0], line[0]) + (obstacles * obstacles).sum(1) - 2 * np.dot(obstacles, line[0]) - radius ** 2
-    # disable warnings for invalid operations that prodduce NaNs as this is entirely normal here
-    np_error_setting = np.seterr(invalid="ignore")
-    # calculate portion inside the square root. If there are no solutions (numpy returns NaN) the vector doesn't hit the circle, even when extended to an infinte line
-    sqrt_discriminant = np.sqrt(b ** 2 - 4 * a * c)
-    # calculate solutions
-    solution1 = (-b + sqrt_discriminant) / (2 * a)
-    solution2 = (-b - sqrt_discriminant) / (2 * a)
-    # if either of these is between 0 and 1 the line segment intersects with (or touches) the circle. This returns a list of bools and uses this to index the colliding obstacles
-    in_the_way = np.any([np.all([0 <= solution1, solution1 <= 1], axis=0), np.all([0 <= solution2, solution2 <= 1], axis=0)], axis=0)
-    np.seterr(invalid=np_error_setting["invalid"])
+    return find_collisions_batch([line], obstacles, radius, obstacle_index)[0]
+
+
+def find_collisions_batch(lines, obstacles, radius, obstacle_index=None):
+    """
+    Checks many lines against many circular obstacles at once
+
+    For every combination of line and obstacle the point on the line closest to the obstacle is calculated by projecting the obstacle onto the line
+    and clamping the result to the ends of the line. An obstacle is in the way if the squared distance to that point is at most radius**2.
+    This needs no square roots and produces no NaNs, also not for lines of length zero, which are treated as a single point.
+    :param lines: the lines to check in the format [[[startx, starty], [endx, endy]], [[startx, starty], [endx, endy]], ...]
+    :param obstacles: points of the obstacles in the format [[obstacle1x, obstacle1y], [obstacle2x, obstacle2y],... ]
+    :param radius: the radius of the obstacles, single scalar value
+    :param obstacle_index: optional spatialindex.ObstacleGrid (or view of one) over the obstacles. If given only the obstacles close to any of the lines are checked
+    :return: array of bools with one row per line and one column per obstacle, which is true where the obstacle is crossed by or touches the line
+    """
+    lines = np.asarray(lines, dtype=float).reshape(-1, 2, 2)
+    obstacles = np.asarray(obstacles, dtype=float).reshape(-1, 2)
+    in_the_way = np.zeros((len(lines), len(obstacles)), dtype=bool)
+    if not len(lines) or not len(obstacles):
+        return in_the_way
+
+    if obstacle_index is None:
+        candidates = slice(None)
+    else:
+        candidates = obstacle_index.query_box(lines.min(axis=(0, 1)) - radius, lines.max(axis=(0, 1)) + radius)
+        if not candidates.size:
+            return in_the_way
+
+    line_starts = lines[:, 0]
+    line_vectors = lines[:, 1] - line_starts
+    line_lengths_squared = np.sum(line_vectors * line_vectors, axis=1)[:, np.newaxis]
+    # vectors from the start of every line to every obstacle, shape (lines, obstacles, 2)
+    to_obstacles = obstacles[candidates] - line_starts[:, np.newaxis]
+    # position of the closest point along each line, 0 at the start and 1 at the end
+    projections = np.sum(to_obstacles * line_vectors[:, np.newaxis], axis=2)
+    closest = np.divide(projections, line_lengths_squared, out=np.zeros_like(projections), where=line_lengths_squared > 0)
+    np.clip(closest, 0, 1, out=closest)
+    offsets = to_obstacles - closest[:, :, np.newaxis] * line_vectors[:, np.newaxis]
+    in_the_way[:, candidates] = np.sum(offsets * offsets, axis=2) <= radius ** 2
     return in_the_way
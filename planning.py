@@ -0,0 +1,578 @@
+import collections
+import concurrent.futures
+import logging
+
+import numpy as np
+import scipy.spatial
+
+import assignment
+import budget
+import collisiondetection
+import errors
+import kinematics
+import pathcache
+import pathfinder
+import roadmap
+import scheduling
+import sequencing
+import snapshot
+import spatialindex
+
+
+lg = logging.getLogger("main.planning")
+
+
+def find_move_path(beamstop_pos, target_pos, beamstop_nr, obstacles, spacing, limits, obstacle_index=None, beamstop_roadmap=None, polygon_order=0,
+                   cost_model=None, search_budget=None):
+    """
+    calculates a path for a move, first with the fast greedy algorithm, then on the roadmap and last with the slow but thorough pathfinder.
+    Unnecessary waypoints are removed from the path with pathfinder.shortcut_path
+    :param beamstop_pos: position of the beamstop before the move
+    :param target_pos: position the beamstop should be moved to
+    :param beamstop_nr: number of the moved beamstop. Only used to leave it out on the roadmap
+    :param obstacles: beamstops to not collide with, without the beamstop that is moved
+    :param spacing: distance the path has to keep from the obstacles
+    :param limits: limits of the peak absorber as [max_x, max_y]
+    :param obstacle_index: spatialindex.ObstacleGrid (or view of one) over obstacles
+    :param beamstop_roadmap: roadmap.Roadmap with all beamstops including the moved one as obstacles
+    :param polygon_order: polygon order of the pathfinder, see pathfinder.find_path
+    :param cost_model: kinematics.MotionModel to minimize the duration of the paths of the pathfinder or None to minimize their length
+    :param search_budget: budget.SearchBudget shared by the roadmap and the pathfinder. When it runs out the best path found so far is used
+    :returns: path as list of points including start and target or None if no path was found
+    """
+    # calculate beamstop list which has [x, y, distance_to_current] instead of just [x, y]
+    collision_bs_list = np.append(obstacles, np.linalg.norm(obstacles - beamstop_pos, axis=1)[:, np.newaxis], 1)
+    try:
+        path = np.array(collisiondetection.find_path(target_pos, beamstop_pos, collision_bs_list, spacing, max_multi=30, obstacle_index=obstacle_index))
+        if np.any([path[:, 0] < 0, path[:, 1] < 0, path[:, 0] > limits[0], path[:, 1] > limits[1]]):
+            raise collisiondetection.NoSolutionError("point was outside limits")
+        path = np.concatenate([[beamstop_pos], path])
+    except (collisiondetection.NoSolutionError, ArithmeticError) as error:
+        path = None
+        lg.debug("using fallback algorithm because: %s", str(error))
+    if path is None and beamstop_roadmap is not None:
+        path = beamstop_roadmap.find_path(beamstop_pos, target_pos, beamstop_nr, search_budget)
+        if path is None:
+            lg.debug("no path on the roadmap, searching around the beamstops")
+    if path is None:
+        path = pathfinder.find_path(beamstop_pos, target_pos, obstacles, spacing, limits, obstacle_index, polygon_order, cost_model, search_budget)
+    if path is None:
+        return None
+    # every waypoint is a full stop of the motors, so we drop all the waypoints we can do without
+    shortened = pathfinder.shortcut_path(path, obstacles, spacing, limits, obstacle_index)
+    lg.debug("shortcutting reduced the path from %d to %d points", len(path), len(shortened))
+    return shortened
+
+
+def corridor_changed(path, changed_positions, spacing):
+    """
+    checks whether any of the changed positions is within spacing of the path or of the straight line from its start to its end,
+    i.e. whether the path has to be recalculated after these positions were freed or occupied.
+    An occupied position on the path blocks it, a freed position on the straight line might allow a shorter path
+    """
+    if path is None or not len(changed_positions):
+        return bool(len(changed_positions))
+    path = np.asarray(path, dtype=float)
+    lines = np.concatenate([np.stack([path[:-1], path[1:]], axis=1), [[path[0], path[-1]]]])
+    return bool(np.any(pathfinder.find_collisions_batch(lines, changed_positions, spacing)))
+
+
+# a move of one beamstop as planned by Planner. Positions and paths are read-only arrays.
+# path: points to move along, starting at beamstop_pos and ending at target_pos, or None while no path is known
+# cost: predicted duration of the move in s including the travel of the gripper from the end of the previous move, or None while not known
+PlannedMove = collections.namedtuple("PlannedMove", ["beamstop_nr", "beamstop_pos", "target_pos", "path", "cost"])
+
+# result of Planner.plan
+# moves: PlannedMoves with paths in the order they have to be done in
+# unsolved_moves: PlannedMoves for which no path could be found
+# expected_duration: predicted duration in s of doing all moves and going home
+# cancelled: whether the planning was cancelled. A cancelled plan has no moves
+Plan = collections.namedtuple("Plan", ["moves", "unsolved_moves", "expected_duration", "cancelled"])
+
+
+def _read_only(array):
+    array = np.array(array, dtype=float)
+    array.flags.writeable = False
+    return array
+
+
+class Planner:
+    """
+    Plans the rearrangement of the beamstops to a set of handles without touching the gui or the hardware
+
+    The planner only works on the positions it is given and returns an immutable Plan, so it can run in a worker thread or without a display.
+    Executing the plan is up to BeamstopMover.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.lg = logging.getLogger("main.planning.planner")
+
+        # predicts the durations of the moves. Depending on the config the plan minimizes these durations instead of the distances
+        self.motion_model = kinematics.MotionModel(self.config)
+        if self.config.PeakAbsorber.planning_cost == "time":
+            self.cost_model = self.motion_model
+        elif self.config.PeakAbsorber.planning_cost == "distance":
+            self.cost_model = None
+        else:
+            raise errors.ConfigError("PeakAbsorber.planning_cost", "planning_cost isn't time or distance")
+
+        # assigns the beamstops to the handles and parking positions. It keeps the last assignment to warm start the next one
+        self.assignment = assignment.AssignmentEngine(self.config, self.cost_model)
+        self.path_cache = pathcache.PathCache(self.config.PeakAbsorber.path_cache_size,
+                                              self.config.PeakAbsorber.epsilon,
+                                              self.config.PeakAbsorber.path_cache_corridor)
+        # pool of processes to calculate paths in parallel. Only used if there is more than one planning process
+        self.speculative_planner = None
+        if self.config.PeakAbsorber.planning_processes > 1:
+            self.speculative_planner = SpeculativePlanner(self.config, self.config.PeakAbsorber.planning_processes, self.cost_model)
+
+    def plan(self, handle_positions, beamstops, beamstop_parked, beamstop_roadmap=None, cancelled=None, progress=None):
+        """
+        plans the moves that bring beamstops to all handles and park the remaining beamstops
+        :param handle_positions: positions the beamstops should be moved to. Format [[x, y], [x, y], ...]
+        :param beamstops: current positions of all beamstops
+        :param beamstop_parked: index+1 of the parking position of every beamstop or 0, see BeamstopManager
+        :param beamstop_roadmap: roadmap.Roadmap with beamstops as obstacles. It isn't changed. If this is None a new one is built
+        :param cancelled: function without arguments that returns True if the planning should be cancelled
+        :param progress: function called with (solved move, number of solved moves, number of moves) after every solved move
+        :returns: Plan
+        :raises PlanningError: if the handles are too close to each other or to occupied parking spots or there aren't enough beamstops or parking positions
+        """
+        handle_positions = np.asarray(handle_positions, dtype=float).reshape(-1, 2)
+        beamstops = np.asarray(beamstops, dtype=float).reshape(-1, 2)
+
+        combos, spacing = self.check_spacing(handle_positions)
+        if len(spacing):
+            raise errors.PlanningError("your handles are too close to each other. handle(s)1: {}, handle(s)2: {}, distance(s): {}".format(combos[0], combos[1], spacing))
+
+        self.lg.info("calculating beamstop assignment")
+        targets = self.assign_targets(handle_positions, beamstops, beamstop_parked)
+        required_moves = self.moves_to_targets(beamstops, targets)
+        # every beamstop that isn't assigned to a handle ends up in a parking spot, whether it is already there or not
+        parked = np.ones(len(beamstops), dtype=bool)
+        if len(handle_positions) and len(targets):
+            distances, _ = scipy.spatial.cKDTree(handle_positions).query(targets, distance_upper_bound=self.config.PeakAbsorber.epsilon)
+            parked[np.isfinite(distances)] = False
+        combos, spacing = self.check_spacing(handle_positions, targets[parked])
+        if len(spacing):
+            # the beamstops in these parking spots would collide with the ones moved to the handles
+            raise errors.PlanningError("your handles are too close to occupied parking spots. handle(s): {}, parked beamstop(s): {}, distance(s): {}".format(
+                combos[1], np.nonzero(parked)[0][combos[0] - len(handle_positions)], spacing))
+        if not required_moves:
+            return Plan((), (), 0., False)
+
+        self.lg.info("sorting moves")
+        # sort moves to have as little travel between them as possible. This sorting might be changed in the next step if required to find a path
+        sorted_moves = sequencing.sequence_moves(required_moves, self.config.PeakAbsorber.beamstop_spacing, self.cost_model,
+                                                 budget.SearchBudget(timeout_ms=self.config.PeakAbsorber.sequencing_timeout_ms, cancelled=cancelled))
+        # moves that would be blocked by beamstops other moves take away or put in their way are ordered after or before those moves
+        schedule = scheduling.schedule_moves(sorted_moves, self.config.PeakAbsorber.beamstop_spacing)
+        if schedule.cycles:
+            self.lg.info("%d move(s) block each other in %d cycle(s), they have to go around each other",
+                         sum(len(cycle) for cycle in schedule.cycles), len(schedule.cycles))
+        sorted_moves = schedule.moves
+
+        self.lg.info("calculating paths")
+        solved_moves, unsolved_moves, was_cancelled = self.calc_expected_collisions(sorted_moves, beamstops, beamstop_roadmap, cancelled, progress, handle_positions)
+        if was_cancelled:
+            return Plan((), tuple(sorted_moves), 0., True)
+
+        planned_moves = []
+        gripper_position = (0, 0)
+        for move in solved_moves:
+            planned_moves.append(move._replace(cost=self.motion_model.move_time(move, gripper_position)))
+            gripper_position = move.path[-1]
+        return Plan(tuple(planned_moves), tuple(unsolved_moves), self.motion_model.moves_time(planned_moves), False)
+
+    def check_spacing(self, handle_positions, obstacles=None):
+        """
+        checks whether all positions passed in here are more than gripper radius apart. Returns indices of handles too close to each other and the distances within the pairs
+
+        Only pairs closer than the spacing are looked at, so this stays fast for thousands of handles.
+        :param handle_positions: positions to check in the format [[x, y], [x, y], ...]
+        :param obstacles: positions like occupied parking spots or active beamstops that the handles are checked against in the same pass.
+         Obstacles aren't checked against each other. In the result obstacle i has the index len(handle_positions) + i
+        :returns: (indices, distances). indices has the shape (2, number of pairs) with the larger index of every pair in the first row
+        """
+        handle_positions = np.asarray(handle_positions, dtype=float).reshape(-1, 2)
+        points = handle_positions
+        if obstacles is not None:
+            points = np.concatenate((handle_positions, np.asarray(obstacles, dtype=float).reshape(-1, 2)))
+        if not len(points):
+            return np.zeros((2, 0), dtype=int), np.zeros(0)
+        close_handles = scipy.spatial.cKDTree(points).query_pairs(self.config.PeakAbsorber.beamstop_spacing, output_type="ndarray")
+        # query_pairs returns every pair once with the smaller index first
+        close_handles = close_handles[close_handles[:, 0] < len(handle_positions)].T[::-1]
+        distances = np.linalg.norm(points[close_handles[0]] - points[close_handles[1]], axis=1)
+        return close_handles, distances
+
+    def get_required_moves(self, handles, beamstops, beamstop_parked):
+        """
+        assigns beamstops to the handles and parking positions to the beamstops that aren't needed
+        :returns: list of PlannedMoves without paths
+        :raises PlanningError: if there aren't enough beamstops or parking positions
+        """
+        beamstops = np.asarray(beamstops, dtype=float).reshape(-1, 2)
+        return self.moves_to_targets(beamstops, self.assign_targets(handles, beamstops, beamstop_parked))
+
+    def assign_targets(self, handles, beamstops, beamstop_parked):
+        """
+        :returns: target position of every beamstop, either a handle or a parking position
+        :raises PlanningError: if there aren't enough beamstops or parking positions
+        """
+        try:
+            return self.assignment.assign(handles, beamstops, beamstop_parked)
+        except ValueError as error:
+            raise errors.PlanningError(str(error))
+
+    def moves_to_targets(self, beamstops, targets):
+        """:returns: list of PlannedMoves without paths for the beamstops that aren't at their targets yet"""
+        moving = np.nonzero(np.linalg.norm(targets - beamstops, axis=1) > self.config.PeakAbsorber.epsilon)[0]
+        return [self._new_move(beamstop_nr, beamstops, targets[beamstop_nr]) for beamstop_nr in moving]
+
+    @staticmethod
+    def _new_move(beamstop_nr, beamstops, target_pos):
+        return PlannedMove(int(beamstop_nr), _read_only(beamstops[beamstop_nr]), _read_only(target_pos), None, None)
+
+    def calc_expected_collisions(self, moves, beamstops, beamstop_roadmap=None, cancelled=None, progress=None, handle_positions=None):
+        """
+        Sorts the moves passed in into one list of unsolvable moves and one list of moves with paths in the order they should be done in
+
+        Simulates the expected constellation of beamstops after every move, then runs collision detection to find the path
+        The moves should come in the order of scheduling.schedule_moves, so most of them are solved in the first pass.
+        Reruns moves for which path finding failed until they either all have a path or none of the moves in the last iteration could find a path.
+        Moves that are still unsolved then are unblocked by moving the beamstops in their way elsewhere first, see resolve_deadlocks
+        :param moves: the PlannedMoves to find a path for
+        :param beamstops: positions of all beamstops before the first move
+        :param beamstop_roadmap: roadmap.Roadmap with beamstops as obstacles. It is copied, not changed. If this is None a new one is built
+        :param cancelled: function without arguments that returns True if the calculation should be cancelled
+        :param progress: function called with (solved move, number of solved moves, number of moves) after every solved move
+        :param handle_positions: positions of the handles. Beamstops on these positions are always moved back after they were moved out of the way
+        :returns: (solved moves: PlannedMoves with paths in order of execution, unsolved moves: moves for which no path could be found, whether the calculation was cancelled)
+        """
+        # the budget for the whole rearrangement. Every path search gets a part of it and stops when it runs out or the planning is cancelled
+        rearrange_budget = budget.SearchBudget(timeout_ms=self.config.PeakAbsorber.planning_timeout_ms, cancelled=cancelled)
+        simulation = snapshot.BeamstopSnapshot(self.config, beamstops, beamstop_roadmap)
+        solved_moves = []
+
+        def report_progress(move):
+            solved_moves.append(move)
+            if progress is not None:
+                # moves that get beamstops out of the way are added to the plan, so there can be more solved moves than moves
+                progress(move, len(solved_moves), max(len(moves), len(solved_moves)))
+
+        unsolved_moves, passes = self._solve_moves(moves, simulation, rearrange_budget, report_progress, self.speculative_planner is not None)
+        if unsolved_moves and not rearrange_budget.exhausted:
+            move_count = len(solved_moves) + len(unsolved_moves)
+            unsolved_moves = self.resolve_deadlocks(unsolved_moves, simulation, rearrange_budget, report_progress, handle_positions)
+            if len(solved_moves) + len(unsolved_moves) > move_count:
+                self.lg.info("%d extra move(s) to get beamstops out of the way", len(solved_moves) + len(unsolved_moves) - move_count)
+        self.lg.debug("path cache: %d hits, %d misses, %d entries", self.path_cache.hits, self.path_cache.misses, len(self.path_cache))
+        self.lg.info("path search used %d node expansions in %.0f ms and %d pass(es)", rearrange_budget.expansions, rearrange_budget.elapsed_ms, passes)
+        if rearrange_budget.cancelled:
+            self.lg.info("path calculation was cancelled")
+            return [], list(moves), True
+        if rearrange_budget.exhausted:
+            self.lg.warning("path calculation stopped early (%s), %d move(s) were not calculated", rearrange_budget.exhausted_reason, len(unsolved_moves))
+        return solved_moves, unsolved_moves, False
+
+    def _solve_moves(self, moves, simulation, rearrange_budget, report_progress, speculate=False):
+        """
+        finds paths for the moves in passes over all unsolved moves, see calc_expected_collisions. Solved moves are applied to the simulation
+        and passed to report_progress
+        :param speculate: whether the paths of each pass are calculated in the planning processes first
+        :returns: (unsolved moves, number of passes)
+        """
+        unsolved_moves = list(moves)
+        progress_made = True
+        passes = 0
+        while unsolved_moves and progress_made and rearrange_budget.spend(0):
+            progress_made = False
+            passes += 1
+            # with planning processes all paths of this pass are calculated at once for the positions at the start of the pass.
+            # A path can only be used if no move before it in this pass changed anything in its corridor, otherwise it is recalculated
+            if speculate:
+                pass_beamstops = simulation.beamstops.copy()
+                speculative_paths = self.speculate_paths(unsolved_moves, pass_beamstops, simulation.obstacle_index)
+            else:
+                speculative_paths = [None] * len(unsolved_moves)
+            changed_positions = np.empty((0, 2))
+            still_unsolved_moves = []
+            for move_nr, (move, speculative_path) in enumerate(zip(unsolved_moves, speculative_paths)):
+                if not rearrange_budget.spend(0):
+                    still_unsolved_moves.extend(unsolved_moves[move_nr:])
+                    break
+                if speculative_path is not None and not corridor_changed(speculative_path.result(), changed_positions, self.config.PeakAbsorber.beamstop_spacing):
+                    path = speculative_path.result()
+                    # the search in the planning process could have run out of budget, so only found paths are cached
+                    if path is not None:
+                        self.path_cache.put(move.beamstop_pos, move.target_pos, np.delete(pass_beamstops, move.beamstop_nr, 0), path)
+                else:
+                    if speculative_path is not None:
+                        self.lg.debug("recalculating path of beamstop %d because an earlier move changed its surroundings", move.beamstop_nr)
+                    path = self._calc_simulated_path(move, simulation, rearrange_budget)
+                if path is None:
+                    still_unsolved_moves.append(move)
+                    continue
+                progress_made = True
+                move = move._replace(path=_read_only(path))
+                changed_positions = np.concatenate([changed_positions, [move.beamstop_pos, move.target_pos]])
+                simulation.move(move.beamstop_nr, move.target_pos)
+                report_progress(move)
+            unsolved_moves = still_unsolved_moves
+            for speculative_path in speculative_paths:
+                if speculative_path is not None:
+                    speculative_path.cancel()
+        return unsolved_moves, passes
+
+    def _calc_simulated_path(self, move, simulation, rearrange_budget):
+        return self._find_path(move, simulation.obstacles_excluding(move.beamstop_nr), simulation.obstacle_index_excluding(move.beamstop_nr), simulation.roadmap,
+                               rearrange_budget.child(self.config.PeakAbsorber.planning_max_expansions_per_move,
+                                                      self.config.PeakAbsorber.planning_timeout_per_move_ms))
+
+    def resolve_deadlocks(self, unsolved_moves, simulation, rearrange_budget, report_progress, handle_positions=None):
+        """
+        solves moves that are blocked by other beamstops, also ones that block each other in a cycle, by moving the blocking beamstops out of the way first
+
+        The blocking beamstops are the ones in the corridor of the move, they are moved away one after the other, the closest first, until the move
+        has a path. A beamstop that still has a move to do starts that move from where it was put. A parked beamstop is parked on a different parking
+        position. Any other beamstop is put on nearby free space and moved back once no other move is left, so the gap it left can be used by all moves
+        that go the same way, e.g. out of an enclosed group, instead of being opened and closed again for every one of them.
+        After every unblocked move all unsolved moves are tried again, so only as many beamstops are moved as needed.
+        :param unsolved_moves: the moves that are left after _solve_moves
+        :param simulation: snapshot.BeamstopSnapshot with the positions after the solved moves. Solved moves are applied to it
+        :param rearrange_budget: budget.SearchBudget for the whole rearrangement
+        :param report_progress: function that is called with every solved move in the order they have to be done in
+        :param handle_positions: positions beamstops have to go back to after they were moved out of the way
+        :returns: the moves that couldn't be solved
+        """
+        handle_positions = np.empty((0, 2)) if handle_positions is None else np.asarray(handle_positions, dtype=float).reshape(-1, 2)
+        # moves of beamstops that were put out of the way back to where they were. They are held back until the other moves are done
+        return_moves = []
+        # every round solves at least one move, the moves back to the original positions can need rounds of their own
+        for _ in range(2 * len(unsolved_moves)):
+            if not unsolved_moves:
+                # nothing needs the gaps anymore, so the held back moves are solved like any other move and can be unblocked too
+                unsolved_moves, _ = self._solve_moves(return_moves, simulation, rearrange_budget, report_progress)
+                return_moves = []
+                if not unsolved_moves:
+                    break
+            for move in unsolved_moves:
+                if not rearrange_budget.spend(0):
+                    return unsolved_moves + return_moves
+                other_moves = [other_move for other_move in unsolved_moves if other_move is not move]
+                # the held back moves count as moves still to do: their targets are kept free and they start from wherever their beamstop is put
+                result = self._unblock_move(move, other_moves + return_moves, simulation, rearrange_budget, handle_positions)
+                if result is None:
+                    continue
+                relocations, path, other_moves, new_return_moves = result
+                self.lg.debug("moving %d beamstop(s) out of the way of beamstop %d", len(relocations), move.beamstop_nr)
+                for relocation in relocations:
+                    report_progress(relocation)
+                simulation.move(move.beamstop_nr, move.target_pos)
+                report_progress(move._replace(path=_read_only(path)))
+                return_moves = other_moves[len(unsolved_moves) - 1:] + new_return_moves
+                unsolved_moves, _ = self._solve_moves(other_moves[:len(unsolved_moves) - 1], simulation, rearrange_budget, report_progress)
+                break
+            else:
+                if not return_moves:
+                    # none of the moves could be unblocked
+                    return unsolved_moves
+                # the held back moves might be in the way, try again after they were moved back
+                unsolved_moves, return_moves = unsolved_moves + return_moves, []
+        return unsolved_moves + return_moves
+
+    def _unblock_move(self, move, other_moves, simulation, rearrange_budget, handle_positions):
+        """
+        moves the beamstops in the corridor of a move away until the move has a path. The moves out of the way are applied to the simulation,
+        the move itself isn't. If the move can't be unblocked the simulation is left as it was
+        :returns: None if the move couldn't be unblocked or (moves out of the way, path of the move, other_moves with updated start positions, moves back)
+        """
+        spacing = self.config.PeakAbsorber.beamstop_spacing
+        line = np.array([move.beamstop_pos, move.target_pos])
+        blockers = np.nonzero(pathfinder.find_collisions_batch(line, simulation.beamstops, spacing, simulation.obstacle_index)[0])[0]
+        blockers = blockers[blockers != move.beamstop_nr]
+        blockers = blockers[np.argsort(np.linalg.norm(simulation.beamstops[blockers] - move.beamstop_pos, axis=1))]
+        relocations = []
+        return_moves = []
+        other_moves = list(other_moves)
+        checkpoint = simulation.checkpoint()
+        for blocker_nr in blockers[:self.config.PeakAbsorber.deadlock_max_relocations]:
+            if not rearrange_budget.spend(0):
+                break
+            blocker_pos = simulation.beamstops[blocker_nr].copy()
+            pending_move_nr = next((other_move_nr for other_move_nr, other_move in enumerate(other_moves) if other_move.beamstop_nr == blocker_nr), None)
+            # positions that must stay free: the corridor of the move and the targets of all moves that are still to do
+            reserved_targets = np.array([move.target_pos] + [other_move.target_pos for other_move in other_moves]).reshape(-1, 2)
+            parked = (np.any(np.linalg.norm(self.config.ParkingPositions.parking_positions - blocker_pos, axis=1) < self.config.PeakAbsorber.epsilon)
+                      and not np.any(np.linalg.norm(handle_positions - blocker_pos, axis=1) < self.config.PeakAbsorber.epsilon))
+            relocation = None
+            if pending_move_nr is None and parked:
+                relocation = self._relocate(blocker_nr, blocker_pos, line, reserved_targets, simulation, rearrange_budget, parking_only=True)
+            needs_return = pending_move_nr is None and relocation is None
+            if relocation is None:
+                relocation = self._relocate(blocker_nr, blocker_pos, line, reserved_targets, simulation, rearrange_budget)
+            if relocation is None:
+                continue
+            relocations.append(relocation)
+            simulation.move(blocker_nr, relocation.target_pos)
+            if pending_move_nr is not None:
+                other_moves[pending_move_nr] = other_moves[pending_move_nr]._replace(beamstop_pos=relocation.target_pos)
+            elif needs_return:
+                return_moves.append(PlannedMove(int(blocker_nr), relocation.target_pos, _read_only(blocker_pos), None, None))
+            path = self._calc_simulated_path(move, simulation, rearrange_budget)
+            if path is not None:
+                return relocations, path, other_moves, return_moves
+        simulation.rollback(checkpoint)
+        return None
+
+    def _relocate(self, beamstop_nr, beamstop_pos, line, reserved_targets, simulation, rearrange_budget, parking_only=False):
+        """
+        finds a free position close to a beamstop outside of a corridor and away from the reserved targets, which the beamstop can be moved to
+        :returns: the PlannedMove with a path to the free position or None if there is none
+        """
+        spacing = self.config.PeakAbsorber.beamstop_spacing
+        candidates = self.config.ParkingPositions.parking_positions
+        if not parking_only:
+            angles = np.linspace(0, 2 * np.pi, 12, endpoint=False)
+            offsets = np.concatenate([radius * np.stack([np.cos(angles), np.sin(angles)], axis=1) for radius in (1.5 * spacing, 2 * spacing, 3 * spacing)])
+            candidates = np.concatenate([candidates, beamstop_pos + offsets])
+        candidates = candidates[np.all((candidates >= 0) & (candidates <= self.config.PeakAbsorber.limits), axis=1)]
+        # the beamstop itself doesn't block its new position
+        others = simulation.obstacles_excluding(beamstop_nr)
+        free = ~np.any(np.linalg.norm(candidates[:, np.newaxis] - others, axis=-1) <= spacing, axis=1)
+        free &= ~np.any(np.linalg.norm(candidates[:, np.newaxis] - reserved_targets, axis=-1) <= spacing, axis=1)
+        free &= ~pathfinder.find_collisions_batch(line, candidates, spacing)[0]
+        candidates = candidates[free]
+        candidates = candidates[np.argsort(np.linalg.norm(candidates - beamstop_pos, axis=1))]
+        for candidate in candidates[:5]:
+            relocation = PlannedMove(int(beamstop_nr), _read_only(beamstop_pos), _read_only(candidate), None, None)
+            path = self._calc_simulated_path(relocation, simulation, rearrange_budget)
+            if path is not None:
+                return relocation._replace(path=_read_only(path))
+        return None
+
+    def calc_path(self, move, beamstops, obstacle_index=None, beamstop_roadmap=None, search_budget=None):
+        """
+        finds the path of a move if there is one. Paths are taken from the path cache if the same move was calculated before with the same beamstops around it
+        :param move: PlannedMove to find the path for
+        :param beamstops: beamstops to not collide with
+        :param obstacle_index: spatialindex.ObstacleGrid over beamstops. If this is None a new one is built
+        :param beamstop_roadmap: roadmap.Roadmap with beamstops as obstacles. If this is given it is searched before the slower fallback algorithm
+        :param search_budget: budget.SearchBudget for this move. If it runs out the best path found so far is used and nothing is put into the cache
+        :returns: the path or None if no path was found
+        """
+        if obstacle_index is None:
+            obstacle_index = spatialindex.ObstacleGrid(beamstops, self.config.PeakAbsorber.beamstop_spacing)
+        # the index of the moved beamstop is removed from the obstacles below, so we need a view of the index that skips it too
+        return self._find_path(move, np.delete(beamstops, move.beamstop_nr, 0), obstacle_index.excluding(move.beamstop_nr), beamstop_roadmap, search_budget)
+
+    def _find_path(self, move, obstacles, obstacle_index, beamstop_roadmap, search_budget):
+        """calc_path with the moved beamstop already left out of obstacles and obstacle_index"""
+        found, path = self.path_cache.get(move.beamstop_pos, move.target_pos, obstacles, self.config.PeakAbsorber.beamstop_spacing, obstacle_index)
+        if found:
+            return path
+        path = find_move_path(move.beamstop_pos, move.target_pos, move.beamstop_nr, obstacles,
+                              self.config.PeakAbsorber.beamstop_spacing, self.config.PeakAbsorber.limits, obstacle_index, beamstop_roadmap,
+                              self.config.PeakAbsorber.pathfinder_polygon_order, self.cost_model, search_budget)
+        if search_budget is None:
+            self.path_cache.put(move.beamstop_pos, move.target_pos, obstacles, path, obstacle_index)
+            return path
+        self.lg.debug("path search for beamstop %d: %d node expansions in %.1f ms%s", move.beamstop_nr, search_budget.expansions, search_budget.elapsed_ms,
+                      " (stopped early: {})".format(search_budget.exhausted_reason) if search_budget.exhausted else "")
+        # a path that was cut short might be found or improved with more budget, so it isn't cached
+        if not search_budget.exhausted:
+            self.path_cache.put(move.beamstop_pos, move.target_pos, obstacles, path, obstacle_index)
+        return path
+
+    def speculate_paths(self, moves, beamstops, obstacle_index):
+        """
+        calculates the paths of all moves at once in the planning processes, all for the same beamstop positions
+        :param moves: moves to calculate paths for
+        :param beamstops: positions of all beamstops
+        :param obstacle_index: spatialindex.ObstacleGrid over beamstops
+        :returns: list with a future for the path of every move. Paths that were found in the path cache are returned as already finished futures
+        """
+        futures = []
+        for move in moves:
+            found, path = self.path_cache.get(move.beamstop_pos, move.target_pos, np.delete(beamstops, move.beamstop_nr, 0),
+                                              self.config.PeakAbsorber.beamstop_spacing, obstacle_index.excluding(move.beamstop_nr))
+            futures.append(None)
+            if found:
+                futures[-1] = concurrent.futures.Future()
+                futures[-1].set_result(path)
+        submitted = iter(self.speculative_planner.submit([move for move, future in zip(moves, futures) if future is None], beamstops))
+        return [future if future is not None else next(submitted) for future in futures]
+
+    def shutdown(self):
+        """stops the planning processes if there are any"""
+        if self.speculative_planner is not None:
+            self.speculative_planner.shutdown()
+
+
+class SpeculativePlanner:
+    """
+    Calculates the paths of many moves in parallel in a pool of processes
+
+    All moves are planned against the same snapshot of the beamstop positions. Committing them in order is up to the caller, who has to
+    recalculate a move if an earlier move changed a beamstop inside its corridor (see corridor_changed).
+    Every process builds its own roadmap once and only updates its obstacles when a new snapshot comes in.
+    """
+    def __init__(self, config, processes, cost_model=None):
+        self.config = config
+        self.processes = processes
+        self.cost_model = cost_model
+        # every move gets a fresh budget inside its process, because budgets can't be shared between processes
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            lg.debug("starting %d planning processes", self.processes)
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.processes,
+                                                                    initializer=_init_worker,
+                                                                    initargs=(self.config.PeakAbsorber.limits,
+                                                                              self.config.ParkingPositions.parking_positions,
+                                                                              self.config.PeakAbsorber.beamstop_spacing,
+                                                                              self.config.PeakAbsorber.roadmap_pitch))
+        return self._executor
+
+    def submit(self, moves, beamstops):
+        """
+        starts the path calculation for all moves
+        :param moves: objects with beamstop_nr, beamstop_pos and target_pos
+        :param beamstops: snapshot of all beamstop positions the paths are calculated for
+        :return: list of futures with the paths (or None) in the order of the moves
+        """
+        executor = self._get_executor()
+        beamstops = np.array(beamstops, dtype=float)
+        return [executor.submit(_find_move_path_in_worker, beamstops, move.beamstop_nr, np.array(move.beamstop_pos), np.array(move.target_pos),
+                                self.config.PeakAbsorber.beamstop_spacing, self.config.PeakAbsorber.limits, self.config.PeakAbsorber.pathfinder_polygon_order,
+                                self.cost_model, self.config.PeakAbsorber.planning_max_expansions_per_move, self.config.PeakAbsorber.planning_timeout_per_move_ms)
+                for move in moves]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+
+# state of a planning process, see SpeculativePlanner
+_worker_roadmap = None
+_worker_beamstops = None
+_worker_obstacle_index = None
+
+
+def _init_worker(limits, parking_positions, spacing, pitch):
+    global _worker_roadmap
+    _worker_roadmap = roadmap.Roadmap(limits, parking_positions, spacing, pitch)
+
+
+def _find_move_path_in_worker(beamstops, beamstop_nr, beamstop_pos, target_pos, spacing, limits, polygon_order, cost_model, max_expansions, timeout_ms):
+    global _worker_beamstops, _worker_obstacle_index
+    if _worker_beamstops is None or not np.array_equal(beamstops, _worker_beamstops):
+        _worker_beamstops = beamstops
+        _worker_roadmap.set_obstacles(beamstops)
+        _worker_obstacle_index = spatialindex.ObstacleGrid(beamstops, spacing)
+    return find_move_path(beamstop_pos, target_pos, beamstop_nr, np.delete(beamstops, beamstop_nr, 0), spacing, limits,
+                          _worker_obstacle_index.excluding(beamstop_nr), _worker_roadmap, polygon_order, cost_model,
+                          budget.SearchBudget(max_expansions, timeout_ms))
@@ -0,0 +1,207 @@
+import heapq
+import math
+
+import numpy as np
+
+import pathfinder
+import spatialindex
+
+
+class Roadmap:
+    """
+    Lane graph over the whole area of the peak absorber which is kept up to date with the beamstop positions
+
+    The graph consists of a square lattice of nodes spaced "pitch" apart, where every node is connected to its eight neighbours, and of the parking positions,
+    which are connected to all lattice nodes close to them. This geometry only depends on the config, so it is built once.
+    For every edge the number of obstacles closer than "spacing" to it is counted. When an obstacle moves only the counts of the edges
+    around its old and new position are changed, so a path query is just a graph search on edges with a count of zero.
+    """
+    def __init__(self, limits, parking_positions, spacing, pitch, obstacles=()):
+        """
+        :param limits: limits of the peak absorber as [max_x, max_y]. Lower limits are always zero
+        :param parking_positions: parking positions, which are added as nodes. Format [[x, y], [x, y], ...]
+        :param spacing: distance the paths have to keep from the obstacles
+        :param pitch: distance between neighbouring nodes of the lattice
+        :param obstacles: positions of the obstacles in the format [[x, y], [x, y], ...]
+        """
+        self.spacing = spacing
+        self.pitch = pitch
+
+        # build the lattice, the outermost nodes are half a pitch away from the limits
+        lattice_x = np.arange(pitch / 2, limits[0], pitch)
+        lattice_y = np.arange(pitch / 2, limits[1], pitch)
+        lattice_indices = np.arange(len(lattice_x) * len(lattice_y)).reshape(len(lattice_x), len(lattice_y))
+        lattice_nodes = np.stack(np.meshgrid(lattice_x, lattice_y, indexing="ij"), axis=-1).reshape(-1, 2)
+        edges = [np.stack([lattice_indices[:-1, :].ravel(), lattice_indices[1:, :].ravel()], axis=1),
+                 np.stack([lattice_indices[:, :-1].ravel(), lattice_indices[:, 1:].ravel()], axis=1),
+                 np.stack([lattice_indices[:-1, :-1].ravel(), lattice_indices[1:, 1:].ravel()], axis=1),
+                 np.stack([lattice_indices[:-1, 1:].ravel(), lattice_indices[1:, :-1].ravel()], axis=1)]
+
+        # connect every parking position to the lattice nodes around it
+        parking_positions = np.asarray(parking_positions, dtype=float).reshape(-1, 2)
+        lattice_grid = spatialindex.ObstacleGrid(lattice_nodes, pitch)
+        for parking_nr, parking_position in enumerate(parking_positions):
+            close_nodes = lattice_grid.query_point(parking_position, 1.5 * pitch)
+            edges.append(np.stack([np.full(len(close_nodes), len(lattice_nodes) + parking_nr), close_nodes], axis=1))
+
+        self.nodes = np.concatenate([lattice_nodes, parking_positions])
+        self.edges = np.concatenate(edges).astype(int)
+        self.edge_lengths = np.linalg.norm(self.nodes[self.edges[:, 1]] - self.nodes[self.edges[:, 0]], axis=1)
+        # for every node a list of (neighbour, edge number) for the graph search
+        self._neighbours = [[] for _ in range(len(self.nodes))]
+        for edge_nr, (node1, node2) in enumerate(self.edges):
+            self._neighbours[node1].append((node2, edge_nr))
+            self._neighbours[node2].append((node1, edge_nr))
+
+        self._node_grid = spatialindex.ObstacleGrid(self.nodes, pitch)
+        self._edge_grid = spatialindex.ObstacleGrid((self.nodes[self.edges[:, 0]] + self.nodes[self.edges[:, 1]]) / 2, pitch)
+        # any edge that comes closer than spacing to an obstacle has its midpoint within this distance of the obstacle
+        self._edge_search_radius = spacing + np.max(self.edge_lengths, initial=0) / 2
+
+        self.set_obstacles(obstacles)
+
+    def copy(self):
+        """returns a roadmap with the same geometry and its own copy of the obstacles, e.g. to simulate moves on it"""
+        roadmap = Roadmap.__new__(Roadmap)
+        roadmap.__dict__.update(self.__dict__)
+        roadmap.block_counts = self.block_counts.copy()
+        roadmap._obstacle_edges = list(self._obstacle_edges)
+        roadmap.obstacle_grid = spatialindex.ObstacleGrid(self.obstacle_grid.points, self.obstacle_grid.cell_size)
+        return roadmap
+
+    @property
+    def obstacles(self):
+        return self.obstacle_grid.points
+
+    def set_obstacles(self, obstacles):
+        """replaces all obstacles. Use move_obstacle if only a single obstacle changes"""
+        obstacles = np.asarray(obstacles, dtype=float).reshape(-1, 2)
+        # number of obstacles blocking each edge
+        self.block_counts = np.zeros(len(self.edges), dtype=int)
+        # for every obstacle the numbers of the edges it blocks
+        self._obstacle_edges = [self._find_blocked_edges(obstacle) for obstacle in obstacles]
+        for blocked_edges in self._obstacle_edges:
+            self.block_counts[blocked_edges] += 1
+        self.obstacle_grid = spatialindex.ObstacleGrid(obstacles, self.spacing)
+
+    def add_obstacles(self, obstacles):
+        """adds obstacles after the existing ones without looking at the existing ones again"""
+        obstacles = np.asarray(obstacles, dtype=float).reshape(-1, 2)
+        for obstacle in obstacles:
+            self._obstacle_edges.append(self._find_blocked_edges(obstacle))
+            self.block_counts[self._obstacle_edges[-1]] += 1
+        self.obstacle_grid.add(obstacles)
+
+    def remove_obstacle(self, index):
+        """removes a single obstacle. The indices of all obstacles after it are shifted down by one"""
+        self.block_counts[self._obstacle_edges.pop(index)] -= 1
+        self.obstacle_grid.remove(index)
+
+    def move_obstacle(self, index, position):
+        """moves a single obstacle and only updates the edges around its old and new position"""
+        self.block_counts[self._obstacle_edges[index]] -= 1
+        self._obstacle_edges[index] = self._find_blocked_edges(position)
+        self.block_counts[self._obstacle_edges[index]] += 1
+        self.obstacle_grid.move(index, position)
+
+    def _find_blocked_edges(self, position):
+        candidates = self._edge_grid.query_point(position, self._edge_search_radius)
+        lines = self.nodes[self.edges[candidates]]
+        return candidates[pathfinder.find_collisions_batch(lines, [position], self.spacing)[:, 0]]
+
+    def find_path(self, start, end, excluded_obstacle=None, budget=None):
+        """
+        Searches the shortest path from start to end along the free edges of the roadmap
+
+        Start and end are connected to all free nodes within two pitches which they can reach in a straight line.
+        :param start: point to start from as [x, y]
+        :param end: point to go to as [x, y]
+        :param excluded_obstacle: index of an obstacle to ignore, usually the beamstop that is moved
+        :param budget: optional budget.SearchBudget. When it runs out the best path found so far is returned
+        :return: list of points [start, ..., end] without any points that are on a straight line between their neighbours or None if there is no path
+        """
+        start = np.asarray(start, dtype=float)
+        end = np.asarray(end, dtype=float)
+        block_counts = self.block_counts
+        obstacles = self.obstacles
+        obstacle_index = self.obstacle_grid
+        if excluded_obstacle is not None:
+            block_counts = block_counts.copy()
+            block_counts[self._obstacle_edges[excluded_obstacle]] -= 1
+            obstacles = np.delete(obstacles, excluded_obstacle, axis=0)
+            obstacle_index = obstacle_index.excluding(excluded_obstacle)
+
+        if not np.any(pathfinder.find_collisions(np.array([start, end]), obstacles, self.spacing, obstacle_index)):
+            return [start, end]
+
+        start_nodes = self._connect(start, obstacles, obstacle_index)
+        end_nodes = dict(zip(*self._connect(end, obstacles, obstacle_index)))
+        if not end_nodes:
+            return None
+
+        # A* search with the straight distance to the end as heuristic. The end itself is marked as node -1
+        path_lengths = {}
+        parents = {}
+        frontier = []
+        for node, length in zip(*start_nodes):
+            if length < path_lengths.get(node, math.inf):
+                path_lengths[node] = length
+                parents[node] = None
+                heapq.heappush(frontier, (length + self._distance(self.nodes[node], end), node))
+        closed = set()
+        while frontier:
+            _, node = heapq.heappop(frontier)
+            if node == -1:
+                break
+            if node in closed:
+                continue
+            if budget is not None and not budget.spend():
+                break
+            closed.add(node)
+            if node in end_nodes and path_lengths[node] + end_nodes[node] < path_lengths.get(-1, math.inf):
+                path_lengths[-1] = path_lengths[node] + end_nodes[node]
+                parents[-1] = node
+                heapq.heappush(frontier, (path_lengths[-1], -1))
+            for neighbour, edge_nr in self._neighbours[node]:
+                if block_counts[edge_nr] or neighbour in closed:
+                    continue
+                new_pathlength = path_lengths[node] + self.edge_lengths[edge_nr]
+                if new_pathlength < path_lengths.get(neighbour, math.inf):
+                    path_lengths[neighbour] = new_pathlength
+                    parents[neighbour] = node
+                    heapq.heappush(frontier, (new_pathlength + self._distance(self.nodes[neighbour], end), neighbour))
+
+        if -1 not in parents:
+            return None
+        path = [end]
+        node = parents[-1]
+        while node is not None:
+            path.append(self.nodes[node])
+            node = parents[node]
+        path.append(start)
+        return remove_collinear_points(path[::-1])
+
+    def _connect(self, point, obstacles, obstacle_index):
+        """returns the nodes that can be reached from point in a straight line and the distances to them"""
+        candidates = self._node_grid.query_point(point, 2 * self.pitch)
+        lines = np.stack([np.broadcast_to(point, (len(candidates), 2)), self.nodes[candidates]], axis=1)
+        free = np.logical_not(np.any(pathfinder.find_collisions_batch(lines, obstacles, self.spacing, obstacle_index), axis=1))
+        return candidates[free], np.linalg.norm(self.nodes[candidates[free]] - point, axis=1)
+
+    @staticmethod
+    def _distance(point1, point2):
+        return math.hypot(point2[0] - point1[0], point2[1] - point1[1])
+
+
+def remove_collinear_points(path):
+    """removes all points from the path [[x, y], [x, y], ...] that lie on the straight line between the points before and after them"""
+    path = [np.asarray(point, dtype=float) for point in path]
+    cleaned = path[:1]
+    for point, next_point in zip(path[1:-1], path[2:]):
+        direction1 = point - cleaned[-1]
+        direction2 = next_point - point
+        if abs(direction1[0] * direction2[1] - direction1[1] * direction2[0]) > 1e-9 or np.dot(direction1, direction2) < 0:
+            cleaned.append(point)
+    if len(path) > 1:
+        cleaned.append(path[-1])
+    return cleaned
@@ -0,0 +1,118 @@
+"""
+Finds an order of the moves in which no move is blocked by a beamstop that another move is about to take away or is about to put in its way.
+
+The corridor of a move is the straight line from its beamstop to its target, as wide as the beamstop spacing. A move has to wait for every move
+whose beamstop is in its corridor before that beamstop is moved away (start state). It has to be done before every move whose target is in its
+corridor, because that move would put a beamstop in its way (target state). These relations form the blocking graph. Without cycles in the graph
+a topological order lets every move take the straight line as far as the other moves are concerned.
+Moves that block each other in a cycle can't all be ordered like this. The cycles are found explicitly and returned, the moves in them are ordered
+as given and have to go around each other.
+"""
+import collections
+import heapq
+import logging
+
+import numpy as np
+import scipy.sparse
+import scipy.sparse.csgraph
+
+import pathfinder
+import spatialindex
+
+
+lg = logging.getLogger("main.scheduling")
+
+# result of schedule_moves
+# moves: the moves in the order they should be done in
+# cycles: lists of the moves that block each other in a cycle, each list in the order of moves
+Schedule = collections.namedtuple("Schedule", ["moves", "cycles"])
+
+
+def schedule_moves(moves, spacing):
+    """
+    orders the moves topologically along the blocking graph. Moves that don't depend on each other keep the order they were passed in,
+    so a good order from sequencing is kept wherever the blocking allows it
+    :param moves: objects with beamstop_pos and target_pos, e.g. planning.PlannedMoves
+    :param spacing: minimum distance between two beamstops
+    :return: Schedule
+    """
+    if len(moves) < 2:
+        return Schedule(list(moves), [])
+    before, after = find_blocking(moves, spacing)
+    components = find_cycles(len(moves), before, after)
+    # the edges inside of cycles can't be kept, all others form a directed acyclic graph
+    acyclic = components[before] != components[after]
+    order = topological_order(len(moves), before[acyclic], after[acyclic])
+    positions = np.empty(len(moves), dtype=int)
+    positions[order] = np.arange(len(moves))
+
+    cycles = []
+    for component in np.unique(components[before[~acyclic]]):
+        members = np.nonzero(components == component)[0]
+        cycles.append([moves[move_nr] for move_nr in members[np.argsort(positions[members])]])
+    if cycles:
+        lg.debug("%d move(s) block each other in %d cycle(s)", sum(len(cycle) for cycle in cycles), len(cycles))
+    return Schedule([moves[move_nr] for move_nr in order], cycles)
+
+
+def find_blocking(moves, spacing):
+    """
+    builds the blocking graph of the moves
+    :return: two arrays (before, after) of move indices where move before[i] has to be done before move after[i]
+    """
+    starts = np.array([move.beamstop_pos for move in moves], dtype=float)
+    targets = np.array([move.target_pos for move in moves], dtype=float)
+    start_index = spatialindex.ObstacleGrid(starts, spacing)
+    target_index = spatialindex.ObstacleGrid(targets, spacing)
+    before = []
+    after = []
+    for move_nr, line in enumerate(np.stack([starts, targets], axis=1)):
+        # beamstops in the corridor that are moved away by other moves: those moves go first
+        candidates = start_index.query_line(line, spacing)
+        blocking = candidates[pathfinder.find_collisions_batch(line, starts[candidates], spacing)[0]]
+        blocking = blocking[blocking != move_nr]
+        before.extend(blocking)
+        after.extend([move_nr] * len(blocking))
+        # targets in the corridor that other moves put beamstops on: those moves go afterwards
+        candidates = target_index.query_line(line, spacing)
+        blocked = candidates[pathfinder.find_collisions_batch(line, targets[candidates], spacing)[0]]
+        blocked = blocked[blocked != move_nr]
+        before.extend([move_nr] * len(blocked))
+        after.extend(blocked)
+    return np.array(before, dtype=int), np.array(after, dtype=int)
+
+
+def find_cycles(move_count, before, after):
+    """
+    finds the strongly connected components of the blocking graph. Moves in the same component with more than one move block each other in a cycle
+    :return: array with the number of the component of every move
+    """
+    graph = scipy.sparse.coo_matrix((np.ones(len(before), dtype=bool), (before, after)), shape=(move_count, move_count))
+    _, components = scipy.sparse.csgraph.connected_components(graph, directed=True, connection="strong")
+    return components
+
+
+def topological_order(move_count, before, after):
+    """
+    orders the moves so every move comes after all its predecessors. Of all moves that are ready the one passed in first is taken first
+    :param before: moves that have to be done before the moves in after. The graph must not have cycles
+    :param after: see before
+    :return: array of move indices
+    """
+    waiting_for = np.bincount(after, minlength=move_count)
+    successors = [[] for _ in range(move_count)]
+    for before_nr, after_nr in zip(before, after):
+        successors[before_nr].append(after_nr)
+    ready = list(np.nonzero(waiting_for == 0)[0])
+    heapq.heapify(ready)
+    order = []
+    while ready:
+        move_nr = heapq.heappop(ready)
+        order.append(move_nr)
+        for successor_nr in successors[move_nr]:
+            waiting_for[successor_nr] -= 1
+            if not waiting_for[successor_nr]:
+                heapq.heappush(ready, successor_nr)
+    if len(order) != move_count:
+        raise ValueError("the blocking graph has a cycle")
+    return np.array(order, dtype=int)
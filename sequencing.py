@@ -0,0 +1,195 @@
+"""
+Orders the moves of a rearrangement so the gripper travels as little as possible between them.
+
+Every move is a pickup at the beamstop position and a drop at the target position. Between two moves the gripper travels empty from the drop of
+one move to the pickup of the next, it starts and ends at home (0, 0). Finding the order with the least empty travel is an asymmetric travelling
+salesman problem, which is solved approximately: a nearest neighbour order is improved with 2-opt and Or-opt steps until no step helps anymore or
+the budget runs out.
+A move whose target is blocked by the start of another move has to wait for that move (precedence). All orders keep these precedences,
+except for cyclic ones which no order can keep.
+"""
+import logging
+
+import numpy as np
+
+import spatialindex
+
+
+lg = logging.getLogger("main.sequencing")
+
+# improvements smaller than this are ignored so rounding errors can't make the search go in circles
+_min_improvement = 1e-9
+
+
+def sequence_moves(moves, spacing, cost_model=None, search_budget=None):
+    """
+    returns the moves in the order with the least empty travel that could be found
+    :param moves: objects with beamstop_pos and target_pos, e.g. planning.PlannedMoves
+    :param spacing: minimum distance between two beamstops. Moves with a target closer than this to the start of another move are done after it
+    :param cost_model: kinematics.MotionModel to minimize the travel time instead of the travel distance
+    :param search_budget: budget.SearchBudget for the improvement steps. Every step spends one expansion. None improves until no step helps anymore
+    :return: list with the moves in the new order
+    """
+    if len(moves) < 2:
+        return list(moves)
+    costs = travel_costs(moves, cost_model)
+    before, after = find_precedences(moves, spacing)
+    order = nearest_neighbour_order(costs, before, after)
+    # precedences broken by the nearest neighbour order are part of a cycle, the improvement only has to keep the others
+    kept = _precedences_kept(order, before, after)
+    before, after = before[kept], after[kept]
+    if len(before) < len(kept):
+        lg.debug("%d cyclic precedence(s) can't be kept", len(kept) - len(before))
+    nearest_neighbour_cost = tour_cost(order, costs)
+    order = improve_order(order, costs, before, after, search_budget)
+    lg.debug("empty travel of %d moves: %.1f with the nearest neighbour order, %.1f after improving", len(moves), nearest_neighbour_cost, tour_cost(order, costs))
+    return [moves[move_nr] for move_nr in order]
+
+
+def travel_costs(moves, cost_model=None):
+    """
+    costs of the empty travel between the moves as a matrix with the moves as index 1 to n and home as index 0
+    :return: array where [i, j] is the cost of going from the target of move i to the beamstop of move j
+    """
+    starts = np.concatenate([[[0, 0]], [move.beamstop_pos for move in moves]]).astype(float)
+    ends = np.concatenate([[[0, 0]], [move.target_pos for move in moves]]).astype(float)
+    if cost_model is None:
+        return np.linalg.norm(starts - ends[:, np.newaxis], axis=-1)
+    return cost_model.segment_times(ends[:, np.newaxis], starts, "travel")
+
+
+def tour_cost(order, costs):
+    """total empty travel of doing the moves in the given order, starting and ending at home"""
+    tour = np.concatenate([[0], np.asarray(order, dtype=int) + 1, [0]])
+    return float(np.sum(costs[tour[:-1], tour[1:]]))
+
+
+def find_precedences(moves, spacing):
+    """
+    finds the moves that have to wait for other moves because their target is blocked by the beamstop of the other move
+    :return: two arrays (before, after) of move indices where move before[i] has to be done before move after[i]
+    """
+    beamstop_index = spatialindex.ObstacleGrid([move.beamstop_pos for move in moves], spacing)
+    before = []
+    after = []
+    for move_nr, move in enumerate(moves):
+        for blocking_nr in beamstop_index.query_point(move.target_pos, spacing):
+            if blocking_nr != move_nr and np.linalg.norm(moves[blocking_nr].beamstop_pos - move.target_pos) < spacing:
+                before.append(blocking_nr)
+                after.append(move_nr)
+    return np.array(before, dtype=int), np.array(after, dtype=int)
+
+
+def nearest_neighbour_order(costs, before, after):
+    """
+    builds an order by always doing the move with the cheapest travel from the end of the last move next.
+    Only moves without unfinished predecessors are chosen. If there are none because the precedences are cyclic the cheapest of all remaining moves is taken
+    :param costs: matrix from travel_costs
+    :param before: moves that have to be done before the moves in after
+    :param after: see before
+    :return: array of move indices
+    """
+    move_count = len(costs) - 1
+    # number of unfinished predecessors of every move and the successors of every move
+    waiting_for = np.bincount(after, minlength=move_count)
+    successors = [[] for _ in range(move_count)]
+    for before_nr, after_nr in zip(before, after):
+        successors[before_nr].append(after_nr)
+    done = np.zeros(move_count, dtype=bool)
+    order = np.empty(move_count, dtype=int)
+    position = 0
+    for step in range(move_count):
+        step_costs = costs[position, 1:]
+        available = ~done & (waiting_for == 0)
+        if not available.any():
+            available = ~done
+        move_nr = int(np.argmin(np.where(available, step_costs, np.inf)))
+        order[step] = move_nr
+        done[move_nr] = True
+        for successor_nr in successors[move_nr]:
+            waiting_for[successor_nr] -= 1
+        position = move_nr + 1
+    return order
+
+
+def improve_order(order, costs, before, after, search_budget=None):
+    """
+    improves an order with 2-opt (reversing a part of the order) and Or-opt (moving one to three consecutive moves elsewhere) steps.
+    The best step for every start position is taken if it reduces the cost and keeps all precedences
+    :param order: array of move indices, which has to keep the precedences
+    :param costs: matrix from travel_costs
+    :param before: moves that have to be done before the moves in after
+    :param after: see before
+    :param search_budget: budget.SearchBudget, every step spends one expansion
+    :return: improved array of move indices
+    """
+    # the tour contains home at both ends and the moves shifted by one, like the cost matrix
+    tour = np.concatenate([[0], np.asarray(order, dtype=int) + 1, [0]])
+    move_count = len(tour) - 2
+    improved = True
+    while improved:
+        improved = False
+        for first in range(1, move_count + 1):
+            if search_budget is not None and not search_budget.spend():
+                return tour[1:-1] - 1
+            for step in (_two_opt_steps, _or_opt_steps):
+                for new_tour in step(tour, costs, first):
+                    if _keeps_precedences(new_tour[1:-1] - 1, before, after):
+                        tour = new_tour
+                        improved = True
+                        break
+    return tour[1:-1] - 1
+
+
+def _two_opt_steps(tour, costs, first):
+    """yields the tours with the part from first to any later position reversed that are cheaper than tour, the cheapest first"""
+    forward = costs[tour[:-1], tour[1:]]
+    backward = costs[tour[1:], tour[:-1]]
+    forward_sums = np.concatenate([[0], np.cumsum(forward)])
+    backward_sums = np.concatenate([[0], np.cumsum(backward)])
+    lasts = np.arange(first + 1, len(tour) - 1)
+    if not len(lasts):
+        return
+    # reversing tour[first:last + 1] replaces the edges into and out of the part and travels the part backwards
+    changes = (costs[tour[first - 1], tour[lasts]] + costs[tour[first], tour[lasts + 1]] + backward_sums[lasts] - backward_sums[first]
+               - forward[first - 1] - forward[lasts] - (forward_sums[lasts] - forward_sums[first]))
+    for index in _improving(changes):
+        last = lasts[index]
+        yield np.concatenate([tour[:first], tour[first:last + 1][::-1], tour[last + 1:]])
+
+
+def _or_opt_steps(tour, costs, first):
+    """yields the tours with one to three moves starting at first moved to a different position that are cheaper than tour, the cheapest first"""
+    forward = costs[tour[:-1], tour[1:]]
+    candidates = []
+    for length in range(1, 4):
+        last = first + length - 1
+        if last > len(tour) - 2:
+            break
+        removal_change = costs[tour[first - 1], tour[last + 1]] - forward[first - 1] - forward[last]
+        # the part is put between tour[position] and tour[position + 1]
+        positions = np.concatenate([np.arange(0, first - 1), np.arange(last + 1, len(tour) - 1)])
+        changes = removal_change + costs[tour[positions], tour[first]] + costs[tour[last], tour[positions + 1]] - forward[positions]
+        improving = changes < -_min_improvement
+        candidates.extend((change, length, position) for change, position in zip(changes[improving], positions[improving]))
+    for change, length, position in sorted(candidates):
+        part = tour[first:first + length]
+        rest = np.concatenate([tour[:first], tour[first + length:]])
+        insert_at = position + 1 if position < first else position + 1 - length
+        yield np.concatenate([rest[:insert_at], part, rest[insert_at:]])
+
+
+def _improving(changes):
+    """indices of the negative changes, the most negative first"""
+    indices = np.nonzero(changes < -_min_improvement)[0]
+    return indices[np.argsort(changes[indices])]
+
+
+def _keeps_precedences(order, before, after):
+    return bool(np.all(_precedences_kept(order, before, after)))
+
+
+def _precedences_kept(order, before, after):
+    positions = np.empty(len(order), dtype=int)
+    positions[order] = np.arange(len(order))
+    return positions[before] < positions[after]
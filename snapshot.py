@@ -0,0 +1,146 @@
+import numpy as np
+
+import roadmap
+import spatialindex
+
+
+class BeamstopSnapshot:
+    """
+    The committed positions of the beamstops plus moves that are only tried out on top of them, e.g. while a plan is calculated
+
+    The committed positions are never changed, they are shared by all branches of a snapshot. Moves only go into a small delta,
+    which is also applied to the obstacle index and the roadmap, so those only update the area around the moved beamstop.
+    The roadmap is shared with the one the snapshot was created or branched from until the first move, only then it is copied.
+    Every move is recorded, so a sequence of hypothetical moves can be undone with rollback instead of copying the whole state before trying it.
+    """
+    def __init__(self, config, beamstops, beamstop_roadmap=None, beamstop_parked=None):
+        """
+        :param config: config with the limits, the parking positions and the spacing
+        :param beamstops: committed positions of all beamstops. They are copied
+        :param beamstop_roadmap: roadmap.Roadmap over the committed positions. It isn't changed, it is copied before the first move. So it must not be changed by anyone else
+         while the snapshot is used, e.g. pass a copy to another thread. If this is None a new one is built when it is needed
+        :param beamstop_parked: index+1 of the parking position of every beamstop or 0, see BeamstopManager. It is copied
+        """
+        self.config = config
+        self.committed = np.array(beamstops, dtype=float).reshape(-1, 2)
+        self.committed.setflags(write=False)
+        self.beamstop_parked = None if beamstop_parked is None else np.array(beamstop_parked)
+        # beamstop_nr: position of every beamstop that was moved away from its committed position
+        self._delta = {}
+        # (beamstop_nr, position before the move) of every move, see rollback
+        self._journal = []
+        self._beamstops = None
+        self._obstacle_index = None
+        self._roadmap = beamstop_roadmap
+        # whether _roadmap belongs to someone else too and has to be copied before it is changed
+        self._roadmap_shared = beamstop_roadmap is not None
+        # positions of all beamstops except _excluded_nr, see obstacles_excluding. It is kept up to date on every move
+        self._excluded = None
+        self._excluded_nr = None
+
+    def branch(self):
+        """returns a snapshot with the same committed positions and moves, which can be moved on independently of this one"""
+        branch = BeamstopSnapshot.__new__(BeamstopSnapshot)
+        branch.config = self.config
+        branch.committed = self.committed
+        branch.beamstop_parked = self.beamstop_parked
+        branch._delta = dict(self._delta)
+        branch._journal = []
+        branch._beamstops = None if self._beamstops is None else self._beamstops.copy()
+        branch._obstacle_index = None
+        branch._roadmap = self._roadmap
+        branch._roadmap_shared = self._roadmap_shared = self._roadmap is not None
+        branch._excluded = None
+        branch._excluded_nr = None
+        return branch
+
+    def __len__(self):
+        return len(self.committed)
+
+    @property
+    def beamstops(self):
+        """positions of all beamstops with the moves applied. Use move to change them"""
+        if self._beamstops is None:
+            self._beamstops = self.committed.copy()
+            for beamstop_nr, position in self._delta.items():
+                self._beamstops[beamstop_nr] = position
+        return self._beamstops
+
+    @property
+    def moved(self):
+        """dict with the current position of every beamstop that isn't at its committed position"""
+        return dict(self._delta)
+
+    def position(self, beamstop_nr):
+        return self._delta.get(beamstop_nr, self.committed[beamstop_nr])
+
+    @property
+    def obstacle_index(self):
+        """spatialindex.ObstacleGrid over beamstops"""
+        if self._obstacle_index is None:
+            self._obstacle_index = spatialindex.ObstacleGrid(self.beamstops, self.config.PeakAbsorber.beamstop_spacing)
+        return self._obstacle_index
+
+    @property
+    def roadmap(self):
+        """roadmap.Roadmap with beamstops as obstacles"""
+        if self._roadmap is None:
+            self._roadmap = roadmap.Roadmap(self.config.PeakAbsorber.limits,
+                                            self.config.ParkingPositions.parking_positions,
+                                            self.config.PeakAbsorber.beamstop_spacing,
+                                            self.config.PeakAbsorber.roadmap_pitch,
+                                            self.beamstops)
+        return self._roadmap
+
+    def obstacles_excluding(self, beamstop_nr):
+        """
+        positions of all beamstops except beamstop_nr, in the order of np.delete.
+        The array is only built once and then updated in place: a move changes one row and excluding another beamstop only shifts the rows between the two.
+        So it changes with the next call or move and has to be copied to be kept
+        """
+        beamstops = self.beamstops
+        if self._excluded is None:
+            self._excluded = np.delete(beamstops, beamstop_nr, 0)
+        elif beamstop_nr > self._excluded_nr:
+            self._excluded[self._excluded_nr:beamstop_nr] = beamstops[self._excluded_nr:beamstop_nr]
+        elif beamstop_nr < self._excluded_nr:
+            self._excluded[beamstop_nr:self._excluded_nr] = beamstops[beamstop_nr + 1:self._excluded_nr + 1]
+        self._excluded_nr = beamstop_nr
+        return self._excluded
+
+    def obstacle_index_excluding(self, beamstop_nr):
+        """view of obstacle_index that matches obstacles_excluding(beamstop_nr)"""
+        return self.obstacle_index.excluding(beamstop_nr)
+
+    def move(self, beamstop_nr, position):
+        """moves a beamstop in this snapshot only. The move can be undone with rollback"""
+        self._journal.append((beamstop_nr, self._delta.get(beamstop_nr)))
+        self._set_position(beamstop_nr, np.array(position, dtype=float))
+
+    def checkpoint(self):
+        """returns a marker for the current state, which rollback can return to"""
+        return len(self._journal)
+
+    def rollback(self, checkpoint=0):
+        """undoes all moves since checkpoint, the most recent first. 0 goes back to where the snapshot was created or branched off"""
+        while len(self._journal) > checkpoint:
+            beamstop_nr, previous_position = self._journal.pop()
+            self._set_position(beamstop_nr, previous_position)
+
+    def _set_position(self, beamstop_nr, position):
+        if position is None:
+            del self._delta[beamstop_nr]
+            position = self.committed[beamstop_nr]
+        else:
+            self._delta[beamstop_nr] = position
+        if self._beamstops is not None:
+            self._beamstops[beamstop_nr] = position
+        if self._obstacle_index is not None:
+            self._obstacle_index.move(beamstop_nr, position)
+        if self._roadmap is not None:
+            if self._roadmap_shared:
+                self._roadmap = self._roadmap.copy()
+                self._roadmap_shared = False
+            self._roadmap.move_obstacle(beamstop_nr, position)
+        if self._excluded is not None and beamstop_nr != self._excluded_nr:
+            self._excluded[beamstop_nr if beamstop_nr < self._excluded_nr else beamstop_nr - 1] = position
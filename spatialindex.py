@@ -0,0 +1,118 @@
+import numpy as np
+
+
+class ObstacleGrid:
+    """
+    Uniform grid over a set of points to quickly find the points close to a line or another point.
+
+    Every point is sorted into a square cell of edge length cell_size. A query only looks at the points in the cells overlapping the bounding box
+    of the queried area, so for a cell size around the beamstop spacing a query only returns the few obstacles that could possibly be in the way.
+    Queries return candidates, which still have to be checked exactly, e.g. with pathfinder.find_collisions.
+    The grid is meant to be built once per beamstop constellation and then kept up to date with move().
+    """
+    def __init__(self, points, cell_size):
+        """
+        :param points: positions of the obstacles in the format [[x, y], [x, y], ...]. The index of a point in this list is the index returned by queries
+        :param cell_size: edge length of one grid cell. Should be about the radius used in the queries
+        """
+        self.cell_size = cell_size
+        self.points = np.array(points, dtype=float).reshape(-1, 2)
+        # maps the cell coordinates (x, y) to a list of indices of the points inside that cell
+        self._cells = {}
+        self._sort_into_cells(0)
+
+    def _sort_into_cells(self, first_index):
+        for index in range(first_index, len(self.points)):
+            self._cells.setdefault(self._cell(self.points[index]), []).append(index)
+
+    def __len__(self):
+        return len(self.points)
+
+    def _cell(self, point):
+        return int(point[0] // self.cell_size), int(point[1] // self.cell_size)
+
+    def add(self, points):
+        """adds points at the end, so they get the indices after the existing points"""
+        first_index = len(self.points)
+        self.points = np.concatenate((self.points, np.asarray(points, dtype=float).reshape(-1, 2)))
+        self._sort_into_cells(first_index)
+
+    def remove(self, index):
+        """
+        removes the point with the given index. The indices of all points after it are shifted down by one, like np.delete would do it.
+        Only the cells of the removed point and of the points after it are touched, so removing one of the last points is cheap
+        """
+        self._cells[self._cell(self.points[index])].remove(index)
+        for shifted_index in range(index + 1, len(self.points)):
+            cell = self._cells[self._cell(self.points[shifted_index])]
+            cell[cell.index(shifted_index)] = shifted_index - 1
+        self.points = np.delete(self.points, index, axis=0)
+
+    def move(self, index, position):
+        """moves the point with the given index to a new position"""
+        self._cells[self._cell(self.points[index])].remove(index)
+        self.points[index] = position
+        self._cells.setdefault(self._cell(self.points[index]), []).append(index)
+
+    def query_box(self, lower, upper):
+        """returns the indices of all points inside the box from lower=[min_x, min_y] to upper=[max_x, max_y]"""
+        lower_cell = self._cell(lower)
+        upper_cell = self._cell(upper)
+        cell_count = (upper_cell[0] - lower_cell[0] + 1) * (upper_cell[1] - lower_cell[1] + 1)
+        # for huge boxes going through all the cells would be slower than just checking every point
+        if cell_count >= len(self.points):
+            candidates = np.arange(len(self.points))
+        else:
+            candidates = [index
+                          for cell_x in range(lower_cell[0], upper_cell[0] + 1)
+                          for cell_y in range(lower_cell[1], upper_cell[1] + 1)
+                          for index in self._cells.get((cell_x, cell_y), ())]
+            candidates = np.array(candidates, dtype=int)
+        if not candidates.size:
+            return candidates
+        points = self.points[candidates]
+        inside = (points[:, 0] >= lower[0]) & (points[:, 0] <= upper[0]) & (points[:, 1] >= lower[1]) & (points[:, 1] <= upper[1])
+        return candidates[inside]
+
+    def query_line(self, line, radius):
+        """returns the indices of all points which might be closer than radius to the line [[startx, starty], [endx, endy]]"""
+        line = np.asarray(line, dtype=float)
+        return self.query_box(line.min(axis=0) - radius, line.max(axis=0) + radius)
+
+    def query_point(self, point, radius):
+        """returns the indices of all points which might be closer than radius to the point [x, y]"""
+        point = np.asarray(point, dtype=float)
+        return self.query_box(point - radius, point + radius)
+
+    def excluding(self, index):
+        """returns a view of this grid where the point "index" is left out and all indices above it are shifted down by one, like np.delete would do it"""
+        return ExcludingGridView(self, index)
+
+
+class ExcludingGridView:
+    """
+    View of an ObstacleGrid without one of its points.
+
+    The planners get the obstacles without the beamstop that is being moved. This view answers queries with indices into that shortened list,
+    so one grid can be shared by every move in a constellation.
+    """
+    def __init__(self, grid, excluded_index):
+        self.grid = grid
+        self.excluded_index = excluded_index
+
+    def __len__(self):
+        return len(self.grid) - 1
+
+    def _shift(self, indices):
+        indices = indices[indices != self.excluded_index]
+        indices[indices > self.excluded_index] -= 1
+        return indices
+
+    def query_box(self, lower, upper):
+        return self._shift(self.grid.query_box(lower, upper))
+
+    def query_line(self, line, radius):
+        return self._shift(self.grid.query_line(line, radius))
+
+    def query_point(self, point, radius):
+        return self._shift(self.grid.query_point(point, radius))
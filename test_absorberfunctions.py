@@ -0,0 +1,139 @@
+import threading
+
+import numpy as np
+import pytest
+
+import absorberfunctions
+import planning
+import testconfig
+
+
+class ItemGroupStub:
+    def __init__(self):
+        self.items = []
+        self.remover = None
+
+    def add_circle(self, position):
+        circle = object()
+        self.items.append(circle)
+        return circle
+
+    def add_polyline(self, points):
+        return object()
+
+    def remove_item(self, item):
+        pass
+
+
+class HandlesStub:
+    def get_handle_positions(self):
+        return np.empty((0, 2))
+
+
+class ImageViewStub:
+    def __init__(self):
+        self.beamstop_circles = ItemGroupStub()
+        self.trajectory_lines = ItemGroupStub()
+        self.handles = HandlesStub()
+
+
+class ThreadBlocker(absorberfunctions.QtCore.QObject):
+    """keeps a QThread busy from its creation until release is set"""
+    blockRequested = absorberfunctions.QtCore.pyqtSignal()
+
+    def __init__(self, thread):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.moveToThread(thread)
+        self.blockRequested.connect(self.block)
+        self.blockRequested.emit()
+        assert self.started.wait(5)
+
+    @absorberfunctions.QtCore.pyqtSlot()
+    def block(self):
+        self.started.set()
+        self.release.wait(5)
+
+
+@pytest.fixture
+def beamstop_manager(app):
+    beamstop_manager = absorberfunctions.BeamstopManager(testconfig, ImageViewStub())
+    beamstop_manager.add_beamstops([[100, 100], [150, 100], [200, 100], [100, 150], [150, 150], testconfig.ParkingPositions.parking_positions[0]])
+    return beamstop_manager
+
+
+@pytest.fixture
+def beamstop_mover(beamstop_manager):
+    beamstop_mover = absorberfunctions.BeamstopMover(testconfig, beamstop_manager.im_view, None, beamstop_manager)
+    yield beamstop_mover
+    beamstop_mover.shutdown()
+
+
+def run_planning(beamstop_mover, handle_positions, plan, while_planning=lambda: None):
+    """
+    runs start_planning with plan in place of Planner.plan, calls while_planning on this thread while plan runs in the planning thread
+    and returns the plan emitted by the worker
+    """
+    started = threading.Event()
+    release = threading.Event()
+    finished = []
+
+    def blocking_plan(*arguments):
+        started.set()
+        assert release.wait(5)
+        return plan(*arguments)
+
+    beamstop_mover.planner.plan = blocking_plan
+    beamstop_mover.planning_worker.planFinished.connect(finished.append)
+    beamstop_mover.start_planning(handle_positions)
+    while_planning()
+    release.set()
+    assert started.wait(5)
+    beamstop_mover.planning_thread.quit()
+    assert beamstop_mover.planning_thread.wait(5000)
+    absorberfunctions.QtCore.QCoreApplication.processEvents()
+    return finished[0]
+
+
+def test_planning_uses_its_own_roadmap(beamstop_manager, beamstop_mover):
+    beamstops = beamstop_manager.beamstops.copy()
+    block_counts = beamstop_manager.roadmap.block_counts.copy()
+    seen = []
+
+    def plan(handle_positions, planned_beamstops, beamstop_parked, beamstop_roadmap, cancelled, progress):
+        seen.append((planned_beamstops.copy(), beamstop_roadmap.obstacles.copy(), beamstop_roadmap.block_counts.copy()))
+        return planning.Plan((), (), 0., False)
+
+    def change_beamstops():
+        beamstop_manager.remove_beamstop(beamstop_manager.beamstop_circles[0])
+        beamstop_manager.move(0, [300, 300])
+
+    run_planning(beamstop_mover, [[100, 100]], plan, change_beamstops)
+    planned_beamstops, obstacles, planned_block_counts = seen[0]
+    assert np.array_equal(planned_beamstops, beamstops)
+    assert np.array_equal(obstacles, beamstops)
+    assert np.array_equal(planned_block_counts, block_counts)
+
+
+def test_cancel_before_the_worker_starts_is_kept(beamstop_manager, beamstop_mover):
+    finished = threading.Event()
+    plans = []
+    executed = []
+    beamstop_mover.move_beamstops = executed.append
+
+    def finish(plan):
+        plans.append(plan)
+        finished.set()
+
+    beamstop_mover.planning_worker.planFinished.connect(finish, absorberfunctions.QtCore.Qt.DirectConnection)
+    # while the planning thread is busy the request waits in its queue, like a request that wasn't picked up yet
+    blocker = ThreadBlocker(beamstop_mover.planning_thread)
+    beamstop_mover.start_planning([[300, 300], [350, 350]])
+    beamstop_mover.cancel_planning()
+    blocker.release.set()
+    assert finished.wait(5)
+
+    assert plans[0].cancelled
+    beamstop_mover.finish_planning(plans[0])
+    assert not executed
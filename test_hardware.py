@@ -0,0 +1,138 @@
+import types
+
+import numpy as np
+import pytest
+
+import hardware
+import mocktango
+import testconfig
+
+motor_x_name = testconfig.PeakAbsorber.tango_server + testconfig.PeakAbsorber.motor_x_path
+motor_y_name = testconfig.PeakAbsorber.tango_server + testconfig.PeakAbsorber.motor_y_path
+gripper_name = testconfig.PeakAbsorber.tango_server + testconfig.PeakAbsorber.gripper_path
+
+
+class BeamstopManagerStub:
+    beamstops = np.zeros((0, 2))
+
+
+@pytest.fixture
+def server():
+    server = mocktango.MockTango()
+    server.add_motor(motor_x_name, 10.)
+    server.add_motor(motor_y_name, 20.)
+    server.add_gripper(gripper_name)
+    return server
+
+
+@pytest.fixture
+def absorber_hardware(server):
+    return hardware.PeakAbsorberHardware(testconfig, server.DeviceProxy, server.Group)
+
+
+def test_status_poll_takes_two_requests(server, absorber_hardware):
+    server.reset_counts()
+    status = absorber_hardware.get_hardware_status()
+    assert status.pos == (10., 20.)
+    assert status.motor_x_state == status.motor_y_state == mocktango.DevState.ON
+    assert server.round_trips == absorber_hardware.status_request_count == 2
+    assert server.calls == {("motors", "read_attributes"): 1, (gripper_name, "read_attributes"): 1}
+
+
+def test_move_to_batches_motor_writes(app, server, absorber_hardware):
+    updater = hardware.MovementUpdater(testconfig, absorber_hardware, BeamstopManagerStub())
+    updater.update()
+    absorber_hardware.updater = updater
+    finished = []
+    updater.moveFinished.connect(lambda: finished.append(True))
+    # the simulated motors arrive right away, so the first poll ends the move
+    absorber_hardware.wait = lambda timeout, signal=None: updater.update()
+
+    server.reset_counts()
+    absorber_hardware.move_to([50., 60.])
+    updater.shutdown()
+
+    assert finished
+    assert server.calls[("motors", "read_attribute")] == 1
+    assert server.calls[("motors", "write_attribute")] == 3
+    # reading the start, writing slewrate, acceleration and position and one status poll
+    assert server.round_trips == 4 + absorber_hardware.status_request_count
+    for name, position in ((motor_x_name, 50.), (motor_y_name, 60.)):
+        attributes = server.device(name).attributes
+        assert attributes["position"] == position
+        assert attributes["slewrate"] > 0 and attributes["acceleration"] > 0
+    assert updater.status.pos == (50., 60.)
+
+
+@pytest.fixture
+def event_server():
+    server = mocktango.MockTango()
+    server.add_motor(motor_x_name, 10., events=True)
+    server.add_motor(motor_y_name, 20., events=True)
+    server.add_gripper(gripper_name, events=True)
+    return server
+
+
+@pytest.fixture
+def event_updater(app, event_server):
+    absorber_hardware = hardware.PeakAbsorberHardware(testconfig, event_server.DeviceProxy, event_server.Group)
+    updater = hardware.EventMovementUpdater(testconfig, absorber_hardware, BeamstopManagerStub())
+    absorber_hardware.updater = updater
+    # the events sent on subscribing give the updater its first status
+    event_server.push_events()
+    yield updater
+    updater.shutdown()
+
+
+def test_events_finish_move_without_polling(event_server, event_updater):
+    absorber_hardware = event_updater.absorber_hardware
+    assert event_updater.events_active
+    finished = []
+    event_updater.moveFinished.connect(lambda: finished.append(True))
+    absorber_hardware.wait = lambda timeout, signal=None: event_server.push_events()
+
+    event_server.reset_counts()
+    event_updater.poll_statistics.reset()
+    absorber_hardware.move_to([50., 60.])
+
+    assert finished
+    assert event_updater.poll_statistics.polls == 0
+    assert event_server.round_trips == 4
+    assert event_updater.status.pos == (50., 60.)
+
+
+def test_polled_states_are_used_when_events_stop(event_server, event_updater):
+    absorber_hardware = event_updater.absorber_hardware
+    finished = []
+    event_updater.moveFinished.connect(lambda: finished.append(True))
+    absorber_hardware.wait = lambda timeout, signal=None: None
+
+    absorber_hardware.move_to([50., 60.])
+    # the events of the move get lost
+    event_server.pending_events.clear()
+    for _ in range(event_updater.polls_until_events_lost):
+        event_updater.update()
+        assert not finished
+    event_updater.update()
+
+    assert finished
+    assert event_updater.motors_ready
+    assert event_updater.status.pos == (50., 60.)
+
+
+def test_shutdown_unsubscribes(event_server, event_updater):
+    assert any(device.subscriptions for device in event_server.devices.values())
+    event_updater.shutdown()
+    assert not event_updater.events_active
+    assert not any(device.subscriptions for device in event_server.devices.values())
+
+
+def test_move_beamstop_goes_to_every_point_of_the_path_once(absorber_hardware):
+    visited = []
+    absorber_hardware.move_to = lambda position, slewrate="beamstop": visited.append((slewrate, list(position)))
+    absorber_hardware.move_to_backlash = lambda position, slewrate="beamstop": visited.append(("backlash", list(position)))
+    absorber_hardware.move_gripper = lambda position: visited.append(("gripper", position))
+    move = types.SimpleNamespace(beamstop_nr=0, beamstop_pos=[10., 20.], target_pos=[50., 60.], path=np.array([[10., 20.], [30., 20.], [50., 60.]]),
+                                 finish_move=lambda: None)
+    absorber_hardware.move_beamstop(move)
+    assert visited == [("travel", [10., 20.]), ("gripper", 1), ("beamstop", [30., 20.]), ("backlash", [50., 60.]), ("gripper", 0)]
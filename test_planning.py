@@ -0,0 +1,443 @@
+import time
+import types
+
+import numpy as np
+import pytest
+import scipy.optimize
+
+import assignment
+import benchmark
+import budget
+import collisiondetection
+import errors
+import pathcache
+import pathfinder
+import planning
+import roadmap
+import scheduling
+import sequencing
+import snapshot
+import spatialindex
+import testconfig
+
+parking_positions = testconfig.ParkingPositions.parking_positions
+
+
+@pytest.fixture
+def planner():
+    return planning.Planner(testconfig)
+
+
+def test_parked_beamstop_assigned_to_handle_at_its_position_doesnt_collide(planner):
+    plan = planner.plan([parking_positions[0], [200, 200]], [parking_positions[0], [200, 200]], [1, 0])
+    assert plan.moves == ()
+    assert plan.unsolved_moves == ()
+
+
+def test_beamstop_leaving_its_parking_spot_frees_it(planner):
+    handle = parking_positions[0] + [testconfig.PeakAbsorber.beamstop_spacing / 2, 0]
+    plan = planner.plan([handle], [parking_positions[0]], [1])
+    assert [move.beamstop_nr for move in plan.moves] == [0]
+    assert np.allclose(plan.moves[0].target_pos, handle)
+
+
+def test_handle_too_close_to_beamstop_staying_parked(planner):
+    handle = parking_positions[1] + [testconfig.PeakAbsorber.beamstop_spacing / 2, 0]
+    with pytest.raises(errors.PlanningError, match="occupied parking spots"):
+        planner.plan([handle], [[200, 200], parking_positions[1]], [0, 2])
+
+
+def test_enclosed_beamstops_leave_through_few_gaps(planner):
+    # a 5x5 block of beamstops whose outer ring stays on handles, so the inner 9 have to leave through gaps in the ring
+    spacing = testconfig.PeakAbsorber.beamstop_spacing
+    steps = 250 + 1.2 * spacing * np.arange(-2, 3)
+    beamstops = np.array([[x, y] for x in steps for y in steps])
+    on_ring = np.any((beamstops == steps[0]) | (beamstops == steps[-1]), axis=1)
+    handles = beamstops[on_ring]
+    plan = planner.plan(handles, beamstops, np.zeros(len(beamstops), dtype=int))
+
+    assert plan.unsolved_moves == ()
+    # a ring beamstop only moves aside and back, and every gap it leaves is used by all the beamstops that can get out through it
+    assert len(plan.moves) <= np.count_nonzero(~on_ring) + 2 * testconfig.PeakAbsorber.deadlock_max_relocations
+    assert np.bincount([move.beamstop_nr for move in plan.moves]).max() <= 2
+    positions = beamstops.copy()
+    for move in plan.moves:
+        assert np.allclose(move.beamstop_pos, positions[move.beamstop_nr])
+        positions[move.beamstop_nr] = move.target_pos
+    assert np.allclose(positions[on_ring], handles)
+
+
+def test_paths_start_at_the_beamstop(planner):
+    beamstops = np.array([[100., 100.], [100., 130.], [130., 100.]])
+    plan = planner.plan([[300, 300], [330, 300], [300, 330]], beamstops, [0, 0, 0])
+    gripper_position = (0, 0)
+    for move in plan.moves:
+        assert np.allclose(move.path[0], move.beamstop_pos)
+        assert np.allclose(move.path[-1], move.target_pos)
+        assert move.cost == pytest.approx(planner.motion_model.segment_time(gripper_position, move.beamstop_pos, "travel")
+                                          + 2 * planner.motion_model.gripper_time + planner.motion_model.path_time(move.path))
+        gripper_position = move.path[-1]
+
+
+@pytest.fixture
+def speculative_planner():
+    speculative_config = types.SimpleNamespace(**{name: getattr(testconfig, name) for name in ("ParkingPositions", "Detector", "Gui")})
+    speculative_config.PeakAbsorber = type("PeakAbsorber", (testconfig.PeakAbsorber, ), {"planning_processes": 2})
+    speculative_planner = planning.Planner(speculative_config)
+    yield speculative_planner
+    speculative_planner.shutdown()
+
+
+def test_speculative_plan_matches_serial_plan(planner, speculative_planner):
+    rng = np.random.default_rng(0)
+    spacing = testconfig.PeakAbsorber.beamstop_spacing
+    beamstops = benchmark.random_layout(40, np.array([250, 250]), spacing, rng, origin=(60, 60))
+    handles = benchmark.random_layout(30, np.array([440, 440]), spacing, rng, origin=(200, 200))
+    beamstop_parked = np.zeros(len(beamstops), dtype=int)
+    serial_plan = planner.plan(handles, beamstops, beamstop_parked)
+    speculative_plan = speculative_planner.plan(handles, beamstops, beamstop_parked)
+
+    assert speculative_plan.unsolved_moves == serial_plan.unsolved_moves == ()
+    assert [move.beamstop_nr for move in speculative_plan.moves] == [move.beamstop_nr for move in serial_plan.moves]
+    positions = beamstops.copy()
+    for serial_move, speculative_move in zip(serial_plan.moves, speculative_plan.moves):
+        assert np.array_equal(serial_move.target_pos, speculative_move.target_pos)
+        lines = np.stack([speculative_move.path[:-1], speculative_move.path[1:]], axis=1)
+        assert not np.any(pathfinder.find_collisions_batch(lines, np.delete(positions, speculative_move.beamstop_nr, 0), spacing))
+        positions[speculative_move.beamstop_nr] = speculative_move.target_pos
+    # a path from the planning processes is only kept if nothing changed around it, so it is the one the serial planning finds or about as good
+    assert speculative_plan.expected_duration == pytest.approx(serial_plan.expected_duration, rel=0.01)
+
+
+def test_speculative_paths_are_recalculated_around_changed_positions(speculative_planner):
+    spacing = testconfig.PeakAbsorber.beamstop_spacing
+    beamstops = np.array([[100., 100.], [150., 200.], [100., 160.], [300., 100.]])
+    moves = [planning.PlannedMove(0, beamstops[0], np.array([200., 200.]), None, None),
+             # goes through the target of the first move
+             planning.PlannedMove(1, beamstops[1], np.array([250., 200.]), None, None),
+             # goes around the start of the first move, which is free once it moved
+             planning.PlannedMove(2, beamstops[2], np.array([100., 40.]), None, None),
+             # far away from the first move
+             planning.PlannedMove(3, beamstops[3], np.array([350., 100.]), None, None)]
+    simulation = snapshot.BeamstopSnapshot(testconfig, beamstops)
+    recalculated = []
+    calc_simulated_path = speculative_planner._calc_simulated_path
+
+    def spy(move, *arguments):
+        recalculated.append(move.beamstop_nr)
+        return calc_simulated_path(move, *arguments)
+
+    speculative_planner._calc_simulated_path = spy
+    solved_moves = []
+    unsolved_moves, _ = speculative_planner._solve_moves(moves, simulation, budget.SearchBudget(), lambda move: solved_moves.append(move), speculate=True)
+
+    assert unsolved_moves == []
+    assert sorted(recalculated) == [1, 2]
+    positions = beamstops.copy()
+    for move in solved_moves:
+        lines = np.stack([move.path[:-1], move.path[1:]], axis=1)
+        assert not np.any(pathfinder.find_collisions_batch(lines, np.delete(positions, move.beamstop_nr, 0), spacing))
+        positions[move.beamstop_nr] = move.target_pos
+
+
+def path_length(path):
+    return float(np.sum(np.linalg.norm(np.diff(np.asarray(path, dtype=float), axis=0), axis=1)))
+
+
+def test_a_star_path_is_valid_and_not_longer_than_greedy_path():
+    rng = np.random.default_rng(0)
+    spacing = testconfig.PeakAbsorber.beamstop_spacing
+    limits = testconfig.PeakAbsorber.limits
+    compared = 0
+    for _ in range(15):
+        positions = benchmark.random_layout(22, np.array([200, 200]), spacing, rng, origin=(50, 50))
+        start, end, obstacles = positions[0], positions[1], positions[2:]
+        path = pathfinder.find_path(start, end, obstacles, spacing, limits)
+        assert path is not None
+        assert np.allclose(path[0], start) and np.allclose(path[-1], end)
+        lines = np.stack([np.asarray(path)[:-1], np.asarray(path)[1:]], axis=1)
+        assert not np.any(pathfinder.find_collisions_batch(lines, obstacles, spacing))
+        # the greedy search the planner tries first, see planning.find_move_path
+        obstacles_with_distances = np.append(obstacles, np.linalg.norm(obstacles - start, axis=1)[:, np.newaxis], 1)
+        try:
+            greedy_path = np.concatenate([[start], collisiondetection.find_path(end, start, obstacles_with_distances, spacing, max_multi=30)])
+        except (collisiondetection.NoSolutionError, ArithmeticError):
+            continue
+        compared += 1
+        assert path_length(path) <= path_length(greedy_path) + 1e-6
+    assert compared >= 10
+
+
+def distance_to_segment(point, start, end):
+    if np.array_equal(start, end):
+        return float(np.linalg.norm(point - start))
+    fraction = min(max(np.dot(point - start, end - start) / np.dot(end - start, end - start), 0), 1)
+    return float(np.linalg.norm(point - (start + fraction * (end - start))))
+
+
+def test_collision_batch_matches_distances_to_every_line():
+    rng = np.random.default_rng(0)
+    spacing = testconfig.PeakAbsorber.beamstop_spacing
+    obstacles = rng.uniform(0, 200, (60, 2))
+    lines = rng.uniform(0, 200, (40, 2, 2))
+    # a line of length zero and one that ends inside an obstacle without leaving it
+    lines[0, 1] = lines[0, 0]
+    lines[1] = obstacles[0] + [[-1, 0], [1, 0]]
+    distances = np.array([[distance_to_segment(obstacle, *line) for obstacle in obstacles] for line in lines])
+    # pairs closer to touching than floating point can decide aren't compared
+    decidable = np.abs(distances - spacing) > 1e-9
+
+    in_the_way = pathfinder.find_collisions_batch(lines, obstacles, spacing)
+    assert np.array_equal(in_the_way[decidable], (distances <= spacing)[decidable])
+    assert in_the_way[1, 0]
+    grid = spatialindex.ObstacleGrid(obstacles, spacing)
+    assert np.array_equal(pathfinder.find_collisions_batch(lines, obstacles, spacing, grid), in_the_way)
+    for line, line_in_the_way in zip(lines, in_the_way):
+        assert np.array_equal(pathfinder.find_collisions(line, obstacles, spacing), line_in_the_way)
+        assert np.array_equal(pathfinder.find_collisions(line, obstacles, spacing, grid), line_in_the_way)
+
+
+def test_roadmap_updates_match_rebuilt_roadmap():
+    rng = np.random.default_rng(0)
+    spacing = testconfig.PeakAbsorber.beamstop_spacing
+    limits = np.array([200, 200])
+    parking = np.array([[10., 10. + 15 * parking_nr] for parking_nr in range(10)])
+    obstacles = benchmark.random_layout(30, limits, spacing, rng)
+
+    def rebuilt(obstacles):
+        return roadmap.Roadmap(limits, parking, spacing, testconfig.PeakAbsorber.roadmap_pitch, obstacles)
+
+    updated = rebuilt(obstacles[:20])
+    updated.add_obstacles(obstacles[20:])
+    updated.remove_obstacle(3)
+    obstacles = np.delete(obstacles, 3, axis=0)
+    copy = updated.copy()
+    for index, position in ((0, [100., 100.]), (10, parking[2]), (len(obstacles) - 1, [5., 195.])):
+        updated.move_obstacle(index, position)
+        obstacles[index] = position
+
+    assert np.array_equal(updated.obstacles, obstacles)
+    assert np.array_equal(updated.block_counts, rebuilt(obstacles).block_counts)
+    lines = updated.nodes[updated.edges]
+    assert np.array_equal(updated.block_counts, np.count_nonzero(pathfinder.find_collisions_batch(lines, obstacles, spacing), axis=1))
+    # moves on the copy don't change the original and the other way round
+    assert np.array_equal(copy.block_counts, rebuilt(copy.obstacles).block_counts)
+    assert not np.array_equal(copy.obstacles, updated.obstacles)
+
+
+def test_path_cache_hits_until_obstacles_around_the_move_change():
+    spacing = testconfig.PeakAbsorber.beamstop_spacing
+    limits = testconfig.PeakAbsorber.limits
+    path_cache = pathcache.PathCache(2, testconfig.PeakAbsorber.epsilon, testconfig.PeakAbsorber.path_cache_corridor)
+    start, target = np.array([100., 100.]), np.array([200., 100.])
+    # a wall across the straight line, so the path goes around it far outside the corridor
+    obstacles = np.array([[150., 60.], [150., 80.], [150., 100.], [150., 120.], [150., 140.], [400., 400.]])
+    path = pathfinder.find_path(start, target, obstacles, spacing, limits)
+    assert path_cache.get(start, target, obstacles, spacing) == (False, None)
+    path_cache.put(start, target, obstacles, path)
+
+    found, cached_path = path_cache.get(start + 0.01, target, obstacles, spacing)
+    assert found and np.allclose(cached_path, path, atol=0.01) and np.array_equal(cached_path[0], start + 0.01)
+    # far away from the move
+    moved_away = obstacles.copy()
+    moved_away[-1] += 50
+    assert path_cache.get(start, target, moved_away, spacing)[0]
+    # in the corridor of the move
+    moved_in_corridor = obstacles.copy()
+    moved_in_corridor[2] += 5
+    assert path_cache.get(start, target, moved_in_corridor, spacing) == (False, None)
+    # outside the corridor but on the cached path
+    on_the_path = np.concatenate([obstacles, [np.mean(path[1:3], axis=0)]])
+    assert not pathfinder.find_collisions([start, target], on_the_path[-1:], testconfig.PeakAbsorber.path_cache_corridor)[0]
+    assert path_cache.get(start, target, on_the_path, spacing) == (False, None)
+    assert (path_cache.hits, path_cache.misses) == (2, 3)
+
+    # a move without a path is only known as long as none of the obstacles change
+    path_cache.put(target, start, obstacles, None)
+    assert path_cache.get(target, start, obstacles, spacing) == (True, None)
+    assert path_cache.get(target, start, moved_away, spacing) == (False, None)
+    # the least recently used entry is dropped
+    path_cache.put(start, [300., 300.], obstacles, [start, [300., 300.]])
+    assert len(path_cache) == 2
+    assert not path_cache.get(start, target, obstacles, spacing)[0]
+
+
+def test_search_budget_runs_out_and_cancels():
+    search_budget = budget.SearchBudget(max_expansions=5)
+    move_budget = search_budget.child(max_expansions=100)
+    assert all(move_budget.spend() for _ in range(5))
+    assert not move_budget.spend()
+    assert move_budget.exhausted_reason == search_budget.exhausted_reason == "5 node expansions"
+    assert (move_budget.expansions, search_budget.expansions) == (6, 6)
+
+    cancel = []
+    search_budget = budget.SearchBudget(cancelled=lambda: bool(cancel))
+    assert search_budget.spend()
+    cancel.append(True)
+    assert not search_budget.spend() and search_budget.cancelled
+    search_budget = budget.SearchBudget()
+    search_budget.cancel()
+    assert not search_budget.spend() and search_budget.cancelled
+
+    search_budget = budget.SearchBudget(timeout_ms=0)
+    time.sleep(0.01)
+    assert not search_budget.spend(0)
+    assert search_budget.exhausted_reason.startswith("timeout")
+
+
+def test_path_search_stops_when_budget_runs_out():
+    rng = np.random.default_rng(0)
+    spacing = testconfig.PeakAbsorber.beamstop_spacing
+    limits = testconfig.PeakAbsorber.limits
+    cut_short = 0
+    for _ in range(10):
+        positions = benchmark.random_layout(22, np.array([200, 200]), spacing, rng, origin=(50, 50))
+        start, end, obstacles = positions[0], positions[1], positions[2:]
+        full_budget = budget.SearchBudget()
+        best_path = pathfinder.find_path(start, end, obstacles, spacing, limits, budget=full_budget)
+        for max_expansions in range(full_budget.expansions):
+            search_budget = budget.SearchBudget(max_expansions=max_expansions)
+            path = pathfinder.find_path(start, end, obstacles, spacing, limits, budget=search_budget)
+            assert search_budget.exhausted and search_budget.expansions == max_expansions + 1
+            cut_short += 1
+            # a search that was cut short returns the best path it already found, if any
+            if path is None:
+                continue
+            assert np.allclose(path[0], start) and np.allclose(path[-1], end)
+            lines = np.stack([np.asarray(path)[:-1], np.asarray(path)[1:]], axis=1)
+            assert not np.any(pathfinder.find_collisions_batch(lines, obstacles, spacing))
+            assert path_length(path) >= path_length(best_path) - 1e-6
+    assert cut_short
+
+    cancelled_budget = budget.SearchBudget(cancelled=lambda: True)
+    assert pathfinder.find_path(start, end, obstacles, spacing, limits, budget=cancelled_budget) is None
+
+
+def test_cancelled_planning_returns_no_moves(planner):
+    plan = planner.plan([[300, 300], [330, 300]], [[100, 100], [130, 100]], [0, 0], cancelled=lambda: True)
+    assert plan.cancelled
+    assert plan.moves == ()
+    assert len(plan.unsolved_moves) == 2
+
+
+def test_sequencing_keeps_precedences_and_reduces_travel():
+    rng = np.random.default_rng(0)
+    spacing = testconfig.PeakAbsorber.beamstop_spacing
+    # the targets are away from the beamstops, except for chains of moves into the spots the moves before them leave
+    beamstops = benchmark.random_layout(40, np.array([250, 450]), spacing, rng, origin=(20, 20))
+    targets = benchmark.random_layout(40, np.array([480, 450]), spacing, rng, origin=(300, 20))
+    for move_nr in range(0, 40, 4):
+        targets[move_nr + 1:move_nr + 4] = beamstops[move_nr:move_nr + 3]
+    moves = [planning.PlannedMove(move_nr, beamstops[move_nr], targets[move_nr], None, None) for move_nr in range(40)]
+    before, after = sequencing.find_precedences(moves, spacing)
+    assert len(before) == 30
+
+    sorted_moves = sequencing.sequence_moves(moves, spacing, search_budget=budget.SearchBudget())
+    order = [move.beamstop_nr for move in sorted_moves]
+    assert sorted(order) == list(range(40))
+    position = {move_nr: step for step, move_nr in enumerate(order)}
+    assert all(position[before_nr] < position[after_nr] for before_nr, after_nr in zip(before, after))
+    costs = sequencing.travel_costs(moves)
+    assert sequencing.tour_cost(order, costs) <= sequencing.tour_cost(sequencing.nearest_neighbour_order(costs, before, after), costs) + 1e-9
+
+
+def test_sequencing_breaks_cyclic_precedences():
+    spacing = testconfig.PeakAbsorber.beamstop_spacing
+    beamstops = np.array([[100., 100.], [200., 100.], [300., 300.]])
+    # the first two moves swap their beamstops, the third one has to wait for the second one
+    targets = np.array([beamstops[1], beamstops[0], beamstops[1] + [0, spacing / 2]])
+    moves = [planning.PlannedMove(move_nr, beamstops[move_nr], targets[move_nr], None, None) for move_nr in range(3)]
+    order = [move.beamstop_nr for move in sequencing.sequence_moves(moves, spacing, search_budget=budget.SearchBudget())]
+    assert sorted(order) == [0, 1, 2]
+    assert order.index(1) < order.index(2)
+
+
+def test_schedule_orders_moves_along_the_blocking_graph():
+    moves = [planning.PlannedMove(0, np.array([100., 100.]), np.array([100., 300.]), None, None),
+             # in the way of the first move until it is gone
+             planning.PlannedMove(1, np.array([100., 200.]), np.array([300., 200.]), None, None),
+             # puts its beamstop in the way of the next move
+             planning.PlannedMove(2, np.array([400., 100.]), np.array([400., 200.]), None, None),
+             planning.PlannedMove(3, np.array([350., 200.]), np.array([450., 200.]), None, None),
+             # independent of all others
+             planning.PlannedMove(4, np.array([50., 450.]), np.array([100., 450.]), None, None)]
+    schedule = scheduling.schedule_moves(moves, testconfig.PeakAbsorber.beamstop_spacing)
+    assert [move.beamstop_nr for move in schedule.moves] == [1, 0, 3, 2, 4]
+    assert schedule.cycles == []
+
+
+def test_schedule_finds_moves_blocking_each_other_in_cycles():
+    spacing = testconfig.PeakAbsorber.beamstop_spacing
+    moves = [planning.PlannedMove(0, np.array([50., 450.]), np.array([100., 450.]), None, None),
+             # two beamstops passing each other on the same line
+             planning.PlannedMove(1, np.array([100., 100.]), np.array([300., 100.]), None, None),
+             planning.PlannedMove(2, np.array([200., 100.]), np.array([20., 100.]), None, None),
+             planning.PlannedMove(3, np.array([400., 50.]), np.array([450., 50.]), None, None),
+             # three beamstops moving around a ring into each other's spots
+             planning.PlannedMove(4, np.array([300., 300.]), np.array([400., 300.]), None, None),
+             planning.PlannedMove(5, np.array([400., 300.]), np.array([350., 400.]), None, None),
+             planning.PlannedMove(6, np.array([350., 400.]), np.array([300., 300.]), None, None)]
+    schedule = scheduling.schedule_moves(moves, spacing)
+    assert [[move.beamstop_nr for move in cycle] for cycle in schedule.cycles] == [[1, 2], [4, 5, 6]]
+    assert sorted(move.beamstop_nr for move in schedule.moves) == list(range(7))
+
+
+def test_beamstops_blocking_each_other_go_around_each_other(planner):
+    beamstops = np.array([[100., 100.], [200., 100.]])
+    moves = [planning.PlannedMove(0, beamstops[0], np.array([300., 100.]), None, None),
+             planning.PlannedMove(1, beamstops[1], np.array([20., 100.]), None, None)]
+    solved_moves, unsolved_moves, cancelled = planner.calc_expected_collisions(moves, beamstops)
+    assert unsolved_moves == [] and not cancelled
+    positions = beamstops.copy()
+    for move in solved_moves:
+        lines = np.stack([move.path[:-1], move.path[1:]], axis=1)
+        assert not np.any(pathfinder.find_collisions_batch(lines, np.delete(positions, move.beamstop_nr, 0), testconfig.PeakAbsorber.beamstop_spacing))
+        positions[move.beamstop_nr] = move.target_pos
+    assert np.allclose(positions, [[300., 100.], [20., 100.]])
+
+
+@pytest.mark.parametrize("neighbours", [testconfig.PeakAbsorber.assignment_neighbours, 2])
+def test_warm_started_assignment_is_optimal(neighbours):
+    rng = np.random.default_rng(0)
+    spacing = testconfig.PeakAbsorber.beamstop_spacing
+    assignment_config = types.SimpleNamespace(ParkingPositions=testconfig.ParkingPositions)
+    assignment_config.PeakAbsorber = type("PeakAbsorber", (testconfig.PeakAbsorber, ), {"assignment_neighbours": neighbours})
+    engine = assignment.AssignmentEngine(assignment_config)
+    solved_counts = []
+    solve = engine.solve
+
+    def spy(beamstops, *arguments):
+        solved_counts.append(len(beamstops))
+        return solve(beamstops, *arguments)
+
+    engine.solve = spy
+    active = benchmark.random_layout(80, np.array([480, 480]), spacing, rng, origin=(60, 20))
+    beamstops = np.concatenate([parking_positions[:10], active])
+    beamstop_parked = np.concatenate([np.arange(1, 11), np.zeros(len(active), dtype=int)])
+    handles = benchmark.random_layout(70, np.array([480, 480]), spacing, rng, origin=(60, 20))
+    for _ in range(5):
+        targets = engine.assign(handles, beamstops, beamstop_parked)
+
+        # the optimum of the full cost matrix. Every parking position costs the same extra, so the cheapest assignment fills all handles
+        column_positions = np.concatenate([handles, parking_positions])
+        costs = np.linalg.norm(beamstops[:, np.newaxis] - column_positions, axis=2)
+        costs[:, :len(handles)] += testconfig.PeakAbsorber.beamstop_inactive_cost * (beamstop_parked > 0)[:, np.newaxis]
+        parking_surcharge = np.where(np.arange(len(column_positions)) < len(handles), 0, len(beamstops) * costs.max() + 1)
+        rows, columns = scipy.optimize.linear_sum_assignment(costs + parking_surcharge)
+        assigned_columns = [int(np.argmin(np.linalg.norm(column_positions - target, axis=1))) for target in targets]
+        assert len(set(assigned_columns)) == len(beamstops)
+        assert set(range(len(handles))) <= set(assigned_columns)
+        assert costs[np.arange(len(beamstops)), assigned_columns].sum() == pytest.approx(costs[rows, columns].sum())
+
+        # some of the moves are done and a few handles are moved, so the next assignment can keep most targets
+        moved = rng.choice(len(beamstops), 10, replace=False)
+        beamstops = beamstops.copy()
+        beamstops[moved] = targets[moved]
+        beamstop_parked = beamstop_parked.copy()
+        for move_nr in moved:
+            distances = np.linalg.norm(parking_positions - targets[move_nr], axis=1)
+            beamstop_parked[move_nr] = np.argmin(distances) + 1 if distances.min() < testconfig.PeakAbsorber.epsilon else 0
+        handles = handles.copy()
+        handles[rng.choice(len(handles), 2, replace=False)] += rng.normal(0, 20, (2, 2))
+    assert solved_counts[0] == len(beamstops)
+    assert min(solved_counts[1:]) < len(beamstops)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+import roadmap
+import snapshot
+import testconfig
+
+
+@pytest.fixture
+def beamstops():
+    return np.array([[50., 50.], [100., 50.], [150., 50.], [50., 100.], [100., 100.], [150., 100.]])
+
+
+@pytest.fixture
+def beamstop_roadmap(beamstops):
+    return roadmap.Roadmap(testconfig.PeakAbsorber.limits, testconfig.ParkingPositions.parking_positions, testconfig.PeakAbsorber.beamstop_spacing,
+                           testconfig.PeakAbsorber.roadmap_pitch, beamstops)
+
+
+def test_roadmap_is_copied_on_first_move_only(beamstops, beamstop_roadmap):
+    block_counts = beamstop_roadmap.block_counts.copy()
+    simulation = snapshot.BeamstopSnapshot(testconfig, beamstops, beamstop_roadmap)
+    branch = simulation.branch()
+    assert simulation.roadmap is beamstop_roadmap
+    assert branch.roadmap is beamstop_roadmap
+
+    branch.move(0, [200, 200])
+    assert branch.roadmap is not beamstop_roadmap
+    assert simulation.roadmap is beamstop_roadmap
+    assert np.array_equal(beamstop_roadmap.block_counts, block_counts)
+
+    simulation.move(1, [250, 250])
+    simulation.rollback()
+    assert np.array_equal(simulation.roadmap.block_counts, block_counts)
+    assert np.array_equal(beamstop_roadmap.block_counts, block_counts)
+
+
+def test_obstacles_excluding_follows_moves_and_rollbacks(beamstops):
+    simulation = snapshot.BeamstopSnapshot(testconfig, beamstops)
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        beamstop_nr = int(rng.integers(len(beamstops)))
+        if rng.random() < 0.3:
+            simulation.move(beamstop_nr, rng.uniform(0, 300, 2))
+        elif rng.random() < 0.1:
+            simulation.rollback(int(rng.integers(simulation.checkpoint() + 1)))
+        else:
+            assert np.array_equal(simulation.obstacles_excluding(beamstop_nr), np.delete(simulation.beamstops, beamstop_nr, 0))
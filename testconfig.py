@@ -1,99 +1,105 @@
 from config import *
 
-PeakAbsorber.motor_x_path = 'p02/motor/elab.03'
-PeakAbsorber.motor_y_path = 'p02/motor/elab.04'
-ParkingPositions.parking_positions = np.array([
-    [10, 15],
-    [10, 30],
-    [10, 45],
-    [10, 60],
-    [10, 75],
-    [10, 90],
-    [10, 105],
-    [10, 120],
-    [10, 135],
-    [10, 150],
-    [10, 165],
-    [10, 180],
-    [10, 195],
-    [10, 210],
-    [10, 225],
-    [10, 240],
-    [10, 255],
-    [10, 270],
-    [10, 285],
-    [10, 300],
-    [10, 315],
-    [10, 330],
-    [10, 345],
-    [10, 360],
-    [10, 375],
-    [10, 390],
-    [10, 405],
-    [10, 420],
-    [10, 435],
-    [10, 450],
-    [10, 465],
-    [15, 480],
-    [30, 480],
-    [45, 480],
-    [60, 480],
-    [75, 480],
-    [90, 480],
-    [105, 480],
-    [120, 480],
-    [135, 480],
-    [150, 480],
-    [165, 480],
-    [180, 480],
-    [195, 480],
-    [210, 480],
-    [225, 480],
-    [240, 480],
-    [255, 480],
-    [270, 480],
-    [285, 480],
-    [300, 480],
-    [315, 480],
-    [330, 480],
-    [345, 480],
-    [360, 480],
-    [375, 480],
-    [390, 480],
-    [405, 480],
-    [420, 480],
-    [435, 480],
-    [450, 480],
-    [465, 480],
-    [480, 480],
-    [485, 15],
-    [485, 30],
-    [485, 45],
-    [485, 60],
-    [485, 75],
-    [485, 90],
-    [485, 105],
-    [485, 120],
-    [485, 135],
-    [485, 150],
-    [485, 165],
-    [485, 180],
-    [485, 195],
-    [485, 210],
-    [485, 225],
-    [485, 240],
-    [485, 255],
-    [485, 270],
-    [485, 285],
-    [485, 300],
-    [485, 315],
-    [485, 330],
-    [485, 345],
-    [485, 360],
-    [485, 375],
-    [485, 390],
-    [485, 405],
-    [485, 420],
-    [485, 435],
-    [485, 450],
-    [485, 465]])
+
+# the classes of config are extended instead of changed, so config itself stays as it is when both are imported
+class PeakAbsorber(PeakAbsorber):
+    motor_x_path = 'p02/motor/elab.03'
+    motor_y_path = 'p02/motor/elab.04'
+
+
+class ParkingPositions(ParkingPositions):
+    parking_positions = np.array([
+        [10, 15],
+        [10, 30],
+        [10, 45],
+        [10, 60],
+        [10, 75],
+        [10, 90],
+        [10, 105],
+        [10, 120],
+        [10, 135],
+        [10, 150],
+        [10, 165],
+        [10, 180],
+        [10, 195],
+        [10, 210],
+        [10, 225],
+        [10, 240],
+        [10, 255],
+        [10, 270],
+        [10, 285],
+        [10, 300],
+        [10, 315],
+        [10, 330],
+        [10, 345],
+        [10, 360],
+        [10, 375],
+        [10, 390],
+        [10, 405],
+        [10, 420],
+        [10, 435],
+        [10, 450],
+        [10, 465],
+        [15, 480],
+        [30, 480],
+        [45, 480],
+        [60, 480],
+        [75, 480],
+        [90, 480],
+        [105, 480],
+        [120, 480],
+        [135, 480],
+        [150, 480],
+        [165, 480],
+        [180, 480],
+        [195, 480],
+        [210, 480],
+        [225, 480],
+        [240, 480],
+        [255, 480],
+        [270, 480],
+        [285, 480],
+        [300, 480],
+        [315, 480],
+        [330, 480],
+        [345, 480],
+        [360, 480],
+        [375, 480],
+        [390, 480],
+        [405, 480],
+        [420, 480],
+        [435, 480],
+        [450, 480],
+        [465, 480],
+        [480, 480],
+        [485, 15],
+        [485, 30],
+        [485, 45],
+        [485, 60],
+        [485, 75],
+        [485, 90],
+        [485, 105],
+        [485, 120],
+        [485, 135],
+        [485, 150],
+        [485, 165],
+        [485, 180],
+        [485, 195],
+        [485, 210],
+        [485, 225],
+        [485, 240],
+        [485, 255],
+        [485, 270],
+        [485, 285],
+        [485, 300],
+        [485, 315],
+        [485, 330],
+        [485, 345],
+        [485, 360],
+        [485, 375],
+        [485, 390],
+        [485, 405],
+        [485, 420],
+        [485, 435],
+        [485, 450],
+        [485, 465]])